@@ -1,13 +1,19 @@
+import asyncio
 import datetime
+import inspect
+import math
 import os
-from fastapi.encoders import jsonable_encoder
+import time
 import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 
+from api.response_cache import ResponseCache
 from config import Config
+import encoders
+import events
 import utils
 
 templates = Jinja2Templates(directory="./templates/api")
@@ -17,6 +23,238 @@ class API:
     def __init__(self, config, data):
         self.config = config
         self.data = data
+        api_config = config['server']['api'] if 'api' in config['server'] else {}
+        nodes_config = api_config['nodes'] if 'nodes' in api_config else {}
+        # no default limit: the frontend still loads the whole node list in one request
+        self.nodes_default_limit = nodes_config.get('default_limit')
+        self.nodes_max_limit = nodes_config.get('max_limit', 5000)
+        cache_config = api_config['cache'] if 'cache' in api_config else {}
+        self.cache = ResponseCache(
+            enabled=cache_config.get('enabled', True),
+            max_entries=cache_config.get('max_entries', 1024),
+            max_bytes=cache_config.get('max_bytes', 64 * 1024 * 1024),
+        )
+
+    @staticmethod
+    def query_range(request: Request, default_limit: int|None = None):
+        """
+        since/until (epoch seconds, also accepted as from/to) and limit query parameters.
+        """
+        since = request.query_params.get("since", request.query_params.get("from"))
+        until = request.query_params.get("until", request.query_params.get("to"))
+        limit = request.query_params.get("limit")
+        try:
+            since = float(since) if since is not None else None
+            until = float(until) if until is not None else None
+            limit = int(limit) if limit is not None else default_limit
+        except ValueError:
+            raise ValueError("since/from and until/to must be epoch seconds, limit an integer")
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        return since, until, limit
+
+    def series_query(self, request: Request) -> dict|None:
+        """
+        Arguments of TelemetrySeries.query() from the resolution (raw, 1m, 1h, 1d or auto),
+        metrics, from and to query parameters, or None when no resolution is asked for.
+        """
+        resolution = request.query_params.get("resolution", "")
+        if resolution == "":
+            return None
+        if resolution not in ["auto"] + self.data.telemetry_series.resolutions:
+            raise ValueError(f"resolution must be one of auto, {', '.join(self.data.telemetry_series.resolutions)}")
+        start, end, _limit = self.query_range(request)
+        metrics = None
+        if request.query_params.get("metrics", "").strip() != "":
+            metrics = [metric.strip() for metric in request.query_params["metrics"].split(",") if metric.strip() != ""]
+        return { 'metrics': metrics, 'start': start, 'end': end, 'resolution': resolution }
+
+    @staticmethod
+    def since_version(request: Request) -> int|None:
+        """
+        The since_version query parameter: the store version a client last fetched, to be sent
+        only what changed after it.
+        """
+        since_version = request.query_params.get("since_version")
+        if since_version is None or since_version == "":
+            return None
+        try:
+            return int(since_version)
+        except ValueError:
+            raise ValueError("since_version must be a store version")
+
+    def nodes_query(self, request: Request):
+        """
+        Arguments of MemoryDataStore.query_nodes() from the /v1/nodes query parameters: days,
+        ids, long_name, short_name, status, bbox (west,south,east,north), near (latitude,longitude)
+        with radius_km, fields, limit and cursor (next_cursor of the previous page).
+        """
+        params = request.query_params
+        try:
+            days = max(1, int(params.get("days", 7)))
+        except ValueError:
+            raise ValueError("days must be an integer")
+
+        ids = None
+        if params.get("ids", "").strip() != "":
+            ids = []
+            for id in params["ids"].strip().split(","):
+                try:
+                    ids.append(utils.convert_node_id_from_int_to_hex(int(id)))
+                except ValueError:
+                    ids.append(id)
+
+        limit = self.nodes_default_limit
+        if "limit" in params:
+            try:
+                limit = int(params["limit"])
+            except ValueError:
+                raise ValueError("limit must be an integer")
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+        if limit is not None and self.nodes_max_limit is not None:
+            limit = min(limit, self.nodes_max_limit)
+
+        cursor = None
+        if params.get("cursor", "") != "":
+            try:
+                last_seen, id = params["cursor"].split(":", 1)
+                cursor = (float(last_seen), id)
+            except ValueError:
+                raise ValueError("invalid cursor")
+            if not math.isfinite(cursor[0]):
+                raise ValueError("invalid cursor")
+
+        bbox = None
+        if params.get("bbox", "").strip() != "":
+            try:
+                west, south, east, north = (float(value) for value in params["bbox"].split(","))
+            except ValueError:
+                raise ValueError("bbox must be west,south,east,north in degrees")
+            if not (-90 <= south <= north <= 90 and math.isfinite(west) and math.isfinite(east)):
+                raise ValueError("bbox must be west,south,east,north in degrees")
+            if east - west >= 360:
+                west, east = -180.0, 180.0
+            else:
+                # map viewports run past the antimeridian (e.g. 170 to 190), west > east is a box across it
+                west, east = (lon if -180 <= lon <= 180 else (lon + 180) % 360 - 180 for lon in (west, east))
+            bbox = (south, west, north, east)
+
+        near = None
+        if params.get("near", "").strip() != "":
+            try:
+                latitude, longitude = (float(value) for value in params["near"].split(","))
+                radius_km = float(params.get("radius_km", ""))
+            except ValueError:
+                raise ValueError("near must be latitude,longitude and radius_km a distance in km")
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius_km < math.inf):
+                raise ValueError("near must be latitude,longitude and radius_km a distance in km")
+            near = (latitude, longitude, radius_km)
+        elif params.get("radius_km", "") != "":
+            raise ValueError("radius_km needs near")
+
+        fields = None
+        if params.get("fields", "").strip() != "":
+            fields = [field.strip() for field in params["fields"].split(",") if field.strip() != ""]
+
+        status = params.get("status", "").strip()
+        return {
+            'days': days,
+            'ids': ids,
+            'longname': params.get("long_name", "").strip() or None,
+            'shortname': params.get("short_name", "").strip() or None,
+            'status': status if status in ("online", "offline") else None,
+            'bbox': bbox,
+            'near': near,
+            'limit': limit,
+            'cursor': cursor,
+            'fields': fields,
+        }
+
+    @staticmethod
+    def json(content, status_code: int = 200) -> Response:
+        return Response(content=encoders.dumps(content), status_code=status_code, media_type="application/json")
+
+    @staticmethod
+    def wants_ndjson(request: Request) -> bool:
+        return request.query_params.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+
+    @staticmethod
+    def ndjson(items: list, headers: dict|None = None, batch_size: int = 500) -> StreamingResponse:
+        """
+        items as newline-delimited JSON, encoded a batch at a time while the response is sent,
+        so a big collection is never held encoded as a whole. Batches are encoded on the event
+        loop between sends, so items has to be a list taken up front, not a live view of the store.
+        """
+        async def lines():
+            for i in range(0, len(items), batch_size):
+                yield b"".join(encoders.dumps(item) + b"\n" for item in items[i:i + batch_size])
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+    @staticmethod
+    def format_cursor(cursor: tuple|None) -> str|None:
+        return f"{cursor[0]!r}:{cursor[1]}" if cursor is not None else None
+
+    def event_stream(self, topics: set[str], since: int|None) -> StreamingResponse:
+        """
+        Server-sent events for the topics. The stream opens with a hello event carrying the id of
+        the last event so far, replays what the client missed since the id it resumed from, and
+        sends a resync event (carrying the current id) whenever the client has to refetch state
+        through the REST endpoints: events it missed are gone, or it fell too far behind.
+        """
+        hub = self.data.events
+        subscriber, missed = hub.subscribe(topics, since)
+
+        def control(event: str) -> bytes:
+            return b"event: %s\ndata: %s\n\n" % (event.encode(), encoders.dumps({ 'id': hub.last_id }))
+
+        async def stream():
+            try:
+                yield control("hello")
+                if missed is None:
+                    yield control("resync")
+                elif len(missed) > 0:
+                    yield b"".join(event.frame() for event in missed)
+                while True:
+                    try:
+                        pending = await asyncio.wait_for(subscriber.next(), timeout=hub.keepalive)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                    if pending is None:
+                        hub.resyncs += 1
+                        yield control("resync")
+                    else:
+                        yield b"".join(event.frame() for event in pending)
+            finally:
+                hub.unsubscribe(subscriber)
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+    async def cached(self, request: Request, version, build) -> Response:
+        """
+        The response to a GET, from the response cache while version (what the endpoint reads
+        from the store) is unchanged, else from build(), which returns the content or a
+        Response (e.g. an error), which is returned uncached. version has to be taken before
+        build() runs, so a change made while an async build() waits is never cached as current.
+        """
+        key = f"{request.url.path}?{request.url.query}"
+        entry = self.cache.get(key, version)
+        if entry is None:
+            content = build()
+            if inspect.isawaitable(content):
+                content = await content
+            if isinstance(content, Response):
+                return content
+            entry = self.cache.encode(key, version, content)
+
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if self.cache.matches(request.headers.get("if-none-match"), entry.etag):
+            self.cache.stats.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
 
     async def serve(self, loop):
         @app.get("/", response_class=HTMLResponse)
@@ -25,74 +263,48 @@ class API:
 
         @app.get("/v1/nodes")
         async def nodes(request: Request) -> JSONResponse:
-            # get nodes that have been updated within last X days
-            days_to_limit = 7
-            if "days" in request.query_params.keys():
-                days_param: str|None = request.query_params.get("days")
-                if days_param is not None:
-                    days_to_limit = int(days_param)
-            if days_to_limit < 1:
-                days_to_limit = 1
-
-            nodes = { k: v for k, v in self.data.nodes.items() if utils.days_since_datetime(v["last_seen"]) <= days_to_limit }
-
-            # filter nodes by query parameters
-            if "ids" in request.query_params.keys():
-                ids: str|None = request.query_params.get("ids")
-                if ids is not None:
-                    ids = ids.strip()
-                    if ids != "":
-                        nodes_to_keep = []
-                        for id in ids.split(","):
-                            try:
-                                node_id = int(id)
-                                node_id = utils.convert_node_id_from_int_to_hex(node_id)
-                            except ValueError:
-                                node_id = id
-                            if id in self.data.nodes:
-                                nodes_to_keep.append(node_id)
-                        nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
-
-            if "long_name" in request.query_params.keys():
-                longname: str|None = request.query_params.get("long_name")
-                if longname is not None:
-                    longname = longname.strip()
-                    if longname != "":
-                        nodes_to_keep = []
-                        for id in nodes:
-                            if longname.lower() in nodes[id]["longname"].lower():
-                                nodes_to_keep.append(id)
-                        nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
-
-            if "short_name" in request.query_params.keys():
-                shortname: str|None = request.query_params.get("short_name")
-                if shortname is not None:
-                    shortname = shortname.strip()
-                    if shortname != "":
-                        nodes_to_keep = []
-                        for id in nodes:
-                            if shortname.lower() in nodes[id]["shortname"].lower():
-                                nodes_to_keep.append(id)
-                        nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
-
-            if "status" in request.query_params.keys():
-                status: str|None = request.query_params.get("status")
-                if status is not None:
-                    status = status.strip()
-                    if status == "online":
-                        nodes_to_keep = []
-                        for id in nodes:
-                            if nodes[id]["active"]:
-                                nodes_to_keep.append(id)
-                        nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
-                    elif status == "offline":
-                        nodes_to_keep = []
-                        for id in nodes:
-                            if nodes[id]["active"]:
-                                nodes_to_keep.append(id)
-                        nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
-
-            return jsonable_encoder({ "nodes": nodes, "count": len(nodes) })
+            try:
+                query = self.nodes_query(request)
+                since_version = self.since_version(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            if since_version is not None:
+                return await self.cached(request, self.data.changes.version, lambda: self.data.node_changes(since_version, fields=query['fields']))
+
+            if self.wants_ndjson(request):
+                nodes, next_cursor = self.data.query_nodes(**query)
+                headers = {"X-Next-Cursor": self.format_cursor(next_cursor)} if next_cursor is not None else None
+                return self.ndjson(list(nodes.values()), headers=headers)
+
+            def build():
+                nodes, next_cursor = self.data.query_nodes(**query)
+                return {
+                    "nodes": nodes,
+                    "count": len(nodes),
+                    "next_cursor": self.format_cursor(next_cursor),
+                }
+
+            # nodes also drop out of the days window as time passes, so entries expire within a minute
+            return await self.cached(request, (self.data.change_counter, int(time.time() // 60)), build)
+
+        @app.get("/v1/events")
+        async def event_stream(request: Request):
+            if self.data.events.loop is None:
+                return JSONResponse(status_code=404, content={"error": "events are not enabled"})
+            topics = set(events.TOPICS)
+            if request.query_params.get("topics", "").strip() != "":
+                topics = { topic.strip() for topic in request.query_params["topics"].split(",") }
+                unknown = topics - set(events.TOPICS)
+                if len(unknown) > 0:
+                    return JSONResponse(status_code=400, content={"error": f"unknown topics: {', '.join(sorted(unknown))}"})
+            # EventSource sends Last-Event-ID when it reconnects by itself
+            since = request.headers.get("last-event-id") or request.query_params.get("since")
+            try:
+                since = int(since) if since is not None and since != "" else None
+            except ValueError:
+                return JSONResponse(status_code=400, content={"error": "since must be an event id"})
+            return self.event_stream(topics, since)
 
         @app.get("/v1/nodes/{id}")
         async def node(request: Request, id: str) -> JSONResponse:
@@ -102,10 +314,9 @@ class API:
             except ValueError:
                 node_id = id
 
-            if node_id in self.data.nodes:
-                return jsonable_encoder({ "node": self.data.nodes[node_id] })
-            else:
+            if node_id not in self.data.nodes:
                 return JSONResponse(status_code=404, content={"error": "node not found"})
+            return await self.cached(request, self.data.node_versions.get(node_id), lambda: { "node": self.data.nodes[node_id] })
 
         @app.get("/v1/nodes/{id}/telemetry")
         async def node_telemetry(request: Request, id: str) -> JSONResponse:
@@ -115,10 +326,48 @@ class API:
             except ValueError:
                 node_id = id
 
-            if node_id in self.data.telemetry_by_node:
-                return jsonable_encoder({ "telemetry": self.data.telemetry_by_node[node_id] })
-            else:
-                return JSONResponse(status_code=404, content={"error": "telemetry not found"})
+            try:
+                since, until, limit = self.query_range(request)
+                series_query = self.series_query(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            if series_query is not None:
+                def build_series():
+                    if node_id not in self.data.telemetry_series.nodes:
+                        return JSONResponse(status_code=404, content={"error": "telemetry not found"})
+                    resolution, metrics = self.data.telemetry_series.query(node_id, **series_query)
+                    return { "resolution": resolution, "from": since, "to": until, "metrics": metrics }
+
+                return await self.cached(request, self.data.telemetry_series.version, build_series)
+
+            async def build():
+                telemetry = await self.data.query_telemetry(node_id=node_id, since=since, until=until, limit=limit)
+                if len(telemetry) == 0 and node_id not in self.data.telemetry_by_node:
+                    return JSONResponse(status_code=404, content={"error": "telemetry not found"})
+                return { "telemetry": telemetry }
+
+            return await self.cached(request, self.data.telemetry.version, build)
+
+        @app.get("/v1/nodes/{id}/positions")
+        async def node_positions(request: Request, id: str) -> JSONResponse:
+            try:
+                node_id = int(id)
+                node_id = utils.convert_node_id_from_int_to_hex(node_id)
+            except ValueError:
+                node_id = id
+
+            if not self.data.postgres.enabled:
+                return JSONResponse(status_code=404, content={"error": "position history requires the postgres integration"})
+            if self.data.postgres.pool is None:
+                return JSONResponse(status_code=503, content={"error": "postgres is not connected"})
+            try:
+                since, until, limit = self.query_range(request, default_limit=1000)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            positions = await self.data.postgres.node_positions(node_id, since=since, until=until, limit=limit)
+            return self.json({ "positions": positions })
 
         @app.get("/v1/nodes/{id}/texts")
         async def node_text(request: Request, id: str) -> JSONResponse:
@@ -128,12 +377,16 @@ class API:
             except ValueError:
                 node_id = id
 
-            texts = []
-            for channel in self.data.chat['channels'].keys():
-                for message in self.data.chat['channels'][channel]['messages']:
-                    if message['from'] == node_id or message['to'] == node_id:
-                        texts.append(message)
-            return jsonable_encoder({ "texts": texts })
+            try:
+                since, until, limit = self.query_range(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            async def build():
+                texts = await self.data.query_chat(node_id=node_id, channel=request.query_params.get("channel"), since=since, until=until, limit=limit)
+                return { "texts": texts }
+
+            return await self.cached(request, self.data.data_versions()['chat'], build)
 
         @app.get("/v1/nodes/{id}/traceroutes")
         async def node_traceroutes(request: Request, id: str) -> JSONResponse:
@@ -143,52 +396,131 @@ class API:
             except ValueError:
                 node_id = id
 
-            traceroutes = []
-            for traceroute in self.data.traceroutes:
-                if traceroute['from'] == node_id or traceroute['to'] == node_id:
-                    traceroutes.append(traceroute)
-            return jsonable_encoder({ "traceroutes": traceroutes })
+            try:
+                since, until, limit = self.query_range(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+
+            async def build():
+                traceroutes = await self.data.query_traceroutes(node_id=node_id, since=since, until=until, limit=limit)
+                return { "traceroutes": traceroutes }
+
+            return await self.cached(request, self.data.traceroutes.version, build)
 
         @app.get("/v1/chat")
         async def chat(request: Request) -> JSONResponse:
-            return jsonable_encoder(self.data.chat)
+            try:
+                since_version = self.since_version(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+            if since_version is not None:
+                return await self.cached(request, self.data.changes.version, lambda: self.data.chat_changes(since_version))
+            if self.wants_ndjson(request):
+                return self.ndjson([
+                    { 'channel': channel_id, 'name': channel['name'], 'message': message }
+                    for channel_id, channel in self.data.chat['channels'].items() for message in channel['messages']
+                ])
+            return await self.cached(request, self.data.data_versions()['chat'], lambda: self.data.chat)
 
         @app.get("/v1/telemetry")
         async def telemetry(request: Request) -> JSONResponse:
-            return jsonable_encoder(self.data.telemetry[:1000])
+            try:
+                since, until, limit = self.query_range(request, default_limit=1000)
+                since_version = self.since_version(request)
+                series_query = self.series_query(request)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+            if since_version is not None:
+                return await self.cached(request, self.data.changes.version, lambda: self.data.telemetry_changes(since_version))
+            if series_query is not None:
+                def build_series():
+                    nodes = {}
+                    for node_id in self.data.telemetry_series.nodes.keys():
+                        resolution, metrics = self.data.telemetry_series.query(node_id, **series_query)
+                        nodes[node_id] = { "resolution": resolution, "metrics": metrics }
+                    return { "from": since, "to": until, "nodes": nodes }
+
+                return await self.cached(request, self.data.telemetry_series.version, build_series)
+            if self.wants_ndjson(request):
+                return self.ndjson(await self.data.query_telemetry(since=since, until=until, limit=limit))
+            return await self.cached(request, self.data.telemetry.version, lambda: self.data.query_telemetry(since=since, until=until, limit=limit))
 
         @app.get("/v1/traceroutes")
         async def traceroutes(request: Request) -> JSONResponse:
-            return jsonable_encoder(self.data.traceroutes[:1000])
+            try:
+                since, until, limit = self.query_range(request, default_limit=1000)
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+            if self.wants_ndjson(request):
+                return self.ndjson(await self.data.query_traceroutes(since=since, until=until, limit=limit))
+            return await self.cached(request, self.data.traceroutes.version, lambda: self.data.query_traceroutes(since=since, until=until, limit=limit))
 
         @app.get("/v1/messages")
         async def messages(request: Request) -> JSONResponse:
-            return jsonable_encoder(self.data.messages[:1000])
+            # newest 1000, returned oldest first
+            if self.wants_ndjson(request):
+                return self.ndjson(list(reversed(self.data.messages[:1000])))
+            return await self.cached(request, self.data.messages.version, lambda: list(reversed(self.data.messages[:1000])))
 
         @app.get("/v1/mqtt_messages")
         async def mqtt_messages(request: Request) -> JSONResponse:
-            return jsonable_encoder(self.data.mqtt_messages[:1000])
+            # newest 1000, returned oldest first
+            if self.wants_ndjson(request):
+                return self.ndjson(list(reversed(self.data.mqtt_messages[:1000])))
+            return await self.cached(request, self.data.mqtt_messages.version, lambda: list(reversed(self.data.mqtt_messages[:1000])))
 
         @app.get("/v1/stats")
         async def stats(request: Request) -> JSONResponse:
-            stats = {
-                'active_nodes': 0,
-                'total_chat': len(self.data.chat['channels']['0']['messages']),
-                'total_nodes': len(self.data.nodes),
-                'total_messages': len(self.data.messages),
-                'total_mqtt_messages': len(self.data.mqtt_messages),
-                'total_telemetry': len(self.data.telemetry),
-                'total_traceroutes': len(self.data.traceroutes),
-            }
-            for _, node in self.data.nodes.items():
-                if 'active' in node and node['active']:
-                    stats['active_nodes'] += 1
-
-            return jsonable_encoder({"stats": stats})
+            def build():
+                stats = {
+                    'active_nodes': len(self.data.node_index.active),
+                    'total_chat': len(self.data.chat['channels']['0']['messages']),
+                    'total_nodes': len(self.data.nodes),
+                    'total_messages': len(self.data.messages),
+                    'total_mqtt_messages': len(self.data.mqtt_messages),
+                    'total_telemetry': len(self.data.telemetry),
+                    'total_traceroutes': len(self.data.traceroutes),
+                }
+                return {"stats": stats}
+
+            return await self.cached(request, self.data.data_versions(), build)
 
         @app.get("/v1/server/config")
         async def server_config(request: Request) -> JSONResponse:
-            return jsonable_encoder({'config': Config.cleanse(self.config)})
+            # the config does not change while running
+            return await self.cached(request, None, lambda: {'config': Config.cleanse(self.config)})
+
+        @app.get("/v1/server/ingest")
+        async def server_ingest(request: Request) -> JSONResponse:
+            return self.json({'ingest': self.data.ingest_stats.to_dict()})
+
+        @app.get("/v1/server/postgres")
+        async def server_postgres(request: Request) -> JSONResponse:
+            if not self.data.postgres.enabled:
+                return JSONResponse(status_code=404, content={"error": "postgres integration is not enabled"})
+            return self.json({'postgres': self.data.postgres.stats.to_dict()})
+
+        @app.get("/v1/server/geocoding")
+        async def server_geocoding(request: Request) -> JSONResponse:
+            if not self.data.geocoder.enabled:
+                return JSONResponse(status_code=404, content={"error": "geocoding integration is not enabled"})
+            return self.json({'geocoding': self.data.geocoder.stats.to_dict()})
+
+        @app.get("/v1/server/events")
+        async def server_events(request: Request) -> JSONResponse:
+            return self.json({'events': self.data.events.stats()})
+
+        @app.get("/v1/server/telemetry")
+        async def server_telemetry(request: Request) -> JSONResponse:
+            return self.json({'telemetry_series': self.data.telemetry_series.stats()})
+
+        @app.get("/v1/server/changes")
+        async def server_changes(request: Request) -> JSONResponse:
+            return self.json({'changes': self.data.changes.stats()})
+
+        @app.get("/v1/server/cache")
+        async def server_cache(request: Request) -> JSONResponse:
+            return self.json({'cache': self.cache.stats.to_dict(self.cache)})
 
 
         allow_origins = os.getenv("ALLOW_ORIGINS", "").split(",")
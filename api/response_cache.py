@@ -0,0 +1,97 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+import encoders
+
+
+class CachedResponse:
+    def __init__(self, version, body: bytes, encode_time: float):
+        self.version = version
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.encode_time = encode_time
+
+
+class ResponseCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evicted = 0
+        self.encode_time = 0.0
+        self.encode_time_saved = 0.0
+
+    def to_dict(self, cache):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / requests, 3) if requests > 0 else None,
+            'not_modified': self.not_modified,
+            'evicted': self.evicted,
+            'entries': len(cache.entries),
+            'bytes': cache.size,
+            'encode_time_s': round(self.encode_time, 3),
+            'encode_time_saved_s': round(self.encode_time_saved, 3),
+        }
+
+
+class ResponseCache:
+    """
+    Encoded JSON response bodies keyed by path and query string.
+
+    An entry is valid while the version it was built for (the store versions the endpoint reads,
+    see MemoryDataStore.data_versions()) is unchanged, so between MQTT packets every poll is
+    answered with the same bytes, or a 304 when the client sends the entry's ETag back.
+    Least recently used entries are dropped beyond max_entries or max_bytes.
+    """
+    def __init__(self, enabled: bool = True, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+        self.stats = ResponseCacheStats()
+
+    def get(self, key: str, version) -> CachedResponse|None:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        self.entries.move_to_end(key)
+        self.stats.hits += 1
+        self.stats.encode_time_saved += entry.encode_time
+        return entry
+
+    def encode(self, key: str, version, content) -> CachedResponse:
+        """
+        Encode content and, when enabled, keep the result.
+        """
+        start = time.perf_counter()
+        body = encoders.dumps(content)
+        entry = CachedResponse(version, body, time.perf_counter() - start)
+        self.stats.misses += 1
+        self.stats.encode_time += entry.encode_time
+        if not self.enabled:
+            return entry
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+            self.stats.evicted += 1
+        return entry
+
+    @staticmethod
+    def matches(if_none_match: str|None, etag: str) -> bool:
+        if if_none_match is None:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == etag:
+                return True
+        return False
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#
+# The API response cache under the load the SPA generates: browser tabs that each poll
+# /v1/nodes, /v1/stats, /v1/chat and /v1/telemetry every --interval seconds and send back the
+# ETag they got, while node updates arrive at --updates-per-second like MQTT traffic. Runs the
+# same load with the cache disabled and enabled and reports latency, 304s, the hit ratio and the
+# encoding time saved (as /v1/server/cache reports them).
+#
+# Run from the repository root:
+#   python -m benchmarks.api_cache --nodes 10000 --tabs 20 --interval 3 --updates-per-second 2 --duration 30
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import sys
+import time
+
+import aiohttp
+
+from api import api
+from api.response_cache import ResponseCache
+from benchmarks.nodes_api import make_store, percentile
+
+ENDPOINTS = ['/v1/nodes', '/v1/stats', '/v1/chat', '/v1/telemetry']
+
+async def tab(session, interval, deadline, results):
+  etags = {}
+  await asyncio.sleep(random.uniform(0, interval))
+  while time.monotonic() < deadline:
+    started = time.monotonic()
+    for path in ENDPOINTS:
+      headers = { 'If-None-Match': etags[path] } if path in etags else {}
+      start = time.monotonic()
+      try:
+        async with session.get(f"http://127.0.0.1:9000{path}", headers=headers) as response:
+          await response.read()
+          if 'ETag' in response.headers:
+            etags[path] = response.headers['ETag']
+          results[path].append((time.monotonic() - start, response.status))
+      except aiohttp.ClientError:
+        results[path].append((time.monotonic() - start, None))
+    await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+
+async def updates(data, ids, rate, deadline):
+  while time.monotonic() < deadline:
+    id = random.choice(ids)
+    node = data.nodes[id]
+    node['telemetry'] = { 'battery_level': random.randint(1, 100) }
+    data.update_node(id, node)
+    await asyncio.sleep(1 / rate)
+
+async def run_pass(data, ids, args):
+  results = { path: [] for path in ENDPOINTS }
+  deadline = time.monotonic() + args.duration
+  async with aiohttp.ClientSession() as session:
+    await asyncio.gather(updates(data, ids, args.updates_per_second, deadline), *(tab(session, args.interval, deadline, results) for _ in range(args.tabs)))
+  return results
+
+async def bench(args, report):
+  config, data = make_store(args.nodes)
+  ids = list(data.nodes.keys())
+  api_server = api.API(config, data)
+  server = asyncio.create_task(api_server.serve(asyncio.get_running_loop()))
+  async with aiohttp.ClientSession() as session:
+    for _ in range(50):
+      with contextlib.suppress(aiohttp.ClientError):
+        async with session.get("http://127.0.0.1:9000/v1/server/cache") as response:
+          if response.status == 200:
+            break
+      await asyncio.sleep(0.1)
+
+  print(f"{args.nodes} nodes, {args.tabs} tabs polling {len(ENDPOINTS)} endpoints every {args.interval} s, {args.updates_per_second} node updates/s, {args.duration} s per pass", file=report)
+  print(f"{'cache':<9} {'endpoint':<15} {'requests':>9} {'304s':>6} {'errors':>7} {'p50_ms':>9} {'p99_ms':>9}", file=report)
+  for enabled in (False, True):
+    api_server.cache = ResponseCache(enabled=enabled)
+    results = await run_pass(data, ids, args)
+    for path, samples in results.items():
+      latencies = [latency for latency, status in samples if status is not None]
+      not_modified = sum(1 for _, status in samples if status == 304)
+      errors = sum(1 for _, status in samples if status is None)
+      print(f"{'on' if enabled else 'off':<9} {path:<15} {len(samples):>9} {not_modified:>6} {errors:>7} {percentile(latencies, 0.5) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f}", file=report)
+    stats = api_server.cache.stats.to_dict(api_server.cache)
+    print(f"{'on' if enabled else 'off':<9} hit ratio {stats['hit_ratio']}, encoded {stats['misses']} times in {stats['encode_time_s']} s, saved {stats['encode_time_saved_s']} s", file=report)
+
+  server.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await server
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the API response cache under SPA polling")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--tabs", type=int, default=20)
+  parser.add_argument("--interval", type=float, default=3)
+  parser.add_argument("--updates-per-second", type=float, default=2)
+  parser.add_argument("--duration", type=float, default=30)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  logging.getLogger("uvicorn.access").disabled = True
+  logging.getLogger("uvicorn.error").disabled = True
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(bench(args, report))
+
+if __name__ == "__main__":
+  main()
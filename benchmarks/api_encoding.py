@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+# Encoding the full node list (/v1/nodes?days=30): jsonable_encoder + json.dumps as the API
+# used to, orjson straight to bytes (encoders.dumps), and NDJSON streamed in batches
+# (?format=ndjson). Reports p50/p99 latency and the peak memory the encoding allocates
+# (tracemalloc, measured in a separate run so it does not slow the timings), in-process and
+# over HTTP with the response cache disabled so every request encodes.
+#
+# Run from the repository root:
+#   python -m benchmarks.api_encoding --nodes 10000 --requests 50
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import aiohttp
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api import api
+from api.response_cache import ResponseCache
+from benchmarks.nodes_api import make_store, percentile
+import encoders
+
+def legacy(content):
+  return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def ndjson(content):
+  # what API.ndjson() sends, batch by batch; only one batch is alive at a time
+  items = list(content['nodes'].values())
+  size = 0
+  for i in range(0, len(items), 500):
+    size += len(b"".join(encoders.dumps(item) + b"\n" for item in items[i:i + 500]))
+  return size
+
+ENCODERS = {
+  'jsonable+json': legacy,
+  'orjson': encoders.dumps,
+  'ndjson stream': ndjson,
+}
+
+def in_process(data, args, report):
+  nodes, _cursor = data.query_nodes(days=30)
+  content = { "nodes": nodes, "count": len(nodes), "next_cursor": None }
+  print(f"in-process, {len(nodes)} nodes", file=report)
+  print(f"{'encoder':<16} {'p50_ms':>9} {'p99_ms':>9} {'peak_mb':>9} {'bytes':>10}", file=report)
+  for name, encode in ENCODERS.items():
+    times = []
+    for _ in range(args.requests):
+      start = time.perf_counter()
+      result = encode(content)
+      times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    encode(content)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = result if isinstance(result, int) else len(result)
+    print(f"{name:<16} {percentile(times, 0.5) * 1000:>9.1f} {percentile(times, 0.99) * 1000:>9.1f} {peak / 1024 / 1024:>9.1f} {size:>10}", file=report)
+
+async def over_http(config, data, args, report):
+  @api.app.get("/bench/legacy/nodes")
+  async def legacy_nodes(request: Request):
+    nodes, _cursor = data.query_nodes(days=30)
+    return JSONResponse(jsonable_encoder({ "nodes": nodes, "count": len(nodes), "next_cursor": None }))
+
+  api_server = api.API(config, data)
+  api_server.cache = ResponseCache(enabled=False)
+  server = asyncio.create_task(api_server.serve(asyncio.get_running_loop()))
+  async with aiohttp.ClientSession() as session:
+    for _ in range(50):
+      with contextlib.suppress(aiohttp.ClientError):
+        async with session.get("http://127.0.0.1:9000/v1/server/cache") as response:
+          if response.status == 200:
+            break
+      await asyncio.sleep(0.1)
+
+    print(f"over HTTP, {args.requests} requests per handler, {args.concurrency} at a time", file=report)
+    print(f"{'handler':<16} {'p50_ms':>9} {'p99_ms':>9} {'req/s':>9} {'bytes':>10}", file=report)
+    for name, path in (('jsonable+json', '/bench/legacy/nodes?days=30'), ('orjson', '/v1/nodes?days=30'), ('ndjson stream', '/v1/nodes?days=30&format=ndjson')):
+      times = []
+      sizes = []
+
+      async def client(count):
+        for _ in range(count):
+          start = time.perf_counter()
+          async with session.get(f"http://127.0.0.1:9000{path}") as response:
+            sizes.append(len(await response.read()))
+          times.append(time.perf_counter() - start)
+
+      start = time.perf_counter()
+      await asyncio.gather(*(client(args.requests // args.concurrency) for _ in range(args.concurrency)))
+      elapsed = time.perf_counter() - start
+      print(f"{name:<16} {percentile(times, 0.5) * 1000:>9.1f} {percentile(times, 0.99) * 1000:>9.1f} {len(times) / elapsed:>9.1f} {sizes[0]:>10}", file=report)
+
+  server.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await server
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark encoding the full node list")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--requests", type=int, default=50)
+  parser.add_argument("--concurrency", type=int, default=5)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  logging.getLogger("uvicorn.access").disabled = True
+  logging.getLogger("uvicorn.error").disabled = True
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    config, data = make_store(args.nodes)
+    in_process(data, args, report)
+    asyncio.run(over_http(config, data, args, report))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# What a mirror polling once a minute transfers: the full /v1/nodes?days=30 and /v1/telemetry
+# responses against ?since_version= deltas of the same minute, after --changes-per-minute node
+# updates (each with a telemetry packet, like MQTT traffic). Served on port 9000 with a synthetic
+# node table; reports bytes and latency per poll, and checks that applying the node deltas to a
+# copy fetched at the start gives the same nodes as a full fetch at the end.
+#
+# Run from the repository root:
+#   python -m benchmarks.deltas --nodes 10000 --changes-per-minute 100 --minutes 5
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import sys
+import time
+
+import aiohttp
+
+from api import api
+from benchmarks.nodes_api import make_store, percentile
+
+def traffic(data, ids, count):
+  for _ in range(count):
+    id = random.choice(ids)
+    node = data.nodes[id]
+    node['telemetry'] = { 'battery_level': random.randint(1, 100) }
+    data.update_node(id, node)
+    data.add_telemetry(id, { 'from': id, 'type': 'telemetry', 'timestamp': int(time.time()), 'payload': { 'battery_level': node['telemetry']['battery_level'] } })
+
+async def fetch(session, path, results):
+  start = time.perf_counter()
+  async with session.get(f"http://127.0.0.1:9000{path}") as response:
+    body = await response.read()
+    results.append((time.perf_counter() - start, len(body)))
+    return await response.json(content_type=None)
+
+async def bench(args, report):
+  config, data = make_store(args.nodes)
+  ids = list(data.nodes.keys())
+  server = asyncio.create_task(api.API(config, data).serve(asyncio.get_running_loop()))
+  results = { name: [] for name in ('nodes full', 'nodes delta', 'telemetry full', 'telemetry delta') }
+  async with aiohttp.ClientSession() as session:
+    for _ in range(50):
+      with contextlib.suppress(aiohttp.ClientError):
+        async with session.get("http://127.0.0.1:9000/v1/server/changes") as response:
+          if response.status == 200:
+            break
+      await asyncio.sleep(0.1)
+
+    mirror = await fetch(session, "/v1/nodes?since_version=0", [])
+    nodes = mirror['nodes']
+    version = mirror['version']
+    telemetry_version = version
+    for _ in range(args.minutes):
+      traffic(data, ids, args.changes_per_minute)
+      full = await fetch(session, "/v1/nodes?days=30", results['nodes full'])
+      delta = await fetch(session, f"/v1/nodes?since_version={version}", results['nodes delta'])
+      await fetch(session, "/v1/telemetry", results['telemetry full'])
+      telemetry = await fetch(session, f"/v1/telemetry?since_version={telemetry_version}", results['telemetry delta'])
+      if delta['full']:
+        nodes = {}
+      nodes.update(delta['nodes'])
+      for id in delta['removed']:
+        nodes.pop(id, None)
+      version = delta['version']
+      telemetry_version = telemetry['version']
+
+  print(f"{args.nodes} nodes, {args.changes_per_minute} node updates + telemetry per minute, {args.minutes} polls", file=report)
+  print(f"{'request':<16} {'p50_ms':>9} {'p99_ms':>9} {'bytes/poll':>12}", file=report)
+  for name, samples in results.items():
+    latencies = [latency for latency, _size in samples]
+    size = sum(size for _latency, size in samples) // len(samples)
+    print(f"{name:<16} {percentile(latencies, 0.5) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f} {size:>12}", file=report)
+  print(f"mirror built from deltas matches a full fetch: {nodes == full['nodes']}", file=report)
+
+  server.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await server
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark ?since_version= deltas against full fetches")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--changes-per-minute", type=int, default=100)
+  parser.add_argument("--minutes", type=int, default=5)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  logging.getLogger("uvicorn.access").disabled = True
+  logging.getLogger("uvicorn.error").disabled = True
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(bench(args, report))
+
+if __name__ == "__main__":
+  main()
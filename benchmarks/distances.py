@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# The distances a render pass needs (server node to every node, and every mesh edge for the
+# heard / heard by rows) at --nodes nodes with --neighbors each: the scalar path the renderer
+# used, one memoized haversine per pair through utils.calculate_distance_between_nodes, against
+# NodePositions (StaticHTMLRenderer.prepare_distances) on a cold pass, a pass where nothing
+# moved and a pass after one node moved, which only recomputes its edges. Also times the
+# haversine alone over every edge, checks both paths give the same distances and that the one
+# node moved pass gives the same rows as a full rebuild.
+#
+# Run from the repository root:
+#   python -m benchmarks.distances --nodes 10000 --neighbors 10
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+from benchmarks.nodes_api import percentile
+from benchmarks.render_nodes import make_store
+import geo
+from static_html_renderer import RenderState, StaticHTMLRenderer
+import utils
+
+def scalar_pass(data, host):
+  # the renderer before NodePositions: distance() memoized per pass, neighbor_tables() per edge
+  distances = {}
+  def distance(id1, id2):
+    key = (id1, id2) if id1 < id2 else (id2, id1)
+    if key not in distances:
+      distances[key] = utils.calculate_distance_between_nodes(data.nodes.get(id1), data.nodes.get(id2))
+    return distances[key]
+
+  host_distances = { id: distance(host, id) for id in data.nodes.keys() }
+  tables = { id: { 'heard': [], 'heard_by': [] } for id in data.nodes.keys() }
+  for id, edges in data.mesh.forward.items():
+    for neighbor_id, edge in edges.items():
+      d = distance(id, neighbor_id)
+      tables.setdefault(id, { 'heard': [], 'heard_by': [] })['heard'].append({ 'id': neighbor_id, 'snr': edge.snr, 'distance': d })
+      tables.setdefault(neighbor_id, { 'heard': [], 'heard_by': [] })['heard_by'].append({ 'id': id, 'snr': edge.snr, 'distance': d })
+  return host_distances, tables
+
+def vectorized_pass(config, snapshot, state):
+  renderer = StaticHTMLRenderer(config, snapshot, state)
+  renderer.prepare_distances()
+  # what _render() keeps for the next pass
+  if state is not None:
+    state.node_rows = renderer.neighbors
+    state.node_rows_key = (state.positions.version, snapshot.mesh.version)
+  return renderer.host_distances, renderer.neighbors
+
+def timed(run, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = run()
+    times.append(time.perf_counter() - start)
+  return result, times
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the render pass distances, scalar against vectorized")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--neighbors", type=int, default=10)
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+  report = sys.stderr
+
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    config, data, ids = make_store(args.nodes, args.neighbors)
+    snapshot = data.snapshot()
+  host = config['server']['node_id']
+  edges = [(id, neighbor_id) for id, neighbor_edges in data.mesh.forward.items() for neighbor_id in neighbor_edges.keys()]
+  print(f"{len(data.nodes)} nodes, {len(edges)} edges", file=report)
+  print(f"{'pass':<28} {'p50_ms':>9} {'max_ms':>9}", file=report)
+
+  results = {}
+  (scalar_host, scalar_tables), times = timed(lambda: scalar_pass(snapshot, host), args.repeat)
+  results['scalar (memoized)'] = times
+  (host_distances, tables), times = timed(lambda: vectorized_pass(config, snapshot, None), args.repeat)
+  results['vectorized, cold'] = times
+
+  state = RenderState()
+  vectorized_pass(config, snapshot, state)
+  _, results['vectorized, nothing moved'] = timed(lambda: vectorized_pass(config, snapshot, state), args.repeat)
+  moved = []
+  patch_mismatches = 0
+  for _ in range(args.repeat):
+    id = random.choice(ids)
+    node = data.nodes[id]
+    node['position'] = dict(node['position'], latitude_i=node['position']['latitude_i'] + 1000)
+    data.update_node(id, node)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+      moved_snapshot = data.snapshot()
+    (_, patched), times = timed(lambda: vectorized_pass(config, moved_snapshot, state), 1)
+    moved.extend(times)
+    _, rebuilt = vectorized_pass(config, moved_snapshot, None)
+    patch_mismatches += sum(1 for id in rebuilt.keys() | patched.keys() if rebuilt.get(id) != patched.get(id))
+  results['vectorized, one node moved'] = moved
+  for name, times in results.items():
+    print(f"{name:<28} {percentile(times, 0.5) * 1000:>9.1f} {max(times) * 1000:>9.1f}", file=report)
+
+  coordinates = [(utils.calculate_distance_between_nodes, data.nodes[a], data.nodes[b]) for a, b in edges if a in data.nodes and b in data.nodes]
+  start = time.perf_counter()
+  for calculate, a, b in coordinates:
+    calculate(a, b)
+  scalar_kernel = time.perf_counter() - start
+  lat1 = [a['position']['latitude_i'] / 10000000 for _, a, _ in coordinates]
+  lon1 = [a['position']['longitude_i'] / 10000000 for _, a, _ in coordinates]
+  lat2 = [b['position']['latitude_i'] / 10000000 for _, _, b in coordinates]
+  lon2 = [b['position']['longitude_i'] / 10000000 for _, _, b in coordinates]
+  start = time.perf_counter()
+  geo.distances_between_points(lat1, lon1, lat2, lon2)
+  vector_kernel = time.perf_counter() - start
+  print(f"haversine alone over {len(coordinates)} edges: scalar {scalar_kernel * 1000:.1f} ms, vectorized {vector_kernel * 1000:.1f} ms", file=report)
+
+  mismatches = sum(1 for id, d in scalar_host.items() if host_distances.get(id) != d)
+  mismatches += sum(1 for id, rows in scalar_tables.items() if tables.get(id) != rows)
+  print(f"same distances as the scalar path: {mismatches == 0} ({mismatches} mismatches)", file=report)
+  print(f"one node moved gives the same rows as a full rebuild: {patch_mismatches == 0} ({patch_mismatches} mismatches)", file=report)
+
+if __name__ == "__main__":
+  main()
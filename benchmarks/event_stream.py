@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Push over /v1/events instead of polling: --clients server-sent event subscribers while node
+# updates and telemetry arrive through the store at --updates-per-second. Reports how long events
+# take from the store change to each client (p50/p99), what was sent, and checks the resume
+# handshake: a client reconnecting with the last id it saw gets exactly what it missed.
+#
+# Run from the repository root:
+#   python -m benchmarks.event_stream --nodes 10000 --clients 100 --updates-per-second 50 --duration 30
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import sys
+import time
+
+import aiohttp
+
+from api import api
+from benchmarks.nodes_api import make_store, percentile
+
+async def subscribe(session, path, received, ready):
+  async with session.get(f"http://127.0.0.1:9000{path}", timeout=aiohttp.ClientTimeout(total=None)) as response:
+    ready.release()
+    async for line in response.content:
+      if line.startswith(b"id: "):
+        received.append((int(line[4:]), time.monotonic()))
+
+async def feed(data, ids, rate, deadline, published):
+  i = 0
+  while time.monotonic() < deadline:
+    id = random.choice(ids)
+    node = data.nodes[id]
+    node['telemetry'] = { 'battery_level': random.randint(1, 100) }
+    data.update_node(id, node)
+    if i % 2 == 0:
+      data.add_telemetry(id, { 'from': id, 'type': 'telemetry', 'timestamp': int(time.time()), 'payload': { 'battery_level': node['telemetry']['battery_level'] } })
+    # the node event is published when the loop comes round, the telemetry right away
+    await asyncio.sleep(0)
+    now = time.monotonic()
+    for event_id in range(len(published) + 1, data.events.last_id + 1):
+      published[event_id] = now
+    i += 1
+    await asyncio.sleep(1 / rate)
+
+async def bench(args, report):
+  config, data = make_store(args.nodes)
+  ids = list(data.nodes.keys())
+  data.events.start()
+  server = asyncio.create_task(api.API(config, data).serve(asyncio.get_running_loop()))
+  published = {} # event id -> when the store change was made
+  async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+    for _ in range(50):
+      with contextlib.suppress(aiohttp.ClientError):
+        async with session.get("http://127.0.0.1:9000/v1/server/events") as response:
+          if response.status == 200:
+            break
+      await asyncio.sleep(0.1)
+
+    received = []
+    ready = asyncio.Semaphore(0)
+    clients = [asyncio.create_task(subscribe(session, "/v1/events?topics=nodes,telemetry", received, ready)) for _ in range(args.clients)]
+    for _ in range(args.clients):
+      await ready.acquire()
+    resume = asyncio.create_task(subscribe(session, "/v1/events?topics=nodes,telemetry", [], asyncio.Semaphore(0)))
+
+    deadline = time.monotonic() + args.duration
+    feeder = asyncio.create_task(feed(data, ids, args.updates_per_second, deadline, published))
+    # one client drops halfway and reconnects from the last id it saw
+    await asyncio.sleep(args.duration / 2)
+    resume.cancel()
+    last_seen = data.events.last_id
+    await asyncio.sleep(1)
+    resumed = []
+    resume = asyncio.create_task(subscribe(session, f"/v1/events?topics=nodes,telemetry&since={last_seen}", resumed, asyncio.Semaphore(0)))
+    await feeder
+    await asyncio.sleep(1)
+    stats = data.events.stats()
+    for task in clients + [resume]:
+      task.cancel()
+    await asyncio.gather(*clients, resume, return_exceptions=True)
+
+  expected = list(range(last_seen + 1, stats['last_id'] + 1))
+  resumed = [id for id, _at in resumed]
+  latencies = [at - published[id] for id, at in received if id in published]
+  print(f"{args.nodes} nodes, {args.clients} subscribers, {args.updates_per_second} updates/s for {args.duration} s", file=report)
+  print(f"events published {stats['published']}, delivered {len(received)} ({len(received) / max(1, stats['published'] * args.clients):.1%} of published x subscribers), resyncs {stats['resyncs']}", file=report)
+  print(f"delivery latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms", file=report)
+  print(f"resumed client: missed events replayed and in order: {resumed == expected} ({len(resumed)} events)", file=report)
+
+  server.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await server
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the /v1/events push stream")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--clients", type=int, default=100)
+  parser.add_argument("--updates-per-second", type=float, default=50)
+  parser.add_argument("--duration", type=float, default=30)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  logging.getLogger("uvicorn.access").disabled = True
+  logging.getLogger("uvicorn.error").disabled = True
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(bench(args, report))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Geocoding service against a local stub of the geocode.maps.co /reverse endpoint: streams
+# position updates for a set of slowly moving nodes through MemoryDataStore.update_node while
+# the Geocoder worker runs, then reports update_node latency, cache hit ratio and queue wait.
+# A second pass with a fresh store reuses the persisted cache and should not call the API at all.
+#
+# Run from the repository root:
+#   python -m benchmarks.geocoding --nodes 500 --updates 20000 --rate-limit 50 --stub-latency 0.05
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+from memory_data_store import MemoryDataStore
+from models.node import Node
+
+async def start_stub(latency: float, throttle_every: int):
+  calls = { 'count': 0 }
+
+  async def reverse(request: web.Request):
+    calls['count'] += 1
+    await asyncio.sleep(latency)
+    if throttle_every > 0 and calls['count'] % throttle_every == 0:
+      return web.json_response({ 'error': 'rate limited' }, status=429, headers={ 'Retry-After': '0.1' })
+    return web.json_response({ 'display_name': f"{request.query['lat']}, {request.query['lon']}", 'address': { 'country_code': 'us' } })
+
+  app = web.Application()
+  app.router.add_get('/reverse', reverse)
+  runner = web.AppRunner(app)
+  await runner.setup()
+  site = web.TCPSite(runner, '127.0.0.1', 0)
+  await site.start()
+  port = site._server.sockets[0].getsockname()[1]
+  return runner, f"http://127.0.0.1:{port}", calls
+
+def make_config(directory: str, url: str, args):
+  config = json.load(open('config.json.sample', 'r'))
+  config['paths']['data'] = directory
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  geocoding = config['integrations']['geocoding']
+  geocoding['enabled'] = True
+  geocoding['rate_limit'] = args.rate_limit
+  geocoding['save_interval'] = 1
+  geocoding['geocode.maps.co']['url'] = url
+  return config
+
+async def run_pass(config, args, positions):
+  data = MemoryDataStore(config)
+  data.geocoder.load_cache()
+  worker = asyncio.create_task(data.geocoder.run())
+  update_max = 0.0
+  update_total = 0.0
+  start = time.perf_counter()
+  for i, (id, latitude_i, longitude_i) in enumerate(positions):
+    node = data.nodes[id] if id in data.nodes else Node.default_node(id)
+    node['position'] = dict(node['position'] or {}, latitude_i=latitude_i, longitude_i=longitude_i)
+    t = time.perf_counter()
+    data.update_node(id, node)
+    elapsed = time.perf_counter() - t
+    update_total += elapsed
+    update_max = max(update_max, elapsed)
+    if i % args.burst == 0:
+      await asyncio.sleep(0) # let the worker and the stub server run, like MQTT ingest would
+  ingest_time = time.perf_counter() - start
+
+  # wait for the queue to drain
+  while data.geocoder.queue.qsize() > 0 or len(data.geocoder.pending) > 0:
+    await asyncio.sleep(0.05)
+  drain_time = time.perf_counter() - start
+  worker.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await worker
+
+  geocoded = sum(1 for node in data.nodes.values() if node['position'] and node['position'].get('geocoded') is not None)
+  return data.geocoder.stats.to_dict(), update_total / len(positions), update_max, ingest_time, drain_time, geocoded, len(data.nodes)
+
+def make_positions(args):
+  random.seed(1)
+  nodes = { f"{random.randint(0x10000000, 0xfffffff0):08x}": [385000000 + random.randint(-10**6, 10**6), -1214000000 + random.randint(-10**6, 10**6)] for _ in range(args.nodes) }
+  ids = list(nodes.keys())
+  positions = []
+  for _ in range(args.updates):
+    id = random.choice(ids)
+    # most updates are GPS jitter, some nodes actually move
+    step = 2000 if random.random() < 0.05 else 20
+    nodes[id][0] += random.randint(-step, step)
+    nodes[id][1] += random.randint(-step, step)
+    positions.append((id, nodes[id][0], nodes[id][1]))
+  return positions
+
+def report(name, result, calls, file):
+  stats, update_avg, update_max, ingest_time, drain_time, geocoded, node_count = result
+  print(f"{name}:", file=file)
+  print(f"  update_node: avg {update_avg * 1000:.3f} ms, max {update_max * 1000:.3f} ms, {ingest_time:.2f} s for all updates", file=file)
+  print(f"  lookups {stats['lookups']}, cache hits {stats['cache_hits']} (hit ratio {stats['cache_hit_ratio']}), queued cells {stats['queued']}, dropped {stats['dropped']}", file=file)
+  print(f"  api calls {calls}, failed {stats['failed']}, rate limited {stats['rate_limited']}, request avg {stats['request']['avg_ms']} ms", file=file)
+  print(f"  queue wait: avg {stats['queue_wait']['avg_ms']} ms, max {stats['queue_wait']['max_ms']} ms; drained after {drain_time:.2f} s", file=file)
+  print(f"  nodes geocoded {geocoded}/{node_count}, cache size {stats['cache_size']}", file=file)
+
+async def bench(args, file):
+  runner, url, calls = await start_stub(args.stub_latency, args.throttle_every)
+  directory = tempfile.mkdtemp(prefix='meshinfo-geocoding-')
+  try:
+    config = make_config(directory, url, args)
+    positions = make_positions(args)
+    cold = await run_pass(config, args, positions)
+    cold_calls = calls['count']
+    report("cold cache", cold, cold_calls, file)
+    warm = await run_pass(config, args, positions)
+    report("warm cache (reloaded from disk)", warm, calls['count'] - cold_calls, file)
+  finally:
+    await runner.cleanup()
+    shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the geocoding service against a local stub server")
+  parser.add_argument("--nodes", type=int, default=500)
+  parser.add_argument("--updates", type=int, default=20000)
+  parser.add_argument("--burst", type=int, default=50, help="position updates between event loop yields")
+  parser.add_argument("--rate-limit", type=float, default=50)
+  parser.add_argument("--stub-latency", type=float, default=0.05, help="seconds the stub server takes per request")
+  parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+  args = parser.parse_args()
+
+  report_file = sys.stderr
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(bench(args, report_file))
+
+if __name__ == "__main__":
+  main()
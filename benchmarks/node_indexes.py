@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Name and neighbor lookups on MemoryDataStore: the secondary indexes maintained by update_node
+# against the linear scans they replaced. Builds a synthetic node table with neighborinfo and
+# reports the cost per lookup, and the extra cost the indexes add to update_node.
+#
+# Run from the repository root:
+#   python -m benchmarks.node_indexes --nodes 50000
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+from memory_data_store import MemoryDataStore
+from models.node import Node
+import utils
+
+# the lookups as they were before the indexes, for comparison
+def scan_longname(data, ln):
+  for _id, node in data.nodes.items():
+    if node['longname'] == ln:
+      return node
+  return None
+
+def scan_shortname(data, sn):
+  for _id, node in data.nodes.items():
+    if str(node['shortname']).lower() == sn.lower():
+      return node
+  return None
+
+def scan_heard_by(data, id):
+  node_id = utils.convert_node_id_from_hex_to_int(id)
+  heard_by = []
+  for nid, n in data.nodes.items():
+    if n['neighborinfo'] and n['neighborinfo']['neighbors'] and any(neighbor['node_id'] == node_id for neighbor in n['neighborinfo']['neighbors']):
+      heard_by.append(n.copy())
+  return heard_by
+
+def populate(data: MemoryDataStore, count: int, neighbors: int):
+  random.seed(1)
+  ids = list(dict.fromkeys(f"{random.randint(0x10000000, 0xfffffff0):08x}" for _ in range(count)))
+  for id in ids:
+    node = Node.default_node(id)
+    node['longname'] = f"Node {id}"
+    node['shortname'] = id[-4:].upper()
+    node['neighborinfo'] = { 'neighbors': [{ 'node_id': utils.convert_node_id_from_hex_to_int(n), 'snr': random.uniform(-20, 10) } for n in random.sample(ids, neighbors)] }
+    data.update_node(id, node)
+  return ids
+
+def per_call(fn, args_list):
+  start = time.perf_counter()
+  for args in args_list:
+    fn(*args)
+  return (time.perf_counter() - start) / len(args_list)
+
+def bench(args, report):
+  config = json.load(open('config.json.sample', 'r'))
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  config['integrations']['geocoding']['enabled'] = False
+  data = MemoryDataStore(config)
+
+  start = time.perf_counter()
+  ids = populate(data, args.nodes, args.neighbors)
+  insert = (time.perf_counter() - start) / len(ids)
+
+  sample = random.sample(ids, args.lookups)
+  longnames = [(data, data.nodes[id]['longname']) for id in sample]
+  shortnames = [(data, data.nodes[id]['shortname'].lower()) for id in sample]
+  heard = [(data, id) for id in sample]
+
+  # the scans are slow, time fewer of them
+  scan_sample = max(1, args.lookups // 20)
+  results = [
+    ('longname', per_call(scan_longname, longnames[:scan_sample]), per_call(lambda d, ln: d.find_node_by_longname(ln), longnames)),
+    ('shortname (ignore case)', per_call(scan_shortname, shortnames[:scan_sample]), per_call(lambda d, sn: d.find_node_by_short_name(sn, ignore_case=True), shortnames)),
+    ('neighbors heard by', per_call(scan_heard_by, heard[:scan_sample]), per_call(lambda d, id: d.find_node_by_hex_id(id, include_neighbors=True), heard)),
+  ]
+
+  # the same node updated in place: name change plus new neighbor list, so every index moves
+  updates = []
+  for id in sample:
+    node = data.nodes[id].copy()
+    node['longname'] = f"Renamed {id}"
+    node['neighborinfo'] = { 'neighbors': [{ 'node_id': utils.convert_node_id_from_hex_to_int(n), 'snr': 0.0 } for n in random.sample(ids, args.neighbors)] }
+    updates.append((id, node))
+  update = per_call(data.update_node, updates)
+
+  print(f"{len(ids)} nodes, {args.neighbors} neighbors each, {args.lookups} lookups", file=report)
+  print(f"{'lookup':<26} {'scan_us':>12} {'indexed_us':>12} {'speedup':>10}", file=report)
+  for name, scan, indexed in results:
+    print(f"{name:<26} {scan * 1e6:>12.1f} {indexed * 1e6:>12.2f} {scan / indexed:>9.0f}x", file=report)
+  print(f"update_node: {insert * 1e6:.1f} us per insert, {update * 1e6:.1f} us per update with reindex", file=report)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark node name and neighbor lookups")
+  parser.add_argument("--nodes", type=int, default=50000)
+  parser.add_argument("--neighbors", type=int, default=5)
+  parser.add_argument("--lookups", type=int, default=2000)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    bench(args, report)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+#
+# /v1/nodes under polling load: the indexed query (MemoryDataStore.query_nodes) against the
+# handler it replaced, which filtered the whole node table with dict comprehensions on every
+# request. Serves the API on port 9000 with a synthetic node table (last seen spread over 30
+# days), checks both handlers return the same nodes and times the query layer alone, then runs
+# clients that each poll one of a mix of queries every --interval seconds, like the frontend
+# does, and reports latency. The clients share the server's process and CPU.
+#
+# Run from the repository root:
+#   python -m benchmarks.nodes_api --nodes 10000 --clients 20 --interval 3 --duration 30
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import aiohttp
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+
+from api import api
+from memory_data_store import MemoryDataStore
+from models.node import Node
+import utils
+
+WORDS = ['base', 'solar', 'ridge', 'relay', 'valley', 'mobile', 'home', 'peak', 'river', 'tower', 'rover', 'camp']
+
+QUERIES = {
+  'all (frontend)': '',
+  'online': 'status=online',
+  'long_name search': 'long_name=ridge',
+  'page of 100': 'limit=100',
+  'projected page': 'limit=500&fields=id,longname,shortname,last_seen',
+}
+
+# the handler as it was before the index, for comparison
+def legacy_nodes(data, params):
+  days_to_limit = 7
+  if "days" in params.keys():
+    days_to_limit = int(params.get("days"))
+  if days_to_limit < 1:
+    days_to_limit = 1
+
+  nodes = { k: v for k, v in data.nodes.items() if utils.days_since_datetime(v["last_seen"]) <= days_to_limit }
+  if "ids" in params.keys() and params.get("ids").strip() != "":
+    nodes_to_keep = []
+    for id in params.get("ids").strip().split(","):
+      try:
+        node_id = utils.convert_node_id_from_int_to_hex(int(id))
+      except ValueError:
+        node_id = id
+      if node_id in data.nodes:
+        nodes_to_keep.append(node_id)
+    nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
+  for param, field in (("long_name", "longname"), ("short_name", "shortname")):
+    if param in params.keys() and params.get(param).strip() != "":
+      text = params.get(param).strip().lower()
+      nodes_to_keep = [id for id in nodes if text in nodes[id][field].lower()]
+      nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
+  if params.get("status", "").strip() in ("online", "offline"):
+    online = params.get("status").strip() == "online"
+    nodes_to_keep = [id for id in nodes if bool(nodes[id]["active"]) == online]
+    nodes = { k: v for k, v in nodes.items() if k in nodes_to_keep }
+  return nodes
+
+def make_store(count: int):
+  config = json.load(open('config.json.sample', 'r'))
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  config['integrations']['geocoding']['enabled'] = False
+  data = MemoryDataStore(config)
+  random.seed(1)
+  now = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  for _ in range(count):
+    id = f"{random.randint(0x10000000, 0xfffffff0):08x}"
+    node = Node.default_node(id)
+    node['longname'] = f"{random.choice(WORDS).title()} {random.choice(WORDS).title()} {id[:4]}"
+    node['shortname'] = id[-4:].upper()
+    node['position'] = { 'latitude_i': 385000000 + random.randint(-10**6, 10**6), 'longitude_i': -1214000000 + random.randint(-10**6, 10**6), 'altitude': 100 }
+    data.update_node(id, node)
+    # update_node stamps last_seen with now, spread them out like a real table
+    data.nodes[id]['last_seen'] = now - datetime.timedelta(seconds=random.uniform(0, 30 * 86400))
+    data.nodes[id]['active'] = random.random() < 0.6
+    data.mark_node_dirty(id)
+  return config, data
+
+def check(data):
+  for params in ['', 'days=1', 'days=14&status=online', 'long_name=RIDGE', 'short_name=a', 'status=offline', 'long_name=ba&status=online']:
+    query = dict(p.split('=') for p in params.split('&') if p != '')
+    legacy = legacy_nodes(data, query)
+    indexed, _cursor = data.query_nodes(
+      days=max(1, int(query.get('days', 7))), longname=query.get('long_name'), shortname=query.get('short_name'), status=query.get('status'))
+    assert set(legacy.keys()) == set(indexed.keys()), params
+
+  # walking every page returns every node exactly once
+  pages = []
+  cursor = None
+  while True:
+    nodes, cursor = data.query_nodes(days=30, limit=250, cursor=cursor)
+    pages.extend(nodes.keys())
+    if cursor is None:
+      break
+  assert sorted(pages) == sorted(legacy_nodes(data, { 'days': '30' }).keys())
+
+async def poll(session, url, interval, deadline, latencies, errors):
+  await asyncio.sleep(random.uniform(0, interval))
+  while time.monotonic() < deadline:
+    start = time.monotonic()
+    try:
+      async with session.get(url) as response:
+        await response.read()
+        if response.status != 200:
+          errors.append(response.status)
+      latencies.append(time.monotonic() - start)
+    except aiohttp.ClientError as e:
+      errors.append(type(e).__name__)
+    await asyncio.sleep(max(0, interval - (time.monotonic() - start)))
+
+def query_times(data, report):
+  # the query layer alone, without HTTP and JSON encoding
+  print(f"{'query':<20} {'legacy_ms':>10} {'indexed_ms':>11} {'speedup':>9} {'nodes':>7}", file=report)
+  for name, params in QUERIES.items():
+    query = dict(p.split('=') for p in params.split('&') if p != '')
+    start = time.perf_counter()
+    for _ in range(10):
+      legacy_nodes(data, query)
+    legacy = (time.perf_counter() - start) / 10
+    fields = query['fields'].split(',') if 'fields' in query else None
+    limit = int(query['limit']) if 'limit' in query else None
+    start = time.perf_counter()
+    for _ in range(10):
+      nodes, _cursor = data.query_nodes(longname=query.get('long_name'), status=query.get('status'), limit=limit, fields=fields)
+    indexed = (time.perf_counter() - start) / 10
+    print(f"{name:<20} {legacy * 1000:>10.2f} {indexed * 1000:>11.2f} {legacy / indexed:>8.0f}x {len(nodes):>7}", file=report)
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p))] if len(values) > 0 else 0.0
+
+async def bench(args, report):
+  config, data = make_store(args.nodes)
+  check(data)
+  query_times(data, report)
+
+  @api.app.get("/bench/legacy/nodes")
+  async def legacy(request: Request):
+    nodes = legacy_nodes(data, request.query_params)
+    return jsonable_encoder({ "nodes": nodes, "count": len(nodes) })
+
+  server = asyncio.create_task(api.API(config, data).serve(asyncio.get_running_loop()))
+  async with aiohttp.ClientSession() as session:
+    for _ in range(50):
+      with contextlib.suppress(aiohttp.ClientError):
+        async with session.get("http://127.0.0.1:9000/v1/stats") as response:
+          if response.status == 200:
+            break
+      await asyncio.sleep(0.1)
+
+    print(f"{args.nodes} nodes, {args.clients} clients polling every {args.interval} s for {args.duration} s", file=report)
+    print(f"{'query':<20} {'handler':<8} {'requests':>9} {'req/s':>8} {'p50_ms':>9} {'p99_ms':>9} {'max_ms':>9} {'bytes':>10}", file=report)
+    for name, params in QUERIES.items():
+      if args.legacy:
+        paths = [("legacy", "/bench/legacy/nodes"), ("indexed", "/v1/nodes")]
+      else:
+        paths = [("indexed", "/v1/nodes")]
+      for handler, path in paths:
+        url = f"http://127.0.0.1:9000{path}?{params}"
+        async with session.get(url) as response:
+          size = len(await response.read())
+        latencies = []
+        errors = []
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(poll(session, url, args.interval, deadline, latencies, errors) for _ in range(args.clients)))
+        print(f"{name:<20} {handler:<8} {len(latencies):>9} {len(latencies) / args.duration:>8.1f} {percentile(latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f} {max(latencies, default=0) * 1000:>9.1f} {size:>10}" + (f" errors {len(errors)}" if len(errors) > 0 else ""), file=report)
+  server.cancel()
+  with contextlib.suppress(asyncio.CancelledError):
+    await server
+
+def main():
+  parser = argparse.ArgumentParser(description="Load test /v1/nodes, indexed query against the legacy filters")
+  parser.add_argument("--nodes", type=int, default=10000)
+  parser.add_argument("--clients", type=int, default=20)
+  parser.add_argument("--interval", type=float, default=3, help="seconds between polls of one client")
+  parser.add_argument("--duration", type=float, default=30, help="seconds per query and handler")
+  parser.add_argument("--no-legacy", dest="legacy", action="store_false", help="only load the indexed handler")
+  args = parser.parse_args()
+
+  report = sys.stderr
+  logging.getLogger("uvicorn.access").disabled = True
+  logging.getLogger("uvicorn.error").disabled = True
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(bench(args, report))
+
+if __name__ == "__main__":
+  main()
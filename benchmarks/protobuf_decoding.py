@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+#
+# Compare the old MessageToJson -> json.loads decoding path with protobuf_decoder.message_to_dict.
+#
+# Capture a corpus of ServiceEnvelope payloads from your broker (one hex payload per line) with e.g.:
+#   mosquitto_sub -h mqtt.example.org -t 'msh/US/#' -F '%x' -C 50000 > corpus.hex
+# then run from the repository root:
+#   python -m benchmarks.protobuf_decoding --corpus corpus.hex
+# Without --corpus a synthetic corpus of unencrypted packets is generated.
+
+import argparse
+import json
+import random
+import time
+
+from google.protobuf.json_format import MessageToJson
+from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+
+import protobuf_decoder
+
+# portnum -> (message class, always_print_fields_with_no_presence) as used by MQTT.process_mqtt_msg
+PAYLOAD_TYPES = {
+  portnums_pb2.MAP_REPORT_APP: (mesh_pb2.Position, True),
+  portnums_pb2.NEIGHBORINFO_APP: (mesh_pb2.NeighborInfo, True),
+  portnums_pb2.NODEINFO_APP: (mesh_pb2.User, False),
+  portnums_pb2.ROUTING_APP: (mesh_pb2.Routing, False),
+  portnums_pb2.TRACEROUTE_APP: (mesh_pb2.RouteDiscovery, True),
+  portnums_pb2.POSITION_APP: (mesh_pb2.Position, False),
+  portnums_pb2.TELEMETRY_APP: (telemetry_pb2.Telemetry, False),
+}
+
+def decode_old(payload: bytes):
+  se = mqtt_pb2.ServiceEnvelope()
+  se.ParseFromString(payload)
+  mp = se.packet
+  outs = json.loads(MessageToJson(mp, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
+  if mp.decoded.portnum in PAYLOAD_TYPES:
+    cls, always_print = PAYLOAD_TYPES[mp.decoded.portnum]
+    sub = cls().FromString(mp.decoded.payload)
+    outs['payload'] = json.loads(MessageToJson(sub, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True, always_print_fields_with_no_presence=always_print))
+  return outs
+
+def decode_new(payload: bytes):
+  se = mqtt_pb2.ServiceEnvelope()
+  se.ParseFromString(payload)
+  mp = se.packet
+  outs = protobuf_decoder.message_to_dict(mp)
+  if mp.decoded.portnum in PAYLOAD_TYPES:
+    cls, always_print = PAYLOAD_TYPES[mp.decoded.portnum]
+    sub = cls().FromString(mp.decoded.payload)
+    outs['payload'] = protobuf_decoder.message_to_dict(sub, always_print_fields_with_no_presence=always_print)
+  return outs
+
+def synthetic_corpus(count: int):
+  random.seed(42)
+  nodes = [random.randint(0x10000000, 0xfffffff0) for _ in range(200)]
+  corpus = []
+  for i in range(count):
+    node = random.choice(nodes)
+    kind = i % 5
+    if kind == 0:
+      portnum = portnums_pb2.NODEINFO_APP
+      payload = mesh_pb2.User(id=f"!{node:08x}", long_name=f"Node {node:08x}", short_name=f"{node:08x}"[-4:], hw_model=9, role=2)
+    elif kind == 1:
+      portnum = portnums_pb2.POSITION_APP
+      payload = mesh_pb2.Position(latitude_i=385000000 + random.randint(-10**6, 10**6), longitude_i=-1214000000 + random.randint(-10**6, 10**6), altitude=random.randint(0, 900), time=1700000000, precision_bits=32)
+    elif kind == 2:
+      portnum = portnums_pb2.TELEMETRY_APP
+      payload = telemetry_pb2.Telemetry(time=1700000000)
+      payload.device_metrics.battery_level = random.randint(1, 100)
+      payload.device_metrics.voltage = random.uniform(3.3, 4.2)
+      payload.device_metrics.channel_utilization = random.uniform(0, 40)
+      payload.device_metrics.air_util_tx = random.uniform(0, 5)
+      payload.device_metrics.uptime_seconds = random.randint(0, 10**6)
+    elif kind == 3:
+      portnum = portnums_pb2.NEIGHBORINFO_APP
+      payload = mesh_pb2.NeighborInfo(node_id=node, node_broadcast_interval_secs=900)
+      for neighbor in random.sample(nodes, 5):
+        payload.neighbors.add(node_id=neighbor, snr=random.uniform(-20, 10))
+    else:
+      portnum = portnums_pb2.TRACEROUTE_APP
+      payload = mesh_pb2.RouteDiscovery(route=random.sample(nodes, 3))
+
+    se = mqtt_pb2.ServiceEnvelope(channel_id="LongFast", gateway_id=f"!{nodes[0]:08x}")
+    mp = se.packet
+    setattr(mp, "from", node)
+    mp.to = 0xffffffff
+    mp.id = random.randint(1, 2**31)
+    mp.rx_time = 1700000000 + i
+    mp.rx_snr = random.uniform(-20, 10)
+    mp.rx_rssi = random.randint(-130, -40)
+    mp.hop_limit = 3
+    mp.hop_start = 3
+    mp.decoded.portnum = portnum
+    mp.decoded.payload = payload.SerializeToString()
+    corpus.append(se.SerializeToString())
+  return corpus
+
+def load_corpus(path: str):
+  corpus = []
+  with open(path, "r", encoding='utf-8') as f:
+    for line in f:
+      line = line.strip()
+      if line:
+        corpus.append(bytes.fromhex(line))
+  return corpus
+
+def run(decoder, corpus, iterations: int):
+  best = None
+  for _ in range(iterations):
+    start = time.perf_counter()
+    for payload in corpus:
+      try:
+        decoder(payload)
+      except Exception:
+        pass
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None or elapsed < best else best
+  return best
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark protobuf packet decoding")
+  parser.add_argument("--corpus", help="file with one hex encoded ServiceEnvelope payload per line")
+  parser.add_argument("--count", type=int, default=20000, help="number of synthetic packets when no corpus is given")
+  parser.add_argument("--iterations", type=int, default=5)
+  args = parser.parse_args()
+
+  corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+  print(f"Corpus: {len(corpus)} payloads ({args.corpus if args.corpus else 'synthetic'})")
+
+  mismatches = 0
+  for payload in corpus:
+    try:
+      old = decode_old(payload)
+    except Exception:
+      continue
+    if old != decode_new(payload):
+      mismatches += 1
+  print(f"Output mismatches: {mismatches}")
+
+  old_time = run(decode_old, corpus, args.iterations)
+  new_time = run(decode_new, corpus, args.iterations)
+  print(f"MessageToJson + json.loads: {old_time:.3f}s ({old_time / len(corpus) * 1e6:.1f} us/packet)")
+  print(f"message_to_dict:            {new_time:.3f}s ({new_time / len(corpus) * 1e6:.1f} us/packet)")
+  print(f"Speedup: {old_time / new_time:.2f}x")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Per-page cost of the node pages (node_<id>.html) as the mesh grows. Builds meshes of increasing
+# size with a fixed number of neighbors per node, then times the once-per-pass distances and
+# neighbor table build and rendering a fixed sample of node pages. With the heard / heard by rows
+# precomputed, the per-page time should stay flat while the table build grows linearly with the mesh.
+#
+# Run from the repository root:
+#   python -m benchmarks.render_nodes --nodes 500 2000 8000 --pages 200
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from memory_data_store import MemoryDataStore
+from models.node import Node
+from static_html_renderer import StaticHTMLRenderer
+import utils
+
+def make_store(count: int, neighbors: int):
+  config = json.load(open('config.json.sample', 'r'))
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  config['integrations']['geocoding']['enabled'] = False
+  random.seed(1)
+  ids = list(dict.fromkeys(f"{random.randint(0x10000000, 0xfffffff0):08x}" for _ in range(count)))
+  config['server']['node_id'] = ids[0]
+  data = MemoryDataStore(config)
+  for id in ids:
+    node = Node.default_node(id)
+    node['longname'] = f"Node {id}"
+    node['shortname'] = id[-4:]
+    node['position'] = { 'latitude_i': 385000000 + random.randint(-10**6, 10**6), 'longitude_i': -1214000000 + random.randint(-10**6, 10**6), 'altitude': 100 }
+    node['neighborinfo'] = { 'node_broadcast_interval_secs': 900, 'neighbors': [{ 'node_id': utils.convert_node_id_from_hex_to_int(n), 'snr': round(random.uniform(-20, 10), 2) } for n in random.sample(ids, neighbors)] }
+    data.update_node(id, node)
+  return config, data, ids
+
+def bench(count: int, args, report):
+  config, data, ids = make_store(count, args.neighbors)
+  directory = tempfile.mkdtemp(prefix='meshinfo-render-')
+  try:
+    config['paths']['output'] = directory
+    config['paths']['data'] = directory
+    renderer = StaticHTMLRenderer(config, data.snapshot())
+
+    start = time.perf_counter()
+    renderer.prepare_distances()
+    tables = time.perf_counter() - start
+
+    sample = set(random.sample(ids, min(args.pages, len(ids))))
+    start = time.perf_counter()
+    renderer.render_nodes_each(ids=sample)
+    pages = time.perf_counter() - start
+    print(f"{len(ids):>8} {len(data.mesh):>8} {tables * 1000:>10.1f} {len(sample):>7} {pages / len(sample) * 1000:>12.2f}", file=report)
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark node page rendering against mesh size")
+  parser.add_argument("--nodes", type=int, nargs="+", default=[500, 2000, 8000])
+  parser.add_argument("--neighbors", type=int, default=5)
+  parser.add_argument("--pages", type=int, default=200)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  print(f"{'nodes':>8} {'edges':>8} {'tables_ms':>10} {'pages':>7} {'ms_per_page':>12}", file=report)
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    for count in args.nodes:
+      bench(count, args, report)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+#
+# Static site rendering throughput: pages/second for full render passes over a synthetic mesh.
+# The first pass includes loading and compiling the templates, later passes show the steady state.
+#
+# Run from the repository root:
+#   python -m benchmarks.render_pages --nodes 1000 --passes 3
+
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.render_nodes import make_store
+from static_html_renderer import StaticHTMLRenderer
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark static HTML rendering in pages/second")
+  parser.add_argument("--nodes", type=int, default=1000)
+  parser.add_argument("--neighbors", type=int, default=5)
+  parser.add_argument("--passes", type=int, default=3)
+  args = parser.parse_args()
+
+  report = sys.stderr
+  directory = tempfile.mkdtemp(prefix='meshinfo-pages-')
+  try:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+      config, data, _ids = make_store(args.nodes, args.neighbors)
+      config['paths']['output'] = directory
+      config['paths']['data'] = directory
+      snapshot = data.snapshot()
+      for i in range(args.passes):
+        renderer = StaticHTMLRenderer(config, snapshot)
+        start = time.perf_counter()
+        renderer._render()
+        elapsed = time.perf_counter() - start
+        pages = renderer.pages['rendered']
+        print(f"pass {i + 1}: {pages} pages in {elapsed:.2f} s, {pages / elapsed:.1f} pages/s", file=report)
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#
+# Full static render passes with the process pool (server.render.workers) against the in-process
+# renderer. Each worker count gets two passes: the first includes starting the workers and loading
+# the templates, the second is the steady state the scheduler sees.
+#
+# Run from the repository root:
+#   python -m benchmarks.render_parallel --nodes 1000 10000 --workers 1 2 4 8
+
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.render_nodes import make_store
+from static_html_renderer import StaticHTMLRenderer
+
+def bench(count: int, args, report):
+  directory = tempfile.mkdtemp(prefix='meshinfo-parallel-')
+  try:
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+      config, data, _ids = make_store(count, args.neighbors)
+      config['paths']['output'] = directory
+      config['paths']['data'] = directory
+      snapshot = data.snapshot()
+    baseline = None
+    for workers in args.workers:
+      config['server']['render'] = { 'workers': workers }
+      times = []
+      for _ in range(2):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+          renderer = StaticHTMLRenderer(config, snapshot)
+          start = time.perf_counter()
+          renderer._render()
+          times.append(time.perf_counter() - start)
+      baseline = baseline if baseline is not None else times[1]
+      pages = renderer.pages['rendered']
+      print(f"{count:>8} {workers:>8} {pages:>7} {times[0]:>9.2f} {times[1]:>9.2f} {pages / times[1]:>9.0f} {baseline / times[1]:>8.2f}x", file=report)
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark static rendering across a process pool")
+  parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000])
+  parser.add_argument("--neighbors", type=int, default=5)
+  parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+  args = parser.parse_args()
+
+  report = sys.stderr
+  print(f"cpus: {os.cpu_count()}", file=report)
+  print(f"{'nodes':>8} {'workers':>8} {'pages':>7} {'cold_s':>9} {'warm_s':>9} {'pages/s':>9} {'speedup':>9}", file=report)
+  for count in args.nodes:
+    bench(count, args, report)
+
+if __name__ == "__main__":
+  main()
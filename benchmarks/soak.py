@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+# Soak test for the in-memory histories: feeds a synthetic packet stream through the MQTT
+# handlers into a MemoryDataStore and reports RSS and per-packet insert latency over time.
+#
+# Run from the repository root:
+#   python -m benchmarks.soak --packets 2000000 --nodes 2000
+#   python -m benchmarks.soak --unbounded   # retention limits effectively disabled, for comparison
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+from memory_data_store import RETENTION_DEFAULTS, MemoryDataStore
+from mqtt import MQTT
+
+def rss_mb():
+  try:
+    with open('/proc/self/statm', 'r') as f:
+      pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+  except (FileNotFoundError, ValueError):
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values, pct):
+  if len(values) == 0:
+    return 0.0
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def synthetic_packet(i: int, nodes: list[int]):
+  node = random.choice(nodes)
+  msg = {
+    'from': node,
+    'to': 0xffffffff,
+    'id': i,
+    'rssi': random.randint(-130, -40),
+    'snr': random.uniform(-20, 10),
+    'timestamp': int(time.time()),
+    'topic': 'msh/US/bench/2/e/LongFast/!00000000',
+  }
+  kind = i % 10
+  if kind < 6:
+    msg['type'] = 'telemetry'
+    msg['payload'] = {
+      'battery_level': random.randint(1, 100),
+      'voltage': random.uniform(3.3, 4.2),
+      'channel_utilization': random.uniform(0, 40),
+      'air_util_tx': random.uniform(0, 5),
+      'uptime_seconds': random.randint(0, 10**6),
+    }
+  elif kind < 8:
+    msg['type'] = 'text'
+    msg['payload'] = { 'text': f'soak message {i} ' + 'x' * random.randint(0, 100) }
+  elif kind < 9:
+    msg['type'] = 'traceroute'
+    msg['payload'] = { 'route': random.sample(nodes, 3) }
+  else:
+    msg['type'] = 'position'
+    msg['payload'] = { 'latitude_i': 385000000 + random.randint(-10**6, 10**6), 'longitude_i': -1214000000 + random.randint(-10**6, 10**6), 'altitude': 100 }
+  return msg
+
+async def soak(args):
+  config = json.load(open('config.json.sample', 'r'))
+  config['broker']['client_id'] = 'soak'
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  config['server']['message_log'] = { 'enabled': False }
+  config['integrations']['geocoding']['enabled'] = False
+  if args.unbounded:
+    config['server']['retention'] = { name: { 'max_items': None, 'max_age': None } for name in RETENTION_DEFAULTS }
+
+  data = MemoryDataStore(config)
+  mqtt = MQTT(config, data)
+  handlers = {
+    'telemetry': mqtt.handle_telemetry,
+    'text': mqtt.handle_text,
+    'traceroute': mqtt.handle_traceroute,
+    'position': mqtt.handle_position,
+  }
+
+  random.seed(1)
+  nodes = [random.randint(0x10000000, 0xfffffff0) for _ in range(args.nodes)]
+
+  # handlers log every packet, keep the report readable
+  report = sys.stderr
+  print(f"{'packets':>10} {'elapsed_s':>10} {'rss_mb':>8} {'p50_us':>8} {'p99_us':>8} {'max_us':>9} {'telemetry':>10} {'chat':>8} {'messages':>9}", file=report)
+  latencies = []
+  start = time.monotonic()
+  for i in range(1, args.packets + 1):
+    msg = synthetic_packet(i, nodes)
+    t = time.perf_counter()
+    await handlers[msg['type']](msg)
+    await mqtt.handle_log(msg)
+    latencies.append(time.perf_counter() - t)
+
+    if i % args.prune_every == 0:
+      data.prune_histories()
+
+    if i % args.report_every == 0:
+      print(f"{i:>10} {time.monotonic() - start:>10.1f} {rss_mb():>8.1f} {percentile(latencies, 50) * 1e6:>8.1f} {percentile(latencies, 99) * 1e6:>8.1f} {max(latencies) * 1e6:>9.1f} {len(data.telemetry):>10} {len(data.chat['channels']['0']['messages']):>8} {len(data.messages):>9}", file=report)
+      latencies = []
+
+def main():
+  parser = argparse.ArgumentParser(description="Soak test the in-memory histories")
+  parser.add_argument("--packets", type=int, default=1000000)
+  parser.add_argument("--nodes", type=int, default=1000)
+  parser.add_argument("--report-every", type=int, default=50000)
+  parser.add_argument("--prune-every", type=int, default=1000)
+  parser.add_argument("--unbounded", action="store_true", help="disable retention limits for comparison")
+  args = parser.parse_args()
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    asyncio.run(soak(args))
+
+if __name__ == "__main__":
+  main()
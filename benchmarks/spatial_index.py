@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Bounding box and radius node queries (/v1/nodes?bbox= and ?near=&radius_km=) at --nodes nodes,
+# most of them clustered around --cities cities and the rest spread over the world: the position
+# grid of NodeIndex against scanning every node's position, as the map pages do client-side.
+# Times NodeIndex.query() (the ids of the matching nodes seen in the last week, newest first) and
+# checks it finds the same nodes as the scan.
+#
+# Run from the repository root:
+#   python -m benchmarks.spatial_index --nodes 100000 --cities 50
+
+import argparse
+from datetime import datetime, timedelta
+import random
+import sys
+import time
+
+from benchmarks.nodes_api import percentile
+import geo
+from node_index import NodeIndex
+
+def make_index(count: int, cities: int):
+  random.seed(1)
+  now = datetime.now()
+  centers = [(random.uniform(-45, 60), random.uniform(-180, 180)) for _ in range(cities)]
+  index = NodeIndex()
+  nodes = {}
+  for i in range(count):
+    if i % 10 < 7:
+      lat, lon = random.choice(centers)
+      lat, lon = lat + random.gauss(0, 0.3), lon + random.gauss(0, 0.3)
+    else:
+      lat, lon = random.uniform(-60, 70), random.uniform(-180, 180)
+    lon = lon if -180 <= lon <= 180 else (lon + 180) % 360 - 180
+    id = f"{i:08x}"
+    nodes[id] = {
+      'longname': f"Node {id}",
+      'shortname': id[-4:],
+      'last_seen': now - timedelta(seconds=random.uniform(0, 30 * 86400)),
+      'position': { 'latitude_i': int(lat * 10000000), 'longitude_i': int(lon * 10000000) },
+    }
+    index.update(id, nodes[id])
+  return index, nodes, centers
+
+def scan(nodes, after, inside):
+  matches = []
+  for id, node in nodes.items():
+    position = node['position']
+    if node['last_seen'].timestamp() > after and inside(position['latitude_i'] / 10000000, position['longitude_i'] / 10000000):
+      matches.append(id)
+  return matches
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the node position grid against scanning every node")
+  parser.add_argument("--nodes", type=int, default=100000)
+  parser.add_argument("--cities", type=int, default=50)
+  parser.add_argument("--requests", type=int, default=200)
+  args = parser.parse_args()
+  report = sys.stderr
+
+  index, nodes, centers = make_index(args.nodes, args.cities)
+  after = time.time() - 7 * 86400
+  lat, lon = centers[0]
+  queries = {
+    'city viewport (0.5 deg)': { 'bbox': (lat - 0.25, lon - 0.25, lat + 0.25, lon + 0.25) },
+    'region viewport (5 deg)': { 'bbox': (lat - 2.5, lon - 2.5, lat + 2.5, lon + 2.5) },
+    'across the antimeridian': { 'bbox': (-20.0, 175.0, 20.0, -175.0) },
+    'near, 10 km': { 'near': (lat, lon, 10) },
+    'near, 100 km': { 'near': (lat, lon, 100) },
+    'near, 10 km, page of 100': { 'near': (lat, lon, 10), 'limit': 100 },
+    'whole world': { 'bbox': (-90.0, -180.0, 90.0, 180.0) },
+  }
+  print(f"{len(nodes)} nodes, {' / '.join(str(len(grid)) for grid in index.grids)} populated cells per grid", file=report)
+  print(f"{'query':<26} {'nodes':>7} {'p50_ms':>9} {'p99_ms':>9} {'scan_ms':>9}", file=report)
+  for name, query in queries.items():
+    times = []
+    for _ in range(args.requests):
+      start = time.perf_counter()
+      ids, _cursor = index.query(after=after, **query)
+      times.append(time.perf_counter() - start)
+
+    if 'bbox' in query:
+      south, west, north, east = query['bbox']
+      inside = lambda lat, lon: south <= lat <= north and (west <= lon <= east if west <= east else (lon >= west or lon <= east))
+    else:
+      near_lat, near_lon, radius_km = query['near']
+      inside = lambda lat, lon: geo.distance_between_two_points(near_lat, near_lon, lat, lon) <= radius_km
+    start = time.perf_counter()
+    scanned = scan(nodes, after, inside)
+    scan_time = time.perf_counter() - start
+    if 'limit' not in query:
+      assert sorted(ids) == sorted(scanned), name
+    print(f"{name:<26} {len(ids):>7} {percentile(times, 0.5) * 1000:>9.3f} {percentile(times, 0.99) * 1000:>9.3f} {scan_time * 1000:>9.1f}", file=report)
+  print("same nodes as the scan: True", file=report)
+
+if __name__ == "__main__":
+  main()
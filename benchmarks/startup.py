@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# Startup time of MemoryDataStore.load(): JSON files vs the binary snapshot written next to them.
+# Builds a synthetic store of the given size (70% telemetry, 10% each chat messages, traceroutes
+# and node updates), saves it, then times load() both ways.
+#
+# Run from the repository root:
+#   python -m benchmarks.startup --records 10000 100000 1000000
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from memory_data_store import RETENTION_DEFAULTS, MemoryDataStore
+from models.node import Node
+
+def make_config(directory: str):
+  config = json.load(open('config.json.sample', 'r'))
+  config['paths']['data'] = directory
+  config['server']['start_time'] = datetime.datetime.now(datetime.timezone.utc).astimezone()
+  # keep every record, the point is to load all of them
+  config['server']['retention'] = { name: { 'max_items': None, 'max_age': None } for name in RETENTION_DEFAULTS }
+  return config
+
+def populate(data: MemoryDataStore, records: int):
+  random.seed(1)
+  now = int(time.time())
+  node_ids = [f"{random.randint(0x10000000, 0xfffffff0):08x}" for _ in range(max(10, records // 100))]
+  for id in node_ids:
+    node = Node.default_node(id)
+    node['longname'] = f"Node {id}"
+    node['shortname'] = id[-4:]
+    node['position'] = { 'latitude_i': 385000000 + random.randint(-10**6, 10**6), 'longitude_i': -1214000000 + random.randint(-10**6, 10**6), 'altitude': 100 }
+    data.update_node(id, node)
+
+  for i in range(records):
+    id = random.choice(node_ids)
+    msg = { 'from': id, 'to': 'ffffffff', 'id': i, 'timestamp': now - records + i, 'rssi': random.randint(-130, -40), 'snr': random.uniform(-20, 10), 'topic': 'msh/US/bench/2/e/LongFast/!00000000' }
+    kind = i % 10
+    if kind < 7:
+      msg['type'] = 'telemetry'
+      msg['payload'] = { 'battery_level': random.randint(1, 100), 'voltage': random.uniform(3.3, 4.2), 'channel_utilization': random.uniform(0, 40), 'air_util_tx': random.uniform(0, 5), 'uptime_seconds': random.randint(0, 10**6) }
+      data.add_telemetry(id, msg)
+    elif kind < 8:
+      data.add_chat_message('0', { 'id': i, 'from': id, 'to': 'ffffffff', 'channel': '0', 'text': f"message {i}", 'timestamp': msg['timestamp'], 'hops_away': 1, 'rssi': msg['rssi'], 'snr': msg['snr'] })
+    elif kind < 9:
+      msg['type'] = 'traceroute'
+      msg['payload'] = { 'route': [int(n, 16) for n in random.sample(node_ids, 3)] }
+      data.add_traceroute(id, msg)
+    else:
+      node = data.nodes[id]
+      node['telemetry'] = { 'battery_level': random.randint(1, 100) }
+      data.update_node(id, node)
+
+def timed_load(config, snapshot: bool):
+  data = MemoryDataStore(config)
+  data.storage.snapshot = snapshot
+  start = time.perf_counter()
+  data.load()
+  return time.perf_counter() - start, data
+
+def file_size(path: str):
+  return os.path.getsize(path) / 1024 / 1024 if os.path.exists(path) else 0.0
+
+async def bench(records: int, report):
+  directory = tempfile.mkdtemp(prefix='meshinfo-startup-')
+  try:
+    config = make_config(directory)
+    data = MemoryDataStore(config)
+    populate(data, records)
+    data.storage.snapshot_stale = True # force a full save: JSON files and snapshot
+    await data.data_renderer.render(data)
+
+    json_time, json_data = timed_load(config, snapshot=False)
+    snapshot_time, snapshot_data = timed_load(config, snapshot=True)
+    assert len(json_data.telemetry) == len(snapshot_data.telemetry) == len(data.telemetry)
+    json_bytes = sum(file_size(f"{directory}/{name}.json") for name in ('nodes', 'chat', 'telemetry', 'traceroutes'))
+    snapshot_bytes = file_size(f"{directory}/snapshot.pickle")
+    print(f"{records:>10} {json_time:>9.2f} {snapshot_time:>11.2f} {json_time / snapshot_time:>8.1f}x {json_bytes:>9.1f} {snapshot_bytes:>12.1f}", file=report)
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark MemoryDataStore.load() from JSON and from the snapshot")
+  parser.add_argument("--records", type=int, nargs="+", default=[10000, 100000, 1000000])
+  args = parser.parse_args()
+
+  # load() and save() log a lot, keep the report readable
+  report = sys.stderr
+  print(f"{'records':>10} {'json_s':>9} {'snapshot_s':>11} {'speedup':>9} {'json_mb':>9} {'snapshot_mb':>12}", file=report)
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    for records in args.records:
+      asyncio.run(bench(records, report))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# A week of telemetry from --nodes nodes reporting every --interval seconds (device metrics,
+# environment metrics from a third of them): what the store holds for it in memory with the
+# message histories at their defaults from before the series (50000 messages / 7 days) against
+# the current defaults (5000 / 1 day) plus TelemetrySeries, how much of the week each can chart,
+# and what a week-long chart of one node costs: every message in the range encoded, as
+# /v1/nodes/{id}/telemetry?since= returned them, against ?resolution=auto.
+#
+# Run from the repository root:
+#   python -m benchmarks.telemetry_charts --nodes 200 --interval 300 --days 7
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.nodes_api import percentile
+import encoders
+from memory_data_store import RETENTION_DEFAULTS, MemoryDataStore
+from ring_buffer import RingBuffer
+from telemetry_series import RESOLUTIONS, STORED_ROLLUPS, TelemetrySeries
+
+def messages(args):
+  random.seed(1)
+  now = time.time()
+  ids = [f"{random.getrandbits(32):08x}" for _ in range(args.nodes)]
+  start = now - args.days * 86400
+  for i, id in enumerate(ids):
+    at = start + random.uniform(0, args.interval)
+    battery = random.uniform(20, 100)
+    while at < now:
+      battery = min(100, max(0, battery + random.uniform(-0.5, 0.5)))
+      payload = {
+        'battery_level': round(battery),
+        'voltage': round(3.3 + battery / 100, 3),
+        'channel_utilization': round(random.uniform(0, 30), 2),
+        'air_util_tx': round(random.uniform(0, 5), 3),
+        'uptime_seconds': int(at - start),
+      }
+      if i % 3 == 0:
+        payload.update({ 'temperature': round(random.uniform(-5, 35), 1), 'relative_humidity': round(random.uniform(10, 90), 1), 'barometric_pressure': round(random.uniform(990, 1030), 1) })
+      yield id, { 'from': id, 'to': 'ffffffff', 'type': 'telemetry', 'id': random.getrandbits(32), 'channel': 0, 'sender': id, 'timestamp': int(at), 'payload': payload }, at
+      at += args.interval
+
+# the history defaults before telemetry_series, when charts were drawn from the messages
+OLD_RETENTION = { 'telemetry': { 'max_items': 50000, 'max_age': 7 * 86400 }, 'telemetry_per_node': { 'max_items': 1000, 'max_age': 7 * 86400 } }
+
+def build_histories(items, retention):
+  # as MemoryDataStore keeps them: the per-node histories only hold messages still in the global one
+  now = time.time()
+  history = RingBuffer.from_config(retention['telemetry'])
+  for id, msg, at in items:
+    history.add(msg, at=at)
+  history.prune(now)
+  by_node = {}
+  for msg, at in zip(reversed(history), reversed(history.times)):
+    if msg['from'] not in by_node:
+      by_node[msg['from']] = RingBuffer.from_config(retention['telemetry_per_node'])
+    by_node[msg['from']].add(msg, at=at)
+  for node_history in by_node.values():
+    node_history.prune(now)
+  return history, by_node
+
+def build_series(items):
+  series = TelemetrySeries()
+  for id, msg, at in items:
+    series.add(id, msg, at=at)
+  # as the store's scheduler does
+  series.prune()
+  return series
+
+def measure(build, items):
+  tracemalloc.start()
+  start = time.perf_counter()
+  result = build(items)
+  elapsed = time.perf_counter() - start
+  current, _peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, current, elapsed
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the columnar telemetry series against message histories")
+  parser.add_argument("--nodes", type=int, default=200)
+  parser.add_argument("--interval", type=float, default=300)
+  parser.add_argument("--days", type=float, default=7)
+  parser.add_argument("--requests", type=int, default=50)
+  args = parser.parse_args()
+  report = sys.stderr
+
+  # in the order they arrive, as the histories evict by it
+  items = sorted(messages(args), key=lambda item: item[2])
+  # the messages themselves are counted for the histories, which hold on to them
+  copies = lambda items: ((id, dict(msg, payload=dict(msg['payload'])), at) for id, msg, at in items)
+  (history, by_node), old_bytes, _elapsed = measure(lambda items: build_histories(copies(items), OLD_RETENTION), items)
+  (new_history, _new_by_node), new_history_bytes, _elapsed = measure(lambda items: build_histories(copies(items), RETENTION_DEFAULTS), items)
+  series, series_bytes, series_elapsed = measure(build_series, items)
+  new_bytes = new_history_bytes + series_bytes
+  chart_days = lambda oldest: (time.time() - oldest) / 86400
+  print(f"{len(items)} telemetry messages from {args.nodes} nodes over {args.days} days", file=report)
+  print(f"{'store':<36} {'memory_mb':>10} {'chart_days':>11}", file=report)
+  print(f"{'before: histories (50000 / 7 days)':<36} {old_bytes / 1024 / 1024:>10.1f} {chart_days(history.times[-1]):>11.1f}", file=report)
+  print(f"{'now: histories (5000 / 1 day)':<36} {new_history_bytes / 1024 / 1024:>10.1f}", file=report)
+  print(f"{'now: telemetry series':<36} {series_bytes / 1024 / 1024:>10.1f} {chart_days(min(s.rollups['1h'].starts[0] for metrics in series.nodes.values() for s in metrics.values())):>11.1f}", file=report)
+  print(f"{'now: total':<36} {new_bytes / 1024 / 1024:>10.1f}", file=report)
+  # the rollups keep growing until their retention is reached: 8 bytes per raw sample, 24 per bucket
+  stats = series.stats()
+  steady = stats['series'] * (series.retention['raw'] / args.interval * 8 + sum(series.retention[name] / RESOLUTIONS[name] * 24 for name in STORED_ROLLUPS))
+  retention = ', '.join(f"{name}: {series.retention[name] / 86400:g}d" for name in ('raw',) + STORED_ROLLUPS)
+  print(f"series once every retention is reached ({retention}): {steady / 1024 / 1024:.1f} MB of samples and buckets (estimate)", file=report)
+  print(f"net: {old_bytes / new_bytes:.1f}x less memory; {series_bytes / len(items):.0f} bytes per message as series, {old_bytes / len(history):.0f} as a history entry", file=report)
+  print(f"series built in {series_elapsed:.2f} s ({len(items) / series_elapsed:.0f} messages/s, under tracemalloc)", file=report)
+
+  id = next(iter(by_node.keys()))
+  since = time.time() - args.days * 86400
+  print(f"week-long chart of one node ({len(by_node[id])} messages)", file=report)
+  print(f"{'request':<24} {'p50_ms':>9} {'p99_ms':>9} {'bytes':>10}", file=report)
+  requests = {
+    'messages (?since=)': lambda: { 'telemetry': MemoryDataStore._filter_history(by_node[id], None, since, None, None) },
+    'resolution=auto': lambda: dict(zip(('resolution', 'metrics'), series.query(id, start=since))),
+    'resolution=1h': lambda: dict(zip(('resolution', 'metrics'), series.query(id, start=since, resolution='1h'))),
+  }
+  for name, request in requests.items():
+    times = []
+    for _ in range(args.requests):
+      start = time.perf_counter()
+      body = encoders.dumps(request())
+      times.append(time.perf_counter() - start)
+    print(f"{name:<24} {percentile(times, 0.5) * 1000:>9.2f} {percentile(times, 0.99) * 1000:>9.2f} {len(body):>10}", file=report)
+
+if __name__ == "__main__":
+  main()
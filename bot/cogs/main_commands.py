@@ -28,10 +28,9 @@ class MainCommands(commands.Cog):
             id_hex = flags.node
 
         if id_hex not in self.data.nodes:
-            for node_id, node in self.data.nodes.items():
-                if str(node['shortname']).lower() == flags.node.lower():
-                    id_hex = node_id
-                    break
+            node = self.data.find_node_by_short_name(flags.node, ignore_case=True)
+            if node is not None:
+                id_hex = node['id']
 
         if id_hex not in self.data.nodes:
             print(f"Discord: /lookup: Node {id_hex} not found.")
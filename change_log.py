@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+from collections import deque
+import itertools
+import time
+
+class ChangeLog:
+  """
+  The store version and what changed at each version.
+
+  Every mutation of the store (a node change, a chat message, telemetry or traceroute, a prune)
+  is recorded with the next version. The last max_entries records are kept, so a client that
+  fetched the store at some version can be sent what changed after it.
+
+  Versions start at the start time in microseconds rather than at 0, so they keep increasing
+  across restarts: a version handed out by a previous run is older than anything in the log
+  and gets the client a full snapshot, rather than the wrong changes.
+  """
+  def __init__(self, max_entries: int = 100000, start: int|None = None):
+    self.version = start if start is not None else int(time.time()) * 1000000
+    self.entries: deque[tuple[int, str, object]] = deque(maxlen=max_entries)
+
+  @classmethod
+  def from_config(cls, config):
+    change_log = config['server']['change_log'] if 'change_log' in config['server'] else {}
+    return cls(max_entries=change_log.get('max_entries', 100000))
+
+  def record(self, kind: str, item=None) -> int:
+    self.version += 1
+    self.entries.append((self.version, kind, item))
+    return self.version
+
+  def since(self, version: int, kind: str) -> list|None:
+    """
+    The items of one kind recorded after version, oldest first. None when some of what changed
+    after it is no longer in the log (or the version is not one this log handed out), and the
+    client needs a full snapshot instead.
+    """
+    if version == self.version:
+      return []
+    oldest = self.entries[0][0] if len(self.entries) > 0 else self.version + 1
+    if version > self.version or version + 1 < oldest:
+      return None
+    changed = itertools.islice(self.entries, version + 1 - oldest, None)
+    return [item for _version, entry_kind, item in changed if entry_kind == kind]
+
+  def stats(self) -> dict:
+    return {
+      'version': self.version,
+      'entries': len(self.entries),
+      'oldest': self.entries[0][0] if len(self.entries) > 0 else None,
+    }
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import base64
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from meshtastic import mesh_pb2, portnums_pb2
+
+# the well known default PSK ("AQ=="), see meshtastic Channels.h
+DEFAULT_PSK = bytes([0xd4, 0xf1, 0xbb, 0x3a, 0x20, 0x29, 0x07, 0x59, 0xf0, 0xbc, 0xff, 0xab, 0xcf, 0x4e, 0x69, 0x01])
+
+KNOWN_PORTNUMS = set(portnums_pb2.PortNum.DESCRIPTOR.values_by_number.keys())
+
+def xor_hash(data: bytes) -> int:
+    result = 0
+    for b in data:
+        result ^= b
+    return result
+
+def expand_key(key_bytes: bytes) -> bytes|None:
+    """
+    Expand a configured PSK the way the firmware does: a single byte key is an index
+    into the default key (0 means no encryption, 1 is the default key, 2.. bump the last byte).
+    """
+    if len(key_bytes) == 0:
+        return None
+    if len(key_bytes) == 1:
+        index = key_bytes[0]
+        if index == 0:
+            return None
+        return DEFAULT_PSK[:-1] + bytes([(DEFAULT_PSK[-1] + index - 1) & 0xff])
+    return key_bytes
+
+class ChannelKey:
+    def __init__(self, name: str, channel: str|None, key_bytes: bytes):
+        self.name = name
+        self.channel = channel
+        self.key_bytes = key_bytes
+        self.key_hash = xor_hash(key_bytes)
+        self.algorithm = algorithms.AES(key_bytes)
+
+    def channel_hash(self, channel_name: str) -> int:
+        return xor_hash(channel_name.encode('utf-8')) ^ self.key_hash
+
+class ChannelKeyring:
+    """
+    Channel keys from broker.channels.encryption, decoded once at startup.
+
+    Keys are tried in order of likelihood: the key that last worked for the sending node,
+    keys whose channel hash matches the packet, keys configured for the packet's channel
+    name, then the rest in config order.
+    """
+    def __init__(self, config):
+        channels = config['broker']['channels']
+        self.keys: list[ChannelKey] = []
+        for key_item in channels['encryption']:
+            name = key_item['key_name'] if 'key_name' in key_item else key_item['key']
+            try:
+                key_bytes = expand_key(base64.b64decode(key_item['key'].encode('ascii')))
+            except ValueError:
+                print(f"Skipping channel key {name}: not valid base64")
+                continue
+            if key_bytes is None:
+                continue
+            # a key of any other length cannot be used with AES, skip it rather than fail startup
+            if len(key_bytes) not in (16, 24, 32):
+                print(f"Skipping channel key {name}: {len(key_bytes)} bytes, AES keys are 16, 24 or 32")
+                continue
+            channel = key_item['channel'] if 'channel' in key_item else None
+            self.keys.append(ChannelKey(name, channel, key_bytes))
+
+        self.keys_by_channel: dict[str, list[ChannelKey]] = {}
+        for key in self.keys:
+            for channel_name in (key.channel, key.name):
+                if channel_name is not None and key not in self.keys_by_channel.get(channel_name, []):
+                    self.keys_by_channel.setdefault(channel_name, []).append(key)
+
+        self.node_cache_size = channels['key_cache_size'] if 'key_cache_size' in channels else 1024
+        self.node_cache: OrderedDict[int, ChannelKey] = OrderedDict()
+
+    @staticmethod
+    def channel_name(channel_id: str, topic: str) -> str|None:
+        """
+        Channel name of a packet, from the ServiceEnvelope or else the topic (msh/.../2/e/<channel>/<gateway>).
+        """
+        if channel_id:
+            return channel_id
+        parts = topic.split('/')
+        for i in range(len(parts) - 2):
+            if parts[i] == '2' and parts[i + 1] == 'e':
+                return parts[i + 2]
+        return None
+
+    def candidates(self, node_id: int, channel_name: str|None, channel_hash: int) -> list[ChannelKey]:
+        ordered: list[ChannelKey] = []
+        cached = self.node_cache.get(node_id)
+        if cached is not None:
+            ordered.append(cached)
+        if channel_name is not None:
+            for key in self.keys:
+                if key.channel_hash(channel_name) == channel_hash and key not in ordered:
+                    ordered.append(key)
+            for key in self.keys_by_channel.get(channel_name, []):
+                if key not in ordered:
+                    ordered.append(key)
+        for key in self.keys:
+            if key not in ordered:
+                ordered.append(key)
+        return ordered
+
+    def decrypt(self, mp, channel_name: str|None, debug: bool = False):
+        """
+        Decrypt the encrypted payload of a MeshPacket. Returns the decoded mesh_pb2.Data or None.
+        """
+        # a malformed packet can fail anywhere from the nonce to the parse; like any wrong key,
+        # that is a packet we could not decrypt, not an error for the ingest worker
+        node_id = getattr(mp, "from")
+        try:
+            nonce = getattr(mp, "id").to_bytes(8, "little") + node_id.to_bytes(8, "little")
+        except Exception as e:
+            if debug:
+                print(f"*** Decryption failed: {str(e)}")
+            return None
+        encrypted = getattr(mp, "encrypted")
+        for key in self.candidates(node_id, channel_name, mp.channel):
+            if debug:
+                print(f"Attempting decryption with key: {key.name}")
+            data = mesh_pb2.Data()
+            try:
+                decryptor = Cipher(key.algorithm, modes.CTR(nonce), backend=default_backend()).decryptor()
+                decrypted_bytes = decryptor.update(encrypted) + decryptor.finalize()
+                data.ParseFromString(decrypted_bytes)
+            except Exception as e:
+                if debug:
+                    print(f"*** Decryption failed: {str(e)}")
+                continue
+            # a wrong key sometimes still parses, reject anything that is not a real packet
+            if data.portnum == portnums_pb2.UNKNOWN_APP or data.portnum not in KNOWN_PORTNUMS:
+                if debug:
+                    print(f"*** Decryption failed: implausible portnum {data.portnum}")
+                continue
+            self.remember(node_id, key)
+            return data
+        return None
+
+    def remember(self, node_id: int, key: ChannelKey):
+        self.node_cache[node_id] = key
+        self.node_cache.move_to_end(node_id)
+        while len(self.node_cache) > self.node_cache_size:
+            self.node_cache.popitem(last=False)
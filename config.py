@@ -1,4 +1,5 @@
 
+import copy
 import datetime
 import json
 import uuid
@@ -25,23 +26,29 @@ class Config:
     with open(path, 'r') as f:
       return json.load(f)
 
+  # never published, wherever they turn up in the config
+  SECRET_KEYS = { 'dsn', 'password', 'token', 'api_key' }
+
   @classmethod
   def cleanse(cls, config):
-    config_clean = config.copy()
+    # a deep copy: filtering removes keys, and the nested dicts are the live config's
+    config_clean = copy.deepcopy(config)
+    # paths into the config; an empty dict removes the key, a non-empty one filters inside it
     blacklist = {
-        "config": {
-            "broker": {
-                "password": {},
-                "username": {},
+        "broker": {
+            "password": {},
+            "username": {},
+        },
+        "integrations": {
+            "discord": {
+                "token": {},
+            },
+            "postgres": {
+                "dsn": {},
             },
-            "integrations": {
-                "discord": {
-                    "token": {},
-                },
-                "geocoding": {
-                    "geocode.maps.co": {
-                        "api_key": {},
-                    }
+            "geocoding": {
+                "geocode.maps.co": {
+                    "api_key": {},
                 }
             }
         }
@@ -49,10 +56,25 @@ class Config:
 
     def recursive_filter_dict(d, blacklist):
         for key, value in list(d.items()):
-            if key in blacklist:
+            if key not in blacklist:
+                continue
+            if len(blacklist[key]) == 0:
+                del d[key]
+            elif isinstance(value, dict):
+                recursive_filter_dict(value, blacklist[key])
+
+    def remove_secrets(d):
+        for key, value in list(d.items()):
+            if key in cls.SECRET_KEYS:
                 del d[key]
             elif isinstance(value, dict):
-                recursive_filter_dict(value, blacklist[key] if key in blacklist else {})
+                remove_secrets(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        remove_secrets(item)
 
     recursive_filter_dict(config_clean, blacklist)
+    # and any secret the blacklist does not name yet
+    remove_secrets(config_clean)
     return config_clean
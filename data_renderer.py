@@ -1,40 +1,95 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
+import copy
+import itertools
 
-from encoders import _JSONEncoder
+HISTORIES = ['telemetry', 'traceroutes']
 
 class DataRenderer:
-  def __init__(self, config, data):
+  """
+  Persists the store through its storage backend (see storage/).
+
+  Each save hands the backend what changed since the previous save: nodes that were updated
+  and history items that were added. When the backend asks for it (e.g. to compact its
+  journals) a full copy of the store is included as well.
+  """
+  def __init__(self, config, storage):
     self.config = config
-    self.data = data
+    self.storage = storage
+    self.node_version: int = 0
+    self.histories: dict = {}
+
+  async def render(self, data):
+    # collect the changes on the event loop, so the store is not mutated while we read it
+    changes, persisted = self.prepare(data)
+    await asyncio.to_thread(self.storage.save, changes)
+    # only now are the changes in storage; if the save failed they are sent again next time
+    self.node_version, self.histories = persisted
+
+  def mark_persisted(self, data):
+    """
+    Treat the current state of the store as saved, e.g. right after loading it.
+    """
+    self.node_version, self.histories = self.persisted_state(data)
+
+  def persisted_state(self, data):
+    return data.change_counter, { key: (history, history.added) for key, history in self.tracked_histories(data).items() }
+
+  @staticmethod
+  def tracked_histories(data):
+    histories = { name: getattr(data, name) for name in HISTORIES }
+    for channel_id, channel in data.chat['channels'].items():
+      histories[f"chat/{channel_id}"] = channel['messages']
+    return histories
 
-  async def render(self):
-      await asyncio.to_thread(self._render)
+  def prepare(self, data):
+    histories = self.tracked_histories(data)
+    full = self.storage.wants_full_save()
+    for key, history in histories.items():
+      if key in self.histories and self.histories[key][0] is not history:
+        full = True # history replaced (e.g. reloaded), what was added to it is unknown
 
-  def _render(self):
-    self.save_file("chat.json", self.data.chat)
-    print(f"Saved {len(self.data.chat['channels']['0']['messages'])} chat messages to file ({self.config['paths']['data']}/chat.json)")
+    changes = {
+      'nodes': { id: copy.deepcopy(data.nodes[id]) if id in data.nodes else None for id in data.changed_nodes_since(self.node_version) if self.valid_id(id) },
+      'chat': [],
+      'full': None,
+    }
+    for channel_id, channel in data.chat['channels'].items():
+      for message in self.new_items(f"chat/{channel_id}", channel['messages']):
+        changes['chat'].append({ 'channel': channel_id, 'name': channel['name'], 'message': message })
+    for name in HISTORIES:
+      changes[name] = self.new_items(name, histories[name])
 
-    nodes = {}
-    for id, node in self.data.nodes.items():
-        if id.startswith('!'):
-          id = id.replace('!', '')
-        if len(id) != 8: # 8 hex chars required, if not, we abandon it
-          continue
-        nodes[id] = node
+    if full:
+      # shallow RingBuffer copies share the items, so the per-node indexes keep pointing at the same dicts
+      changes['full'] = {
+        'nodes': { id: copy.deepcopy(node) for id, node in data.nodes.items() if self.valid_id(id) },
+        'chat': { 'channels': { channel_id: { 'name': channel['name'], 'messages': channel['messages'].copy() } for channel_id, channel in data.chat['channels'].items() } },
+      }
+      for name in HISTORIES:
+        changes['full'][name] = histories[name].copy()
+        changes['full'][f"{name}_by_node"] = { id: history.copy() for id, history in getattr(data, f"{name}_by_node").items() }
+      # only the pickle snapshot keeps the series, other backends rebuild them from the telemetry
+      changes['full']['telemetry_series'] = data.telemetry_series.copy()
 
-    self.save_file("nodes.json", nodes)
-    print(f"Saved {len(nodes)} nodes to file ({self.config['paths']['data']}/nodes.json)")
+    return changes, self.persisted_state(data)
 
-    self.save_file("telemetry.json", self.data.telemetry)
-    print(f"Saved {len(self.data.telemetry)} telemetry to file ({self.config['paths']['data']}/telemetry.json)")
+  def new_items(self, key, history):
+    """
+    Items added to a newest-first history since the last save, oldest first.
+    """
+    if key in self.histories and self.histories[key][0] is not history:
+      return []
+    added = history.added - self.histories[key][1] if key in self.histories else history.added
+    return list(reversed(list(itertools.islice(history, min(added, len(history))))))
 
-    self.save_file("traceroutes.json", self.data.traceroutes)
-    print(f"Saved {len(self.data.traceroutes)} traceroutes to file ({self.config['paths']['data']}/traceroutes.json)")
+  def pending_items(self, key, history):
+    """
+    Items added to a newest-first history that have not been saved yet, newest first.
+    """
+    return list(reversed(self.new_items(key, history)))
 
-  def save_file(self, filename, data):
-    print(f"Saving {filename}")
-    with open(f"{self.config['paths']['data']}/{filename}", "w", encoding='utf-8') as f:
-      json.dump(data, f, indent=2, sort_keys=True, cls=_JSONEncoder)
+  @staticmethod
+  def valid_id(id: str):
+    return len(id.replace('!', '')) == 8 # 8 hex chars required, if not, we abandon it
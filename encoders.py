@@ -1,16 +1,42 @@
 #!/usr/bin/env python3
 
+from collections import deque
 import datetime
+import decimal
 import json
 
+import orjson
+
 class _JSONEncoder(json.JSONEncoder):
   def default(self, obj):
     if isinstance(obj, datetime.datetime):
       return obj.astimezone().isoformat()
     if isinstance(obj, datetime.timedelta):
       return None
+    if isinstance(obj, deque):
+      return list(obj)
     return obj
 
+def _orjson_default(obj):
+  # orjson handles datetimes, dataclasses and tuples itself; timedeltas as seconds, like jsonable_encoder
+  if isinstance(obj, datetime.timedelta):
+    return obj.total_seconds()
+  if isinstance(obj, (deque, set, frozenset)):
+    return list(obj)
+  if isinstance(obj, decimal.Decimal):
+    return float(obj)
+  if isinstance(obj, bytes):
+    return obj.decode('utf-8', errors='replace')
+  raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj) -> bytes:
+  """
+  Compact JSON bytes for API responses, encoded in one pass without building the intermediate
+  copy jsonable_encoder makes. Output matches jsonable_encoder + json.dumps for the store's data;
+  numpy arrays (the telemetry series) are encoded natively.
+  """
+  return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
 class _JSONDecoder(json.JSONDecoder):
   def __init__(self, *args, **kwargs):
     json.JSONDecoder.__init__(
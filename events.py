@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import asyncio
+from collections import deque
+import itertools
+
+import encoders
+
+TOPICS = ('nodes', 'chat', 'telemetry', 'traceroutes', 'messages')
+
+class Event:
+  """
+  One change pushed to subscribers. The server-sent event frame is encoded on first delivery
+  and shared by every subscriber and replay after that.
+  """
+  __slots__ = ('id', 'topic', 'data', '_frame')
+
+  def __init__(self, id: int, topic: str, data):
+    self.id = id
+    self.topic = topic
+    self.data = data
+    self._frame: bytes|None = None
+
+  def frame(self) -> bytes:
+    if self._frame is None:
+      self._frame = b"id: %d\nevent: %s\ndata: %s\n\n" % (self.id, self.topic.encode(), encoders.dumps(self.data))
+    return self._frame
+
+class Subscriber:
+  """
+  Events waiting to be sent to one client. The buffer is bounded: a client that falls more than
+  buffer_size events behind loses them and is told to resync instead.
+  """
+  def __init__(self, topics: set[str], buffer_size: int):
+    self.topics = topics
+    self.buffer_size = buffer_size
+    self.buffer: deque[Event] = deque()
+    self.overflowed = False
+    self.ready = asyncio.Event()
+
+  def push(self, event: Event):
+    if self.overflowed:
+      return
+    if len(self.buffer) >= self.buffer_size:
+      self.buffer.clear()
+      self.overflowed = True
+    else:
+      self.buffer.append(event)
+    self.ready.set()
+
+  async def next(self) -> list[Event]|None:
+    """
+    The events buffered since the last call, waiting for at least one. None if some were lost
+    and the client has to resync.
+    """
+    await self.ready.wait()
+    self.ready.clear()
+    if self.overflowed:
+      self.overflowed = False
+      return None
+    events = list(self.buffer)
+    self.buffer.clear()
+    return events
+
+class EventHub:
+  """
+  Pushes store changes to subscribers (the /v1/events stream): node changes, chat messages,
+  telemetry, traceroutes and packets.
+
+  Every event gets the next id. The last `replay` events are kept, so a client that reconnects
+  with the last id it saw gets what it missed, or a resync if that is no longer available.
+  Changes to a node are coalesced: however often a packet touches a node, one event with its
+  state at the end of that event loop iteration is published.
+
+  Nothing is published before start(), so loading the store does not fill the replay log.
+  """
+  def __init__(self, config, get_node=None):
+    events = config['server']['events'] if 'events' in config['server'] else {}
+    self.enabled = events.get('enabled', True)
+    self.buffer_size = events.get('buffer_size', 1000)
+    self.keepalive = events.get('keepalive', 15)
+    self.log: deque[Event] = deque(maxlen=events.get('replay', 10000))
+    self.last_id = 0
+    self.subscribers: set[Subscriber] = set()
+    self.get_node = get_node
+    self.pending_nodes: dict[str, None] = {}
+    self.loop: asyncio.AbstractEventLoop|None = None
+    self.published = 0
+    self.resyncs = 0
+
+  def start(self):
+    if self.enabled:
+      self.loop = asyncio.get_running_loop()
+
+  def publish(self, topic: str, data):
+    if self.loop is None:
+      return
+    self.last_id += 1
+    event = Event(self.last_id, topic, data)
+    self.log.append(event)
+    self.published += 1
+    for subscriber in self.subscribers:
+      if topic in subscriber.topics:
+        subscriber.push(event)
+
+  def node_changed(self, id: str):
+    if self.loop is None:
+      return
+    if len(self.pending_nodes) == 0:
+      self.loop.call_soon(self.flush_nodes)
+    self.pending_nodes[id] = None
+
+  def flush_nodes(self):
+    pending = self.pending_nodes
+    self.pending_nodes = {}
+    for id in pending.keys():
+      # None: the node was removed
+      self.publish('nodes', { 'id': id, 'node': self.get_node(id) })
+
+  def subscribe(self, topics: set[str], since: int|None = None) -> tuple[Subscriber, list[Event]|None]:
+    """
+    Register a subscriber and return it with the events after since (on its topics) it missed,
+    or None when they are no longer all in the log (or since is from before a restart) and the
+    client has to resync. Without since there is nothing to replay.
+    """
+    subscriber = Subscriber(topics, self.buffer_size)
+    self.subscribers.add(subscriber)
+    if since is None or since == self.last_id:
+      return subscriber, []
+    oldest = self.log[0].id if len(self.log) > 0 else self.last_id + 1
+    if since > self.last_id or since + 1 < oldest:
+      self.resyncs += 1
+      return subscriber, None
+    missed = itertools.islice(self.log, since + 1 - oldest, None)
+    return subscriber, [event for event in missed if event.topic in topics]
+
+  def unsubscribe(self, subscriber: Subscriber):
+    self.subscribers.discard(subscriber)
+
+  def stats(self) -> dict:
+    return {
+      'enabled': self.loop is not None,
+      'subscribers': len(self.subscribers),
+      'last_id': self.last_id,
+      'published': self.published,
+      'replay_log': len(self.log),
+      'resyncs': self.resyncs,
+    }
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
-from math import asin, cos, radians, sin, sqrt
+from math import asin, cos, degrees, radians, sin, sqrt
+
+import numpy
 
 
 def distance_between_two_points(lat1, lon1, lat2, lon2):
@@ -18,3 +20,83 @@ def distance_between_two_points(lat1, lon1, lat2, lon2):
     distance = radius * c  # Distance in kilometers
 
     return distance
+
+
+def distances_between_points(lat1, lon1, lat2, lon2):
+    # distance_between_two_points over numpy arrays (or scalars, broadcast against them) in one
+    # pass; km, NaN where a coordinate is NaN
+    lat1, lon1, lat2, lon2 = (numpy.radians(numpy.asarray(x, dtype=numpy.float64)) for x in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = numpy.sin(dlat / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin(dlon / 2) ** 2
+    # rounding can take a just past 1 for antipodal points
+    c = 2 * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    return 6371 * c
+
+
+def bounding_box(lat, lon, radius_km):
+    # (south, west, north, east) in degrees of the circle of radius_km around a point; west > east
+    # when it crosses the antimeridian, all longitudes when it reaches a pole
+    angle = radius_km / 6371
+    south = max(-90.0, lat - degrees(angle))
+    north = min(90.0, lat + degrees(angle))
+    if south == -90.0 or north == 90.0 or sin(angle) >= cos(radians(lat)):
+        return south, -180.0, north, 180.0
+    dlon = degrees(asin(sin(angle) / cos(radians(lat))))
+    west = lon - dlon if lon - dlon >= -180 else lon - dlon + 360
+    east = lon + dlon if lon + dlon <= 180 else lon + dlon - 360
+    return south, west, north, east
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude, longitude, precision=7):
+    # Standard base32 geohash; precision 7 is a cell of roughly 150m x 150m
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    cell = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(cell) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(cell)
+
+
+def geohash_center(cell):
+    # Center (latitude, longitude) of a geohash cell
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for c in cell:
+        bits = GEOHASH_ALPHABET.index(c)
+        for shift in range(4, -1, -1):
+            bit = (bits >> shift) & 1
+            if even:
+                lon_range[bit ^ 1] = (lon_range[0] + lon_range[1]) / 2
+            else:
+                lat_range[bit ^ 1] = (lat_range[0] + lat_range[1]) / 2
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
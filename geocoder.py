@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import os
+import time
+import traceback
+
+import aiohttp
+
+import geo
+from ingest import LatencyStats
+
+
+class GeocodingStats:
+    def __init__(self):
+        self.lookups = 0
+        self.cache_hits = 0
+        self.queued = 0
+        self.dropped = 0
+        self.requests = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.queue_depth = 0
+        self.cache_size = 0
+        self.queue_wait = LatencyStats()
+        self.request = LatencyStats()
+
+    def to_dict(self):
+        return {
+            'lookups': self.lookups,
+            'cache_hits': self.cache_hits,
+            'cache_hit_ratio': round(self.cache_hits / self.lookups, 3) if self.lookups > 0 else None,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'requests': self.requests,
+            'failed': self.failed,
+            'rate_limited': self.rate_limited,
+            'queue_depth': self.queue_depth,
+            'cache_size': self.cache_size,
+            'queue_wait': self.queue_wait.to_dict(),
+            'request': self.request.to_dict(),
+        }
+
+
+class Geocoder:
+    """
+    Reverse geocoding off the event loop's critical path.
+
+    lookup() answers from a cache keyed by geohash cell, so nearby and repeated positions never
+    hit the network, and otherwise queues the cell. run() works through the queue with aiohttp
+    at no more than rate_limit requests per second and hands each result to the callback.
+    The cache is persisted to geocoding-cache.json in the data directory.
+    """
+    def __init__(self, config, callback=None):
+        geocoding = config['integrations']['geocoding'] if 'geocoding' in config['integrations'] else {}
+        self.enabled = geocoding.get('enabled', False)
+        self.provider = geocoding['provider'] if 'provider' in geocoding else 'geocode.maps.co'
+        provider_config = geocoding[self.provider] if self.provider in geocoding else {}
+        self.api_key = provider_config.get('api_key')
+        self.base_url = provider_config.get('url', 'https://geocode.maps.co')
+        self.rate_limit = geocoding.get('rate_limit', 1)
+        self.precision = geocoding.get('precision', 7)
+        self.cache_ttl = geocoding.get('cache_ttl', 30 * 86400)
+        self.queue_size = geocoding.get('queue_size', 1000)
+        self.save_interval = geocoding.get('save_interval', 60)
+        self.timeout = geocoding.get('timeout', 10)
+        self.cache_path = f"{config['paths']['data']}/geocoding-cache.json"
+
+        self.callback = callback
+        self.stats = GeocodingStats()
+        self.cache: dict[str, dict] = {}
+        self.cache_dirty = False
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # cell -> node ids waiting for it, so a cell is only queued once
+        self.pending: dict[str, set[str]] = {}
+
+    def cell(self, latitude: float, longitude: float) -> str:
+        return geo.geohash(latitude, longitude, self.precision)
+
+    def lookup(self, node_id: str, latitude: float, longitude: float):
+        """
+        Cached result for the position's cell, or None after queueing the cell for run().
+        """
+        self.stats.lookups += 1
+        cell = self.cell(latitude, longitude)
+        cached = self.cache.get(cell)
+        if cached is not None and (self.cache_ttl <= 0 or time.time() - cached['at'] < self.cache_ttl):
+            self.stats.cache_hits += 1
+            return cached['geocoded']
+
+        if cell in self.pending:
+            self.pending[cell].add(node_id)
+            return None
+        try:
+            self.queue.put_nowait((cell, time.monotonic()))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            return None
+        self.pending[cell] = { node_id }
+        self.stats.queued += 1
+        self.stats.queue_depth = self.queue.qsize()
+        return None
+
+    async def run(self):
+        if not self.enabled:
+            return
+        interval = 1 / self.rate_limit if self.rate_limit > 0 else 0
+        next_request = 0.0
+        last_save = time.monotonic()
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                while True:
+                    try:
+                        cell, enqueued = await asyncio.wait_for(self.queue.get(), timeout=self.save_interval)
+                    except asyncio.TimeoutError:
+                        cell = None
+                    if cell is not None:
+                        self.stats.queue_depth = self.queue.qsize()
+                        now = time.monotonic()
+                        if now < next_request:
+                            await asyncio.sleep(next_request - now)
+                        self.stats.queue_wait.observe(time.monotonic() - enqueued)
+                        next_request = await self.geocode(session, cell, interval)
+
+                    if self.cache_dirty and time.monotonic() - last_save >= self.save_interval:
+                        await asyncio.to_thread(self.save_cache, dict(self.cache))
+                        last_save = time.monotonic()
+        finally:
+            if self.cache_dirty:
+                self.save_cache(dict(self.cache))
+
+    async def geocode(self, session, cell: str, interval: float) -> float:
+        """
+        Geocode one cell. Returns the earliest time (monotonic) of the next request.
+        """
+        latitude, longitude = geo.geohash_center(cell)
+        url = f"{self.base_url}/reverse"
+        params = { 'lat': f"{latitude:.6f}", 'lon': f"{longitude:.6f}" }
+        if self.api_key:
+            params['api_key'] = self.api_key
+        start = time.monotonic()
+        self.stats.requests += 1
+        try:
+            async with session.get(url, params=params) as response:
+                self.stats.request.observe(time.monotonic() - start)
+                if response.status == 429:
+                    self.stats.rate_limited += 1
+                    retry_after = float(response.headers.get('Retry-After', 5))
+                    print(f"Geocoding rate limited, backing off {retry_after} seconds")
+                    self.requeue(cell)
+                    return time.monotonic() + max(retry_after, interval)
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                geocoded = await response.json(content_type=None)
+        except Exception as e:
+            self.stats.failed += 1
+            # dropped, the next position update from one of these nodes queues the cell again
+            self.pending.pop(cell, None)
+            print(f"Failed to geocode {cell}: {e}")
+            return time.monotonic() + interval
+
+        # nodes that looked this cell up while the request was in flight are included
+        node_ids = self.pending.pop(cell, set())
+        self.cache[cell] = { 'geocoded': geocoded, 'at': time.time() }
+        self.cache_dirty = True
+        self.stats.cache_size = len(self.cache)
+        print(f"Geocoded {cell} ({latitude:.5f}, {longitude:.5f}) for {len(node_ids)} nodes")
+        if self.callback is not None:
+            try:
+                self.callback(cell, node_ids, geocoded)
+            except Exception as e:
+                print(f"Failed to apply geocoding for {cell}: {e}")
+                traceback.print_exc()
+        return time.monotonic() + interval
+
+    def requeue(self, cell: str):
+        try:
+            self.queue.put_nowait((cell, time.monotonic()))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            self.pending.pop(cell, None)
+
+    ### cache file
+
+    def load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding='utf-8') as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Failed to load geocoding cache: {e}")
+            return
+        self.stats.cache_size = len(self.cache)
+        print(f"Loaded {len(self.cache)} geocoded cells from {self.cache_path}")
+
+    def save_cache(self, cache: dict):
+        self.cache_dirty = False
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(f"{self.cache_path}.tmp", "w", encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(f"{self.cache_path}.tmp", self.cache_path)
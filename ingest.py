@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+import traceback
+
+
+class LatencyStats:
+    """
+    Running latency aggregate (count/avg/max/last) for a single pipeline stage.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count > 0 else None,
+            'max_ms': round(self.max * 1000, 3),
+            'last_ms': round(self.last * 1000, 3),
+        }
+
+
+class IngestStats:
+    """
+    Counters for the MQTT ingest pipeline, shared with the data store so the
+    save scheduler and the API can report on it.
+    """
+    def __init__(self):
+        self.queue_size = 0
+        self.queue_depth = 0
+        self.queue_depth_max = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.stages = {
+            'queue_wait': LatencyStats(),
+            'process': LatencyStats(),
+            'save': LatencyStats(),
+        }
+
+    def to_dict(self):
+        return {
+            'queue_size': self.queue_size,
+            'queue_depth': self.queue_depth,
+            'queue_depth_max': self.queue_depth_max,
+            'received': self.received,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'backpressure_waits': self.backpressure_waits,
+            'stages': { name: stage.to_dict() for name, stage in self.stages.items() },
+        }
+
+
+class IngestPipeline:
+    """
+    Bounded work queue between the MQTT read loop and the message decoders.
+
+    The read loop only calls put(); a pool of workers drains the queue and
+    hands each message to the handler. When the queue is full the overflow
+    policy decides what happens: "block" waits for room (backpressure on the
+    broker connection), "drop_oldest" evicts the oldest queued message and
+    "drop" discards the incoming one.
+    """
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop')
+
+    def __init__(self, config, stats: IngestStats, handler):
+        ingest_config = config['broker']['ingest'] if 'ingest' in config['broker'] else {}
+        self.queue_size = ingest_config.get('queue_size', 10000)
+        self.workers = max(1, ingest_config.get('workers', 1))
+        self.overflow = ingest_config.get('overflow', 'block')
+        if self.overflow not in self.OVERFLOW_POLICIES:
+            print(f"Unknown ingest overflow policy {self.overflow}, using block")
+            self.overflow = 'block'
+
+        self.stats = stats
+        self.stats.queue_size = self.queue_size
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+    async def put(self, item):
+        self.stats.received += 1
+        entry = (time.monotonic(), item)
+        if self.queue.full():
+            if self.overflow == 'drop':
+                self.stats.dropped += 1
+                return
+            elif self.overflow == 'drop_oldest':
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.stats.dropped += 1
+            else:
+                self.stats.backpressure_waits += 1
+                await self.queue.put(entry)
+                self._update_depth()
+                return
+        self.queue.put_nowait(entry)
+        self._update_depth()
+
+    async def run(self):
+        print(f"Starting {self.workers} ingest worker(s) (queue size: {self.queue_size}, overflow: {self.overflow})")
+        async with asyncio.TaskGroup() as tg:
+            for i in range(self.workers):
+                tg.create_task(self.worker(i))
+
+    async def worker(self, worker_id: int):
+        while True:
+            enqueued_at, item = await self.queue.get()
+            self._update_depth()
+            self.stats.stages['queue_wait'].observe(time.monotonic() - enqueued_at)
+            start = time.monotonic()
+            try:
+                await self.handler(item)
+            except Exception as e:
+                self.stats.failed += 1
+                print(f"*** Ingest worker {worker_id} failed to process message: {str(e)}")
+                traceback.print_exc()
+            finally:
+                self.stats.stages['process'].observe(time.monotonic() - start)
+                self.stats.processed += 1
+                self.queue.task_done()
+
+    def _update_depth(self):
+        depth = self.queue.qsize()
+        self.stats.queue_depth = depth
+        if depth > self.stats.queue_depth_max:
+            self.stats.queue_depth_max = depth
@@ -14,12 +14,6 @@ from config import Config
 from memory_data_store import MemoryDataStore
 from mqtt import MQTT
 
-load_dotenv()
-
-config = Config.load()
-data = MemoryDataStore(config)
-data.update('mqtt_connect_time', datetime.datetime.now(ZoneInfo(config['server']['timezone'])))
-
 async def main():
     global config
     global data
@@ -41,18 +35,34 @@ async def main():
 
     data.load()
     await data.save()
+    # from here on store changes are pushed to /v1/events subscribers
+    data.events.start()
     # await data.backup()
 
     async with asyncio.TaskGroup() as tg:
         loop = asyncio.get_event_loop()
         api_server = api.API(config, data)
         tg.create_task(api_server.serve(loop))
+        tg.create_task(data.run_save_scheduler())
+        if data.postgres.enabled:
+            tg.create_task(data.postgres.run())
+        if data.geocoder.enabled:
+            tg.create_task(data.geocoder.run())
         if config['broker']['enabled'] is True:
             mqtt = MQTT(config, data)
+            tg.create_task(mqtt.ingest.run())
+            tg.create_task(mqtt.message_log.run())
             tg.create_task(mqtt.connect())
         if config['integrations']['discord']['enabled'] is True:
             bot = discord_bot.DiscordBot(command_prefix="!", intents=discord.Intents.all(), config=config, data=data)
             tg.create_task(bot.start_server())
 
 if __name__ == "__main__":
+    # only when run as a program: render worker processes import this module too (as __mp_main__)
+    load_dotenv()
+
+    config = Config.load()
+    data = MemoryDataStore(config)
+    data.update('mqtt_connect_time', datetime.datetime.now(ZoneInfo(config['server']['timezone'])))
+
     asyncio.run(main())
@@ -1,20 +1,69 @@
 #!/usr/bin/env python3
 
+import asyncio
 import copy
-from datetime import datetime, timedelta
+from datetime import datetime
 import glob
 import json
 import os
 import shutil
+import time
+import traceback
 from zoneinfo import ZoneInfo
 import aiohttp
 
+from change_log import ChangeLog
 from data_renderer import DataRenderer
 from encoders import _JSONDecoder
+from events import EventHub
+from geocoder import Geocoder
+from ingest import IngestStats
+from mesh_graph import MeshGraph
 from models.node import Node
-from static_html_renderer import StaticHTMLRenderer
+from node_index import NodeIndex
+from ring_buffer import RingBuffer
+from static_html_renderer import RenderState, StaticHTMLRenderer
+from telemetry_series import TelemetrySeries
+from storage.base import QueryableStorage, Storage, create_storage
+from storage.db.postgres import PostgresWriter
 import utils
 
+# default bounds for the in-memory histories, overridable per key in server.retention
+RETENTION_DEFAULTS = {
+  'chat': { 'max_items': 5000, 'max_age': 30 * 86400 },
+  'messages': { 'max_items': 5000, 'max_age': 86400 },
+  'mqtt_messages': { 'max_items': 5000, 'max_age': 86400 },
+  # the messages, for the telemetry log and /v1/telemetry; charts read telemetry_series, which keeps far longer
+  'telemetry': { 'max_items': 5000, 'max_age': 86400 },
+  'telemetry_per_node': { 'max_items': 100, 'max_age': 86400 },
+  'traceroutes': { 'max_items': 10000, 'max_age': 7 * 86400 },
+  'traceroutes_per_node': { 'max_items': 200, 'max_age': 7 * 86400 },
+}
+
+# rows returned by storage backed queries when no limit is given
+QUERY_LIMIT_DEFAULT = 1000
+
+class DataSnapshot:
+  """
+  Read-only view of the store handed to the renderers, which run in worker threads.
+  Built copy-on-write by MemoryDataStore.snapshot(): only nodes and histories that
+  changed since the previous snapshot are copied, everything else is shared.
+  """
+  def __init__(self, config):
+    self.config = config
+    self.chat: dict = { 'channels': {} }
+    self.graph: dict|None = {}
+    self.mesh: MeshGraph = MeshGraph()
+    # what the pages are rendered from: per node change numbers and the version of every other input
+    self.node_versions: dict[str, int] = {}
+    self.versions: dict = {}
+    self.messages: list = []
+    self.mqtt_messages: list = []
+    self.mqtt_connect_time: datetime|None = None
+    self.nodes: dict = {}
+    self.telemetry: list = []
+    self.traceroutes: list = []
+
 class MemoryDataStore:
   def __init__(self, config):
     self.config = config
@@ -22,39 +71,387 @@ class MemoryDataStore:
     self.chat['channels'] = {
         '0': {
             'name': 'General',
-            'messages': []
+            'messages': self.new_history('chat')
         }
     }
     self.graph: dict|None = {}
-    self.messages: list = []
-    self.mqtt_messages: list = []
+    self.ingest_stats: IngestStats = IngestStats()
+    self.mesh: MeshGraph = MeshGraph()
+    self.postgres: PostgresWriter = PostgresWriter(config)
+    self.geocoder: Geocoder = Geocoder(config, callback=self.apply_geocoding)
+    self.events: EventHub = EventHub(config, get_node=lambda id: self.nodes.get(id))
+    self.messages: RingBuffer = self.new_history('messages')
+    self.mqtt_messages: RingBuffer = self.new_history('mqtt_messages')
     self.mqtt_connect_time: datetime = self.config['server']['start_time']
     self.nodes: dict = {}
-    self.telemetry: list = []
-    self.telemetry_by_node: dict = {}
-    self.traceroutes: list = []
-    self.traceroutes_by_node: dict = {}
+    self.telemetry: RingBuffer = self.new_history('telemetry')
+    self.telemetry_by_node: dict[str, RingBuffer] = {}
+    self.telemetry_series: TelemetrySeries = TelemetrySeries.from_config(config)
+    self.traceroutes: RingBuffer = self.new_history('traceroutes')
+    self.traceroutes_by_node: dict[str, RingBuffer] = {}
+
+    # change tracking: every node mutation gets the next change number
+    self.change_counter: int = 0
+    self.node_versions: dict[str, int] = {}
+    # the store version, stamped on every mutation, and what changed at each (for ?since_version= deltas)
+    self.changes: ChangeLog = ChangeLog.from_config(config)
+    self.storage: Storage = create_storage(config)
+    self.data_renderer = DataRenderer(config, self.storage)
+    self._snapshot_version: int = 0
+    self._snapshot_nodes: dict = {}
+    self._snapshot_histories: dict = {}
+    self._snapshot_mesh: MeshGraph|None = None
+    self.render_state: RenderState = RenderState()
+
+    # secondary indexes, kept in sync with every node mutation by index_node() (as is self.mesh)
+    self.nodes_by_longname: dict[str, set[str]] = {}
+    self.nodes_by_shortname: dict[str, set[str]] = {} # keyed by lowercased shortname
+    self._indexed: dict[str, tuple] = {}
+    self.node_index: NodeIndex = NodeIndex()
 
   def update(self, key, value):
     self.__dict__[key] = value
 
+  ### change tracking
+
+  def mark_node_dirty(self, id: str):
+    self.change_counter += 1
+    self.node_versions[id] = self.change_counter
+    self.index_node(id)
+    self.changes.record('nodes', id)
+    self.events.node_changed(id)
+
+  def mark_all_nodes_dirty(self):
+    # the node table may have been replaced wholesale (e.g. on load), rebuild the indexes from scratch
+    self.nodes_by_longname = {}
+    self.nodes_by_shortname = {}
+    self._indexed = {}
+    self.node_index.clear()
+    self.mesh.clear()
+    for id in self.nodes.keys():
+      self.mark_node_dirty(id)
+
+  ### secondary indexes
+
+  def index_node(self, id: str):
+    """
+    Bring the name indexes, the query index and the mesh graph up to date for one node (added, changed or removed).
+    """
+    node = self.nodes.get(id)
+    if node is not None:
+      last_seen = node['last_seen'].timestamp() if isinstance(node.get('last_seen'), datetime) else None
+      self.mesh.set_neighbors(id, self._neighbors(node), updated=last_seen)
+      self.node_index.update(id, node)
+      entry = (node.get('longname'), str(node.get('shortname')).lower())
+    else:
+      self.mesh.remove_node(id)
+      self.node_index.remove(id)
+      entry = None
+    previous = self._indexed.get(id)
+    if entry == previous:
+      return
+
+    if previous is not None:
+      self._unindex(self.nodes_by_longname, previous[0], id)
+      self._unindex(self.nodes_by_shortname, previous[1], id)
+    if entry is None:
+      self._indexed.pop(id, None)
+      return
+    self._indexed[id] = entry
+    self.nodes_by_longname.setdefault(entry[0], set()).add(id)
+    self.nodes_by_shortname.setdefault(entry[1], set()).add(id)
+
+  @staticmethod
+  def _unindex(index: dict[str, set[str]], key, id: str):
+    ids = index.get(key)
+    if ids is not None:
+      ids.discard(id)
+      if len(ids) == 0:
+        del index[key]
+
+  @staticmethod
+  def _neighbors(node) -> dict[str, float|None]:
+    """
+    The neighbors a node reported in its neighborinfo, {hex id: snr}.
+    """
+    if 'neighborinfo' not in node or not node['neighborinfo'] or 'neighbors' not in node['neighborinfo'] or not node['neighborinfo']['neighbors']:
+      return {}
+    neighbors = {}
+    for neighbor in node['neighborinfo']['neighbors']:
+      if 'node_id' not in neighbor or neighbor['node_id'] is None:
+        continue
+      if isinstance(neighbor['node_id'], int):
+        neighbor_id = utils.convert_node_id_from_int_to_hex(neighbor['node_id'])
+      else:
+        neighbor_id = str(neighbor['node_id']).replace('!', '')
+      neighbors[neighbor_id] = neighbor['snr'] if 'snr' in neighbor else None
+    return neighbors
+
+  def changed_nodes_since(self, version: int) -> list[str]:
+    return [id for id, v in self.node_versions.items() if v > version]
+
+  def snapshot(self) -> DataSnapshot:
+    """
+    Copy-on-write snapshot for the renderers. Nodes changed since the last snapshot are deep
+    copied, histories are copied to lists only when their version moved.
+    """
+    for id in self.changed_nodes_since(self._snapshot_version):
+      if id in self.nodes:
+        self._snapshot_nodes[id] = copy.deepcopy(self.nodes[id])
+      else:
+        self._snapshot_nodes.pop(id, None)
+    self._snapshot_version = self.change_counter
+
+    snapshot = DataSnapshot(self.config)
+    snapshot.nodes = { id: self._snapshot_nodes[id] for id in self.nodes.keys() }
+    snapshot.node_versions = { id: self.node_versions.get(id, 0) for id in self.nodes.keys() }
+    snapshot.graph = self.graph
+    if self._snapshot_mesh is None or self._snapshot_mesh.version != self.mesh.version:
+      self._snapshot_mesh = self.mesh.copy()
+    snapshot.mesh = self._snapshot_mesh
+    snapshot.mqtt_connect_time = self.mqtt_connect_time
+    snapshot.messages = self._snapshot_history('messages', self.messages)
+    snapshot.mqtt_messages = self._snapshot_history('mqtt_messages', self.mqtt_messages)
+    snapshot.telemetry = self._snapshot_history('telemetry', self.telemetry)
+    snapshot.traceroutes = self._snapshot_history('traceroutes', self.traceroutes)
+    for channel_id, channel in self.chat['channels'].items():
+      snapshot.chat['channels'][channel_id] = {
+        'name': channel['name'],
+        'messages': self._snapshot_history(f'chat/{channel_id}', channel['messages']),
+      }
+    snapshot.versions = self.data_versions()
+    return snapshot
+
+  def data_versions(self) -> dict:
+    """
+    Version of each part of the store, for readers that cache what they derive from it (the
+    static renderer, the API response cache). A part changed when its version did.
+    """
+    return {
+      'nodes': self.change_counter,
+      'mesh': self.mesh.version,
+      'chat': tuple((channel_id, channel['messages'].version) for channel_id, channel in self.chat['channels'].items()),
+      'messages': self.messages.version,
+      'mqtt_messages': self.mqtt_messages.version,
+      'mqtt_connect_time': self.mqtt_connect_time,
+      'telemetry': self.telemetry.version,
+      'traceroutes': self.traceroutes.version,
+    }
+
+  def _snapshot_history(self, key: str, history: RingBuffer) -> list:
+    cached = self._snapshot_histories.get(key)
+    if cached is None or cached[0] is not history or cached[1] != history.version:
+      cached = (history, history.version, list(history))
+      self._snapshot_histories[key] = cached
+    return cached[2]
+
+  ### histories
+
+  def retention(self, name: str) -> dict:
+    retention = RETENTION_DEFAULTS[name].copy()
+    if 'retention' in self.config['server'] and name in self.config['server']['retention']:
+      retention.update(self.config['server']['retention'][name])
+    return retention
+
+  def new_history(self, name: str, items=()) -> RingBuffer:
+    return RingBuffer.from_config(self.retention(name), items, item_time=self._item_time)
+
+  @staticmethod
+  def _item_time(item):
+    return utils.message_timestamp(item)
+
+  def add_chat_message(self, channel: str, chat: dict, at: float|None = None):
+    if channel not in self.chat['channels']:
+      self.chat['channels'][channel] = {
+        'name': f'Channel {channel}',
+        'messages': self.new_history('chat')
+      }
+    self.chat['channels'][channel]['messages'].add(chat, at=at)
+    self.changes.record('chat', (channel, chat))
+    self.events.publish('chat', { 'channel': channel, 'name': self.chat['channels'][channel]['name'], 'message': chat })
+
+  def add_telemetry(self, id: str, msg: dict, at: float|None = None):
+    evicted = self.telemetry.add(msg, at=at)
+    self._evict_from_index(self.telemetry_by_node, evicted)
+    if id not in self.telemetry_by_node:
+      self.telemetry_by_node[id] = self.new_history('telemetry_per_node')
+    self.telemetry_by_node[id].add(msg, at=at)
+    self.telemetry_series.add(id, msg, at=at)
+    self.changes.record('telemetry', msg)
+    self.events.publish('telemetry', msg)
+
+  def add_traceroute(self, id: str, msg: dict, at: float|None = None):
+    evicted = self.traceroutes.add(msg, at=at)
+    self._evict_from_index(self.traceroutes_by_node, evicted)
+    if id not in self.traceroutes_by_node:
+      self.traceroutes_by_node[id] = self.new_history('traceroutes_per_node')
+    self.traceroutes_by_node[id].add(msg, at=at)
+    self.changes.record('traceroutes', msg)
+    self.events.publish('traceroutes', msg)
+
+  @staticmethod
+  def _evict_from_index(by_node: dict, evicted: dict|None):
+    # keep the per-node index a subset of the global history, so it cannot hold on to evicted messages
+    if evicted is None or evicted.get('from') not in by_node:
+      return
+    history = by_node[evicted['from']]
+    if len(history) > 0 and history[-1] is evicted:
+      history.drop_oldest()
+      if len(history) == 0:
+        del by_node[evicted['from']]
+
+  ### queries
+
+  def query_nodes(self, days: int = 7, ids: list[str]|None = None, longname: str|None = None, shortname: str|None = None, status: str|None = None,
+                  bbox: tuple[float, float, float, float]|None = None, near: tuple[float, float, float]|None = None,
+                  limit: int|None = None, cursor: tuple[float, str]|None = None, fields: list[str]|None = None) -> tuple[dict, tuple|None]:
+    """
+    Nodes seen within the last days (whole days, as days_since_datetime counts them), most
+    recently seen first, and the cursor of the next page. bbox and near restrict them to an
+    area (see NodeIndex.query()). fields limits each node to those keys.
+    """
+    after = time.time() - (days + 1) * 86400
+    matches, next_cursor = self.node_index.query(after=after, ids=ids, longname=longname, shortname=shortname, status=status, bbox=bbox, near=near,
+                                                 limit=limit, cursor=cursor)
+    if fields is None:
+      return { id: self.nodes[id] for id in matches }, next_cursor
+    return { id: { field: self.nodes[id][field] for field in fields if field in self.nodes[id] } for id in matches }, next_cursor
+
+  def node_changes(self, version: int, fields: list[str]|None = None) -> dict:
+    """
+    The nodes changed after a store version and the ids of those removed since, or every node
+    (full) when the change log no longer reaches back that far.
+    """
+    changed = self.changes.since(version, 'nodes')
+    ids = list(dict.fromkeys(changed)) if changed is not None else list(self.nodes.keys())
+    nodes = {}
+    removed = []
+    for id in ids:
+      if id not in self.nodes:
+        removed.append(id)
+      elif fields is None:
+        nodes[id] = self.nodes[id]
+      else:
+        nodes[id] = { field: self.nodes[id][field] for field in fields if field in self.nodes[id] }
+    return { 'version': self.changes.version, 'full': changed is None, 'nodes': nodes, 'removed': removed, 'count': len(nodes) }
+
+  def chat_changes(self, version: int) -> dict:
+    """
+    Chat messages added after a store version per channel, newest first, or all of them (full).
+    """
+    changed = self.changes.since(version, 'chat')
+    if changed is None:
+      added = [(channel_id, message) for channel_id, channel in self.chat['channels'].items() for message in reversed(channel['messages'])]
+    else:
+      added = changed
+    channels = {}
+    for channel_id, message in reversed(added):
+      if channel_id not in channels:
+        channels[channel_id] = { 'name': self.chat['channels'][channel_id]['name'], 'messages': [] }
+      channels[channel_id]['messages'].append(message)
+    return { 'version': self.changes.version, 'full': changed is None, 'channels': channels }
+
+  def telemetry_changes(self, version: int) -> dict:
+    """
+    Telemetry added after a store version, newest first, or all that is held in memory (full).
+    """
+    changed = self.changes.since(version, 'telemetry')
+    telemetry = list(reversed(changed)) if changed is not None else list(self.telemetry)
+    return { 'version': self.changes.version, 'full': changed is None, 'telemetry': telemetry }
+
+  async def query_telemetry(self, node_id: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    """
+    Telemetry newest first, optionally for one node and a time range (epoch seconds).
+    """
+    match = (lambda msg: msg.get('from') == node_id) if node_id is not None else None
+    if isinstance(self.storage, QueryableStorage):
+      pending = self.data_renderer.pending_items('telemetry', self.telemetry)
+      return await self._query_storage(self.storage.query_telemetry, pending, match, since, until, limit, node_id=node_id)
+    history = self.telemetry_by_node.get(node_id, []) if node_id is not None else self.telemetry
+    return self._filter_history(history, None, since, until, limit)
+
+  async def query_traceroutes(self, node_id: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    """
+    Traceroutes newest first, optionally from or to one node and a time range (epoch seconds).
+    """
+    match = (lambda msg: msg.get('from') == node_id or msg.get('to') == node_id) if node_id is not None else None
+    if isinstance(self.storage, QueryableStorage):
+      pending = self.data_renderer.pending_items('traceroutes', self.traceroutes)
+      return await self._query_storage(self.storage.query_traceroutes, pending, match, since, until, limit, node_id=node_id)
+    return self._filter_history(self.traceroutes, match, since, until, limit)
+
+  async def query_chat(self, node_id: str|None = None, channel: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    """
+    Chat messages newest first, optionally from or to one node, on one channel and in a time range (epoch seconds).
+    """
+    match = (lambda msg: msg.get('from') == node_id or msg.get('to') == node_id) if node_id is not None else None
+    channels = [channel] if channel is not None else list(self.chat['channels'].keys())
+    if isinstance(self.storage, QueryableStorage):
+      pending = []
+      for channel_id in channels:
+        if channel_id in self.chat['channels']:
+          pending.extend(self.data_renderer.pending_items(f"chat/{channel_id}", self.chat['channels'][channel_id]['messages']))
+      return await self._query_storage(self.storage.query_chat, pending, match, since, until, limit, node_id=node_id, channel=channel)
+    messages = []
+    for channel_id in channels:
+      if channel_id in self.chat['channels']:
+        messages.extend(self._filter_history(self.chat['channels'][channel_id]['messages'], match, since, until, limit))
+    return messages[:limit] if limit is not None else messages
+
+  async def _query_storage(self, query, pending, match, since, until, limit, **kwargs):
+    # items added since the last save are not in storage yet, put them in front
+    pending = self._filter_history(pending, match, since, until, limit)
+    limit = limit if limit is not None else QUERY_LIMIT_DEFAULT
+    stored = await asyncio.to_thread(query, since=since, until=until, limit=limit, **kwargs)
+    return (pending + stored)[:limit]
+
+  @staticmethod
+  def _filter_history(history, match, since: float|None, until: float|None, limit: int|None) -> list:
+    items = []
+    for item in history:
+      if match is not None and not match(item):
+        continue
+      if since is not None or until is not None:
+        at = utils.message_timestamp(item)
+        if at is None or (since is not None and at < since) or (until is not None and at > until):
+          continue
+      items.append(item)
+      if limit is not None and len(items) >= limit:
+        break
+    return items
+
+  def prune_histories(self):
+    """
+    Drop history entries that are past their max_age, and per-node indexes that are left empty.
+    """
+    now = time.time()
+    dropped = 0
+    for channel in self.chat['channels'].values():
+      dropped += channel['messages'].prune(now)
+    dropped += self.messages.prune(now)
+    dropped += self.mqtt_messages.prune(now)
+    dropped += self.telemetry.prune(now)
+    dropped += self.traceroutes.prune(now)
+    for by_node in (self.telemetry_by_node, self.traceroutes_by_node):
+      for id in list(by_node.keys()):
+        by_node[id].prune(now)
+        if len(by_node[id]) == 0:
+          del by_node[id]
+    self.telemetry_series.prune(now)
+    if dropped > 0:
+      self.changes.record('prune', dropped)
+
   def update_node(self, id: str, node):
     n = node.copy()
     if n['position'] is None:
       n['position'] = {}
 
-    if self.config['integrations']['geocoding']['enabled']:
-      if 'geocoded' not in n['position']:
-        n['position']['geocoded'] = None
-      if 'latitude_i' in n['position'] and 'longitude_i' in n['position'] and n['position']['latitude_i'] is not None and n['position']['longitude_i'] is not None:
-        if n['position']['geocoded'] is None or n['position']['last_geocoding'] is None or n['position']['last_geocoding'] < datetime.now().astimezone(ZoneInfo(self.config['server']['timezone'])) - timedelta(minutes=60):
-          try:
-            geocoded = utils.geocode_position(self.config['integrations']['geocoding']['geocode.maps.co']['api_key'], n['position']['latitude_i'] / 10000000, n['position']['longitude_i'] / 10000000)
-            if geocoded is not None:
-              n['position']['geocoded'] = geocoded
-              n['position']['last_geocoding'] = datetime.now().astimezone(ZoneInfo(self.config['server']['timezone']))
-          except Exception as e:
-            print(f"Failed to geocode position: {e}")
+    if self.geocoder.enabled and 'latitude_i' in n['position'] and 'longitude_i' in n['position'] and n['position']['latitude_i'] is not None and n['position']['longitude_i'] is not None:
+      # answered from the cache, or queued and filled in later by apply_geocoding()
+      geocoded = self.geocoder.lookup(id, n['position']['latitude_i'] / 10000000, n['position']['longitude_i'] / 10000000)
+      if geocoded is not None:
+        n['position']['geocoded'] = geocoded
+        n['position']['last_geocoding'] = datetime.now().astimezone(ZoneInfo(self.config['server']['timezone']))
 
     n['active'] = True
     if 'last_seen' in n and n['last_seen'] is not None and isinstance(n['last_seen'], str):
@@ -62,31 +459,39 @@ class MemoryDataStore:
     n['since'] = datetime.now().astimezone(ZoneInfo(self.config['server']['timezone'])) - n['last_seen']
     n['last_seen'] = datetime.now().astimezone(ZoneInfo(self.config['server']['timezone']))
     self.nodes[id] = n
+    self.mark_node_dirty(id)
+
+  def apply_geocoding(self, cell: str, node_ids: set[str], geocoded: dict):
+    """
+    Geocoder callback: store the result on the nodes that asked for it and are still in that cell.
+    """
+    for id in node_ids:
+      if id not in self.nodes or self.nodes[id]['position'] is None:
+        continue
+      position = self.nodes[id]['position']
+      if 'latitude_i' not in position or 'longitude_i' not in position or position['latitude_i'] is None or position['longitude_i'] is None:
+        continue
+      if self.geocoder.cell(position['latitude_i'] / 10000000, position['longitude_i'] / 10000000) != cell:
+        continue
+      position['geocoded'] = geocoded
+      position['last_geocoding'] = datetime.now().astimezone(ZoneInfo(self.config['server']['timezone']))
+      self.mark_node_dirty(id)
 
   def load(self):
-    try:
-      nodes = self.load_json_file(f"{self.config['paths']['data']}/nodes.json")
-      if nodes is not None:
-        for id, node in nodes.items():
-          if id.startswith('!'):
-            id = id.replace('!', '')
-          if len(id) != 8: # 8 hex chars required, if not, we abandon it
-             continue
-          if node['active'] is None:
-            node['active'] = False
-          if 'last_seen' not in node:
-            node['last_seen'] = None
-          if 'since' not in node:
-            node['since'] = None
-          nodes[id] = node
-        self.nodes = nodes
-      print(f"Loaded {len(self.nodes)} existing nodes from file ({self.config['paths']['data']}/nodes.json)")
-    except FileNotFoundError:
-      self.nodes = {}
+    start = time.monotonic()
+    if self.geocoder.enabled:
+      self.geocoder.load_cache()
+    snapshot = self.storage.load_snapshot()
+    if snapshot is not None:
+      self.restore_snapshot(snapshot)
+    else:
+      self.load_from_storage()
+
     if self.config['server']['node_id'] not in self.nodes:
       self.nodes[self.config['server']['node_id']] = Node.default_node(self.config['server']['node_id'])
     self.nodes['ffffffff'] = Node.default_node('ffffffff')
 
+    # before the indexes are rebuilt, so they see the overridden positions
     try:
       nodes_overrides: dict|None = self.load_json_file(f"{self.config['paths']['data']}/nodes-overrides.json")
       if nodes_overrides is not None:
@@ -102,58 +507,136 @@ class MemoryDataStore:
     except FileNotFoundError:
       pass
 
+    self.mark_all_nodes_dirty()
+    self.data_renderer.mark_persisted(self)
+    print(f"Loaded data in {round(time.monotonic() - start, 2)} seconds")
+
+  def normalize_loaded_nodes(self, nodes: dict) -> dict:
+    for id, node in list(nodes.items()):
+      if id.startswith('!'):
+        id = id.replace('!', '')
+      if len(id) != 8: # 8 hex chars required, if not, we abandon it
+         continue
+      if node['active'] is None:
+        node['active'] = False
+      if 'last_seen' not in node:
+        node['last_seen'] = None
+      if 'since' not in node:
+        node['since'] = None
+      nodes[id] = node
+    return nodes
+
+  def restore_snapshot(self, snapshot: dict):
+    """
+    Restore the histories and per-node indexes from a binary snapshot, then replay what was
+    journaled after it was written.
+    """
+    self.nodes = snapshot['nodes']
+    self.chat = snapshot['chat']
+    self.telemetry = snapshot['telemetry']
+    self.telemetry_by_node = snapshot['telemetry_by_node']
+    self.traceroutes = snapshot['traceroutes']
+    self.traceroutes_by_node = snapshot['traceroutes_by_node']
+
+    # retention may have changed since the snapshot was written
+    for channel in self.chat['channels'].values():
+      channel['messages'] = self._apply_retention('chat', channel['messages'])
+    for name in ('telemetry', 'traceroutes'):
+      history = self._apply_retention(name, getattr(self, name))
+      by_node = getattr(self, f"{name}_by_node")
+      per_node = self.retention(f"{name}_per_node")
+      if history is not getattr(self, name) or any(h.maxlen != per_node['max_items'] or h.max_age != per_node['max_age'] for h in by_node.values()):
+        by_node = {}
+        for msg in reversed(history):
+          if msg['from'] not in by_node:
+            by_node[msg['from']] = self.new_history(f"{name}_per_node")
+          by_node[msg['from']].add(msg, at=self._item_time(msg))
+      setattr(self, name, history)
+      setattr(self, f"{name}_by_node", by_node)
+
+    # the series outlive the telemetry history, rebuild them from it only when the snapshot has none
+    self.telemetry_series = TelemetrySeries.from_config(self.config)
+    if 'telemetry_series' in snapshot:
+      self.telemetry_series.nodes = snapshot['telemetry_series'].nodes
+    else:
+      self.telemetry_series.add_history(self.telemetry)
+
+    journal = snapshot['journal']
+    for entry in journal['nodes']:
+      if entry['node'] is None:
+        self.nodes.pop(entry['id'], None)
+      else:
+        self.nodes[entry['id']] = entry['node']
+    self.normalize_loaded_nodes(self.nodes)
+    for entry in journal['chat']:
+      if entry['channel'] not in self.chat['channels']:
+        self.chat['channels'][entry['channel']] = { 'name': entry['name'], 'messages': self.new_history('chat') }
+      self.add_chat_message(entry['channel'], entry['message'], at=self._item_time(entry['message']))
+    for msg in journal['telemetry']:
+      self.add_telemetry(msg['from'], msg, at=self._item_time(msg))
+    for msg in journal['traceroutes']:
+      self.add_traceroute(msg['from'], msg, at=self._item_time(msg))
+    print(f"Restored {len(self.nodes)} nodes, {len(self.telemetry)} telemetry, {len(self.traceroutes)} traceroutes from snapshot (+{sum(len(entries) for entries in journal.values())} journal entries)")
+
+  def _apply_retention(self, name: str, history: RingBuffer) -> RingBuffer:
+    retention = self.retention(name)
+    if history.maxlen == retention['max_items'] and history.max_age == retention['max_age']:
+      return history
+    return self.new_history(name, history)
+
+  def load_from_storage(self):
+    try:
+      nodes = self.storage.load_nodes()
+      if nodes is not None:
+        self.nodes = self.normalize_loaded_nodes(nodes)
+      print(f"Loaded {len(self.nodes)} existing nodes from storage")
+    except FileNotFoundError:
+      self.nodes = {}
     try:
-      chat = self.load_json_file(f"{self.config['paths']['data']}/chat.json")
+      chat = self.storage.load_chat(limit=self.retention('chat')['max_items'])
       if chat is not None:
+        for channel in chat['channels'].values():
+          channel['messages'] = self.new_history('chat', channel['messages'])
         self.chat = chat
-      print(f"Loaded {len(self.chat['channels']['0']['messages'])} chat messages from file ({self.config['paths']['data']}/chat.json)")
+      print(f"Loaded {len(self.chat['channels']['0']['messages'])} chat messages from storage")
     except FileNotFoundError:
       self.chat = {
           'channels': {
               '0': {
                 'name': 'General',
-                'messages': []
+                'messages': self.new_history('chat')
               }
           }
       }
 
+    self.telemetry_by_node = {}
     try:
-      telemetry = self.load_json_file(f"{self.config['paths']['data']}/telemetry.json")
-      if telemetry is not None:
-        self.telemetry = telemetry
-      else:
-        self.telemetry = []
-      if self.telemetry_by_node is None or len(self.telemetry_by_node) == 0:
-        self.telemetry_by_node = {}
-      for msg in self.telemetry:
+      telemetry = self.storage.load_telemetry(limit=self.retention('telemetry')['max_items'])
+      self.telemetry = self.new_history('telemetry', telemetry if telemetry is not None else [])
+      for msg in reversed(self.telemetry):
         id = msg['from']
         if id not in self.telemetry_by_node:
-          self.telemetry_by_node[id] = []
-        self.telemetry_by_node[id].insert(0, msg)
-      print(f"Loaded {len(self.telemetry)} telemetry messages from file ({self.config['paths']['data']}/telemetry.json)")
+          self.telemetry_by_node[id] = self.new_history('telemetry_per_node')
+        self.telemetry_by_node[id].add(msg, at=self._item_time(msg))
+      print(f"Loaded {len(self.telemetry)} telemetry messages from storage")
       print(f"Loaded telemetry data for {len(self.telemetry_by_node)} nodes")
+      self.telemetry_series.add_history(self.telemetry)
     except FileNotFoundError:
-      self.telemetry = []
-      self.telemetry_by_node = {}
+      self.telemetry = self.new_history('telemetry')
 
+    self.traceroutes_by_node = {}
     try:
-        traceroutes = self.load_json_file(f"{self.config['paths']['data']}/traceroutes.json")
-        if traceroutes is not None:
-          self.traceroutes = traceroutes
-        else:
-          self.traceroutes = []
-        if self.traceroutes_by_node is None or len(self.traceroutes_by_node) == 0:
-          self.traceroutes_by_node = {}
-        for msg in self.traceroutes:
+        traceroutes = self.storage.load_traceroutes(limit=self.retention('traceroutes')['max_items'])
+        self.traceroutes = self.new_history('traceroutes', traceroutes if traceroutes is not None else [])
+        for msg in reversed(self.traceroutes):
           id = msg['from']
           if id not in self.traceroutes_by_node:
-            self.traceroutes_by_node[id] = []
-          self.traceroutes_by_node[id].insert(0, msg)
-        print(f"Loaded {len(self.traceroutes)} traceroutes from file ({self.config['paths']['data']}/traceroutes.json)")
+            self.traceroutes_by_node[id] = self.new_history('traceroutes_per_node')
+          self.traceroutes_by_node[id].add(msg, at=self._item_time(msg))
+        print(f"Loaded {len(self.traceroutes)} traceroutes from storage")
         print(f"Loaded traceroutes data for {len(self.traceroutes_by_node)} nodes")
     except FileNotFoundError:
-        self.traceroutes = []
-        self.traceroutes_by_node = {}
+        self.traceroutes = self.new_history('traceroutes')
 
   def load_json_file(self, filename):
     if os.path.exists(filename):
@@ -163,6 +646,23 @@ class MemoryDataStore:
     else:
         return None
 
+  async def run_save_scheduler(self):
+    """
+    Run save() on its own task so persistence and rendering never block MQTT ingest.
+    save() decides for itself which of data/render/enrich/backup are due.
+    """
+    intervals = self.config['server']['intervals']
+    interval = intervals['scheduler'] if 'scheduler' in intervals else 1
+    while True:
+      await asyncio.sleep(interval)
+      start = time.monotonic()
+      try:
+        self.prune_histories()
+        await self.save()
+      except Exception as e:
+        print(f"Save failed: {e}")
+        traceback.print_exc()
+      self.ingest_stats.stages['save'].observe(time.monotonic() - start)
 
   async def save(self):
     save_start = datetime.now(ZoneInfo(self.config['server']['timezone']))
@@ -184,15 +684,14 @@ class MemoryDataStore:
         self.config['server']['last_backfill'] = end
 
     if since_last_data >= self.config['server']['intervals']['data_save']:
-        data_renderer = DataRenderer(self.config, copy.deepcopy(self))
-        await data_renderer.render()
+        await self.data_renderer.render(self)
         end = datetime.now(ZoneInfo(self.config['server']['timezone']))
         print(f"Saved json data in {round(end.timestamp() - save_start.timestamp(), 2)} seconds")
         self.config['server']['last_data_save'] = end
         self.graph = self.graph_node(self.config['server']['node_id'])
 
     if since_last_render >= self.config['server']['intervals']['render']:
-        static_html_renderer = StaticHTMLRenderer(self.config, copy.deepcopy(self))
+        static_html_renderer = StaticHTMLRenderer(self.config, self.snapshot(), self.render_state)
         await static_html_renderer.render()
         end = datetime.now(ZoneInfo(self.config['server']['timezone']))
         print(f"Rendered in {round(end.timestamp() - save_start.timestamp(), 2)} seconds")
@@ -265,6 +764,7 @@ class MemoryDataStore:
                       node['shortname'] = node_info['shortName']
                       node['longname'] = node_info['longName']
                       self.nodes[node_id] = node
+                      self.mark_node_dirty(node_id)
                 else:
                     print(f"Failed to get info for {node_id}")
             except Exception as e:
@@ -284,6 +784,7 @@ class MemoryDataStore:
                     node['shortname'] = node_info['shortName']
                     node['longname'] = node_info['longName']
                     self.nodes[node_id] = node
+                    self.mark_node_dirty(node_id)
               else:
                   print(f"Failed to get info for {node_ids}")
           except Exception as e:
@@ -305,71 +806,55 @@ class MemoryDataStore:
 
     if include_neighbors:
       neighbors_heard = []
-      if 'neighborinfo' in node and node['neighborinfo'] is not None and  'neighbors' in node['neighborinfo'] and len(node['neighborinfo']['neighbors']) > 0:
-        for neighbor in node['neighborinfo']['neighbors']:
-          nn = self.find_node_by_hex_id(utils.convert_node_id_from_int_to_hex(neighbor["node_id"]), include_neighbors=False)
-          if nn is not None:
-            neighbors_heard.append(nn.copy())
+      for nid in self.mesh.heard(id).keys():
+        nn = self.find_node_by_hex_id(nid, include_neighbors=False)
+        if nn is not None:
+          neighbors_heard.append(nn.copy())
 
       neighbors_heard_by = []
-      for nid, n in self.nodes.items():
-        if 'neighborinfo' in n and n['neighborinfo'] is not None and 'neighbors' in n['neighborinfo'] and len(n['neighborinfo']['neighbors']) > 0:
-          if id in n['neighborinfo']['neighbors']:
-            nn = self.find_node_by_hex_id(utils.convert_node_id_from_int_to_hex(nid), include_neighbors=False)
-            if nn is not None:
-              neighbors_heard_by.append(nn.copy())
+      for nid in self.mesh.heard_by(id).keys():
+        nn = self.find_node_by_hex_id(nid, include_neighbors=False)
+        if nn is not None:
+          neighbors_heard_by.append(nn.copy())
 
       node['neighbors_heard'] = neighbors_heard
       node['neighbors_heard_by'] = neighbors_heard_by
     return node
 
-  def find_node_by_short_name(self, sn: str):
-    for _id, node in self.nodes.items():
-      if node['shortname'] == sn:
-        return node
+  def find_node_by_short_name(self, sn: str, ignore_case: bool = False):
+    for id in self.nodes_by_shortname.get(str(sn).lower(), ()):
+      if id in self.nodes and (ignore_case or self.nodes[id]['shortname'] == sn):
+        return self.nodes[id]
     return None
 
   def find_node_by_longname(self, ln: str):
-    for _id, node in self.nodes.items():
-      if node['longname'] == ln:
-        return node
+    for id in self.nodes_by_longname.get(ln, ()):
+      if id in self.nodes:
+        return self.nodes[id]
     return None
 
   def graph_node(self, node_id: str) -> dict|None:
-    if self.config['debug']:
-        print(f"Graphing node: {node_id}")
-
-    visited = set()  # Set to keep track of visited nodes
-
-    def recursive_graph_node(node_id, start_id="", level=0) -> dict|None:
-        node = self.find_node_by_hex_id(node_id, include_neighbors=True)
-        if node is None:
-            return None
-
-        if level > 1 and node_id in visited:
-            return node  # Return the node if it has already been visited
-
-        if self.config['debug']:
-          print("%s - %s" % ("  " * level, node_id))
-
-        visited.add(node_id)  # Mark the node as visited
-
-        neighbors_heard = []
-        neighbors_heard_by = []
-
-        if node['neighborinfo'] and node['neighborinfo']['neighbors']:
-            # print(f"Node {node_id} has {len(node['neighborinfo']['neighbors'])} neighbors")
-            for neighbor in node['neighborinfo']['neighbors']:
-                nid = utils.convert_node_id_from_int_to_hex(neighbor["node_id"])
-                if start_id is not None and start_id == nid or (self.config['server']['graph']['max_depth'] is not None and level >= self.config['server']['graph']['max_depth']):
-                    continue
-                nn = recursive_graph_node(nid, start_id=start_id, level=level+1)
-                if nn is not None:
-                    neighbors_heard.append(nn.copy())
-
-        node['neighbors_heard'] = neighbors_heard
-        node['neighbors_heard_by'] = neighbors_heard_by
-
-        return node
-
-    return recursive_graph_node(node_id, start_id=node_id)
+    """
+    Tree of the mesh as heard from node_id, breadth first up to server.graph.max_depth hops.
+    Every node appears once, under the neighbor it is reached through first.
+    """
+    if node_id not in self.nodes:
+      return None
+    subgraph = self.mesh.bfs(node_id, self.config['server']['graph']['max_depth'])
+    tree = {}
+    for id, depth in subgraph['depth'].items():
+      node = self.nodes.get(id)
+      tree[id] = {
+        'id': id,
+        'shortname': node['shortname'] if node is not None else None,
+        'longname': node['longname'] if node is not None else None,
+        'depth': depth,
+        'snr': None,
+        'neighbors_heard': [],
+        'neighbors_heard_by': [{ 'id': heard_by_id, 'snr': edge.snr } for heard_by_id, edge in self.mesh.heard_by(id).items()],
+      }
+    for id, children in subgraph['children'].items():
+      for child_id, snr in children:
+        tree[child_id]['snr'] = snr
+        tree[id]['neighbors_heard'].append(tree[child_id])
+    return tree[node_id]
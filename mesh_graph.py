@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+from collections import deque
+from typing import NamedTuple
+
+class Edge(NamedTuple):
+  snr: float|None
+  updated: float|None # when the reporting node last sent neighborinfo with this edge
+
+class MeshGraph:
+  """
+  Adjacency lists of the mesh as reported by neighborinfo: forward[a][b] is the edge "a heard b",
+  reverse[b][a] the same edge seen from b.
+
+  set_neighbors() replaces the edges one node reports. version only moves when an edge is added,
+  removed or its SNR changes, so subgraphs cached by bfs() stay valid across repeated reports of
+  the same neighbors.
+  """
+  def __init__(self):
+    self.forward: dict[str, dict[str, Edge]] = {}
+    self.reverse: dict[str, dict[str, Edge]] = {}
+    self.version = 0
+    self._subgraphs: dict[tuple, tuple[int, dict]] = {}
+
+  def __len__(self):
+    return sum(len(edges) for edges in self.forward.values())
+
+  def set_neighbors(self, node_id: str, neighbors: dict[str, float|None], updated: float|None = None) -> bool:
+    """
+    Replace the edges reported by node_id with neighbors ({neighbor id: snr}). Returns True if
+    the graph changed.
+    """
+    current = self.forward.get(node_id, {})
+    changed = current.keys() != neighbors.keys() or any(current[id].snr != snr for id, snr in neighbors.items())
+    if not changed:
+      if updated is not None:
+        for id in current.keys():
+          edge = current[id]._replace(updated=updated)
+          current[id] = edge
+          self.reverse[id][node_id] = edge
+      return False
+
+    for id in current.keys():
+      self._remove_reverse(id, node_id)
+    if len(neighbors) == 0:
+      self.forward.pop(node_id, None)
+    else:
+      edges = {}
+      for id, snr in neighbors.items():
+        edge = Edge(snr, updated)
+        edges[id] = edge
+        self.reverse.setdefault(id, {})[node_id] = edge
+      self.forward[node_id] = edges
+    self.version += 1
+    return True
+
+  def remove_node(self, node_id: str) -> bool:
+    """
+    Drop the edges node_id reported. Edges other nodes reported to it stay until they report again.
+    """
+    return self.set_neighbors(node_id, {})
+
+  def clear(self):
+    self.forward = {}
+    self.reverse = {}
+    self.version += 1
+    self._subgraphs = {}
+
+  def _remove_reverse(self, id: str, node_id: str):
+    edges = self.reverse.get(id)
+    if edges is not None:
+      edges.pop(node_id, None)
+      if len(edges) == 0:
+        del self.reverse[id]
+
+  def heard(self, node_id: str) -> dict[str, Edge]:
+    return self.forward.get(node_id, {})
+
+  def heard_by(self, node_id: str) -> dict[str, Edge]:
+    return self.reverse.get(node_id, {})
+
+  def bfs(self, root: str, max_depth: int|None = None) -> dict:
+    """
+    Breadth-first spanning tree over heard edges from root, at most max_depth hops deep.
+    Returns { 'depth': {id: hops}, 'children': {id: [(child id, snr), ...]} }, cached until the
+    graph changes.
+    """
+    key = (root, max_depth)
+    cached = self._subgraphs.get(key)
+    if cached is not None and cached[0] == self.version:
+      return cached[1]
+
+    depth = { root: 0 }
+    children: dict[str, list] = {}
+    queue = deque([root])
+    while len(queue) > 0:
+      id = queue.popleft()
+      if max_depth is not None and depth[id] >= max_depth:
+        continue
+      for neighbor_id, edge in self.forward.get(id, {}).items():
+        if neighbor_id in depth:
+          continue
+        depth[neighbor_id] = depth[id] + 1
+        children.setdefault(id, []).append((neighbor_id, edge.snr))
+        queue.append(neighbor_id)
+
+    subgraph = { 'depth': depth, 'children': children }
+    self._subgraphs[key] = (self.version, subgraph)
+    return subgraph
+
+  def copy(self):
+    """
+    Copy for readers on another thread (the renderers). Edges are immutable, so only the
+    adjacency dicts are copied.
+    """
+    graph = MeshGraph()
+    graph.forward = { id: dict(edges) for id, edges in self.forward.items() }
+    graph.reverse = { id: dict(edges) for id, edges in self.reverse.items() }
+    graph.version = self.version
+    return graph
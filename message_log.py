@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import glob
+import gzip
+import json
+import os
+import shutil
+
+from encoders import _JSONEncoder
+
+class MessageLogWriter:
+    """
+    Buffered JSON Lines writer for the MQTT message log.
+
+    write() only serializes the message to UTF-8 and appends it to an in-memory buffer; run()
+    flushes the buffer from a worker thread once it reaches flush_lines/flush_bytes or every
+    flush_interval seconds. The log is rotated when it exceeds max_bytes (bytes on disk, not
+    characters) or the day changes, and rotated files are optionally gzip compressed.
+    """
+    def __init__(self, config):
+        log_config = config['server']['message_log'] if 'message_log' in config['server'] else {}
+        self.enabled = log_config.get('enabled', True)
+        self.flush_lines = log_config.get('flush_lines', 500)
+        self.flush_bytes = log_config.get('flush_bytes', 1024 * 1024)
+        self.flush_interval = log_config.get('flush_interval', 5)
+        self.max_buffer_lines = log_config.get('max_buffer_lines', 100000)
+        self.max_bytes = log_config.get('max_bytes', 100 * 1024 * 1024)
+        self.rotate_daily = log_config.get('rotate_daily', True)
+        self.compress = log_config.get('compress', True)
+        self.max_files = log_config.get('max_files', 0)
+
+        self.directory = config['paths']['data']
+        self.path = f"{self.directory}/message-log.jsonl"
+
+        self.buffer: list[bytes] = []
+        self.buffer_bytes = 0
+        self.dropped = 0
+        self.flush_needed = asyncio.Event()
+
+        self.file = None
+        self.file_bytes = 0
+        self.file_day: datetime.date|None = None
+
+    def write(self, msg):
+        if not self.enabled:
+            return
+        if len(self.buffer) >= self.max_buffer_lines:
+            self.dropped += 1
+            return
+        line = (json.dumps(msg, cls=_JSONEncoder, ensure_ascii=False) + "\n").encode('utf-8')
+        self.buffer.append(line)
+        self.buffer_bytes += len(line)
+        if len(self.buffer) >= self.flush_lines or self.buffer_bytes >= self.flush_bytes:
+            self.flush_needed.set()
+
+    async def run(self):
+        if not self.enabled:
+            return
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        finally:
+            # flush whatever is left on shutdown
+            lines = self._take_buffer()
+            if len(lines) > 0:
+                self._write_lines(lines)
+            self._close()
+
+    async def flush(self):
+        lines = self._take_buffer()
+        if len(lines) > 0:
+            await asyncio.to_thread(self._write_lines, lines)
+        if self.dropped > 0:
+            print(f"Message log buffer full, dropped {self.dropped} messages")
+            self.dropped = 0
+
+    def _take_buffer(self):
+        self.flush_needed.clear()
+        lines = self.buffer
+        self.buffer = []
+        self.buffer_bytes = 0
+        return lines
+
+    ### file handling (runs in a worker thread)
+
+    def _write_lines(self, lines):
+        data = b"".join(lines)
+        self._rotate_if_needed(len(data))
+        if self.file is None:
+            self._open()
+        self.file.write(data)
+        self.file.flush()
+        self.file_bytes += len(data)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = open(self.path, "ab")
+        self.file_bytes = os.path.getsize(self.path)
+        if self.file_bytes > 0:
+            self.file_day = datetime.date.fromtimestamp(os.path.getmtime(self.path))
+        else:
+            self.file_day = datetime.date.today()
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _rotate_if_needed(self, incoming_bytes: int):
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return
+            self._open()
+        if self.file_bytes == 0:
+            return
+        too_big = self.max_bytes > 0 and self.file_bytes + incoming_bytes > self.max_bytes
+        new_day = self.rotate_daily and self.file_day != datetime.date.today()
+        if too_big or new_day:
+            self._rotate()
+
+    def _rotate(self):
+        self._close()
+        suffix = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        rotated = f"{self.directory}/message-log-{suffix}.jsonl"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(f"{rotated}.gz"):
+            rotated = f"{self.directory}/message-log-{suffix}-{n}.jsonl"
+            n += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+            rotated = f"{rotated}.gz"
+        print(f"Rotated message log to {rotated}")
+
+        if self.max_files > 0:
+            files = glob.glob(f"{self.directory}/message-log-*.jsonl*")
+            files.sort(key=os.path.getmtime)
+            for file in files[:-self.max_files]:
+                print(f"Deleting old message log: {file}")
+                os.remove(file)
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import asyncio
-import base64
 import datetime
 import json
 import time
@@ -9,19 +8,16 @@ import traceback
 from zoneinfo import ZoneInfo
 import aiomqtt
 from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
-from google.protobuf.json_format import MessageToJson
 from google.protobuf.message import DecodeError
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
 
+from channel_keys import ChannelKeyring
 from encoders import _JSONDecoder
+from ingest import IngestPipeline
+from message_log import MessageLogWriter
 from models.node import Node
+import protobuf_decoder
 import utils
 
-key = "AQ=="
-key_hash = "1PG7OiApB1nwvP+rz05pAQ==" # AQ==
-key_bytes = base64.b64decode(key_hash.encode('ascii'))
-
 class MQTT:
     def __init__(self, config, data):
         self.config = config
@@ -33,6 +29,10 @@ class MQTT:
         self.username = config['broker']['username']
         self.password = config['broker']['password']
 
+        self.keyring = ChannelKeyring(config)
+        self.message_log = MessageLogWriter(config)
+        self.ingest = IngestPipeline(config, data.ingest_stats, self.process_mqtt_msg)
+
     ### actions
 
     async def connect(self):
@@ -64,54 +64,38 @@ class MQTT:
                         # paho adds a timestamp to messages which is not in
                         # aiomqtt. We will do that ourself here so it is compatible.
                         msg.timestamp = time.monotonic() # type: ignore
-                        await self.process_mqtt_msg(client, msg)
+                        await self.ingest.put(msg)
             except aiomqtt.MqttError as err:
                 print(f"Disconnected from MQTT broker: {err}")
                 print("Reconnecting...")
                 await asyncio.sleep(5)
 
-    async def process_mqtt_msg(self, client, msg):
+    async def process_mqtt_msg(self, msg):
         if self.config['broker']['decoders']['protobuf']['enabled']:
             if'/2/e/' in msg.topic.value or '/2/map/' in msg.topic.value:
                 if self.config['debug']:
                     print(f"Received a protobuf message: {msg.topic} {msg.payload}")
                 is_encrypted = False
                 mp = mesh_pb2.MeshPacket()
-                outs = {}
 
                 try:
                     se = mqtt_pb2.ServiceEnvelope()
                     se.ParseFromString(msg.payload)
                     mp = se.packet
-                    outs = json.loads(MessageToJson(mp, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
-                    if self.config['debug']:
-                        print(f"Decoded protobuf message: {outs}")
                 except Exception as _:
                     # print(f"*** ParseFromString: {str(e)}")
                     pass
 
                 if mp.HasField("encrypted") and not mp.HasField("decoded"):
                     is_encrypted = True
-                    for key_item in self.config['broker']['channels']['encryption']:
-                        key_bytes = base64.b64decode(key_item['key'].encode('ascii'))
-                        try:
-                            if self.config['debug']:
-                                print(f"Attempting decryption with key: {key}")
-                            nonce_packet_id = getattr(mp, "id").to_bytes(8, "little")
-                            nonce_from_node = getattr(mp, "from").to_bytes(8, "little")
-                            nonce = nonce_packet_id + nonce_from_node
-                            cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
-                            decryptor = cipher.decryptor()
-                            decrypted_bytes = decryptor.update(getattr(mp, "encrypted")) + decryptor.finalize()
-                            data = mesh_pb2.Data()
-                            data.ParseFromString(decrypted_bytes)
-                            mp.decoded.CopyFrom(data)
-                            outs = json.loads(MessageToJson(mp, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
-                            break
-                        except Exception as e:
-                            if self.config['debug']:
-                                print(f"*** Decryption failed: {str(e)}")
-                            continue
+                    channel_name = ChannelKeyring.channel_name(se.channel_id, msg.topic.value)
+                    data = self.keyring.decrypt(mp, channel_name, debug=self.config['debug'])
+                    if data is not None:
+                        mp.decoded.CopyFrom(data)
+
+                outs = protobuf_decoder.message_to_dict(mp)
+                if self.config['debug']:
+                    print(f"Decoded protobuf message: {outs}")
 
                 outs['rssi'] = mp.rx_rssi
                 outs['snr'] = mp.rx_snr
@@ -135,7 +119,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.MAP_REPORT_APP:
                     try:
                         report = mesh_pb2.Position().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(report, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True, always_print_fields_with_no_presence=True))
+                        out = protobuf_decoder.message_to_dict(report, always_print_fields_with_no_presence=True)
                         outs["type"] = "mapreport"
                         outs["payload"] = out
                         if self.config['debug']:
@@ -149,7 +133,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.NEIGHBORINFO_APP:
                     try:
                         info = mesh_pb2.NeighborInfo().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(info, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True, always_print_fields_with_no_presence=True))
+                        out = protobuf_decoder.message_to_dict(info, always_print_fields_with_no_presence=True)
                         outs["type"] = "neighborinfo"
                         outs["payload"] = out
                         if self.config['debug']:
@@ -163,7 +147,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.NODEINFO_APP:
                     try:
                         info = mesh_pb2.User().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(info, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
+                        out = protobuf_decoder.message_to_dict(info)
                         if isinstance(out['id'], int):
                             out["id"] = utils.convert_node_id_from_int_to_hex(out['id'])
                         out["id"] = out['id'].replace('!', '')
@@ -180,7 +164,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.ROUTING_APP:
                     try:
                         data = mesh_pb2.Routing().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(data, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
+                        out = protobuf_decoder.message_to_dict(data)
                         outs["type"] = "routing"
                         outs["payload"] = out
                         if self.config['debug']:
@@ -194,7 +178,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.TRACEROUTE_APP:
                     try:
                         route = mesh_pb2.RouteDiscovery().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(route, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True, always_print_fields_with_no_presence=True))
+                        out = protobuf_decoder.message_to_dict(route, always_print_fields_with_no_presence=True)
                         if 'route' in out:
                             route = []
                             for r in out['route']:
@@ -214,7 +198,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.POSITION_APP:
                     try:
                         pos = mesh_pb2.Position().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(pos, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
+                        out = protobuf_decoder.message_to_dict(pos)
                         outs["type"] = "position"
                         outs["payload"] = out
                         if self.config['debug']:
@@ -228,7 +212,7 @@ class MQTT:
                 elif mp.decoded.portnum == portnums_pb2.TELEMETRY_APP:
                     try:
                         env = telemetry_pb2.Telemetry().FromString(mp.decoded.payload)
-                        out = json.loads(MessageToJson(env, preserving_proto_field_name=True, ensure_ascii=False, indent=2, sort_keys=True, use_integers_for_enums=True))
+                        out = protobuf_decoder.message_to_dict(env)
                         if 'rx_time' in outs:
                             out['timestamp'] = datetime.datetime.fromtimestamp(outs['rx_time'] / 1000).astimezone(ZoneInfo(self.config['server']['timezone']))
                         outs["type"] = "telemetry"
@@ -271,10 +255,10 @@ class MQTT:
                 if self.config['debug']:
                     print(f"Received a JSON message: {msg.topic} {msg.payload}")
                 try:
-                    await self.handle_log(msg)
                     decoded = msg.payload.decode("utf-8")
                     j = json.loads(decoded, cls=_JSONDecoder)
                     j['topic'] = msg.topic.value
+                    await self.handle_log(j)
                     if j['type'] == "neighborinfo":
                         await self.handle_neighborinfo(j)
                     if j['type'] == "nodeinfo":
@@ -325,15 +309,15 @@ class MQTT:
         topic = msg['topic'] if 'topic' in msg else 'unknown'
         if self.config['debug']:
             print(f"MQTT >> {topic} -- {msg}")
-        self.data.mqtt_messages.append(msg)
+        self.data.mqtt_messages.add(msg)
         clean_msg = msg.copy()
         if 'decoded' in clean_msg:
             del clean_msg['decoded']
         if 'encrypted' in clean_msg:
             del clean_msg['encrypted']
-        self.data.messages.append(clean_msg)
-        with open(f'{self.config["paths"]["data"]}/message-log.jsonl', 'a', encoding='utf-8') as f:
-            f.write(f"{msg}\n")
+        self.data.messages.add(clean_msg)
+        self.data.events.publish('messages', clean_msg)
+        self.message_log.write(msg)
 
     async def handle_neighborinfo(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
@@ -353,7 +337,6 @@ class MQTT:
             node['neighborinfo'] = msg['payload']
             self.data.update_node(id, node)
             print(f"Node {id} skeleton added with neighborinfo")
-        await self.data.save()
 
     async def handle_nodeinfo(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
@@ -391,9 +374,9 @@ class MQTT:
             node['role'] = 0
 
         self.data.update_node(id, node)
+        self.data.postgres.add_node_info(id, msg['payload'], msg)
 
         self.sort_nodes_by_shortname()
-        await self.data.save()
 
     async def handle_position(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
@@ -413,7 +396,7 @@ class MQTT:
             node['position'] = msg['payload'] if 'payload' in msg else None
             self.data.update_node(id, node)
             print(f"Node {id} skeleton added with position")
-        await self.data.save()
+        self.data.postgres.add_position(id, msg['payload'] if 'payload' in msg else None, msg)
 
     async def handle_telemetry(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
@@ -434,14 +417,8 @@ class MQTT:
             self.data.update_node(id, node)
             print(f"Node {id} skeleton added with telemetry")
 
-        if id not in self.data.telemetry_by_node:
-            self.data.telemetry_by_node[id] = []
-
         if 'payload' in msg:
-            self.data.telemetry.insert(0, msg)
-            self.data.telemetry_by_node[id].insert(0, msg)
-
-        await self.data.save()
+            self.data.add_telemetry(id, msg)
 
     async def handle_text(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
@@ -452,12 +429,6 @@ class MQTT:
         if 'channel' not in msg:
             msg['channel'] = "0"
 
-        if str(msg['channel']) not in self.data.chat['channels']:
-            self.data.chat['channels'][str(msg['channel'])] = {
-                'name': f'Channel {msg["channel"]}',
-                'messages': []
-            }
-
         chat = {
             'id': msg['id'],
             'from': msg['from'],
@@ -471,7 +442,7 @@ class MQTT:
         }
         if 'sender' in msg:
             chat['sender'] = msg['sender']
-        self.data.chat['channels'][str(msg['channel'])]['messages'].insert(0, chat)
+        self.data.add_chat_message(str(msg['channel']), chat)
 
         node = self.data.find_node_by_hex_id(msg['from'])
         # TODO: Replace with something more configurable
@@ -480,8 +451,6 @@ class MQTT:
                 node['tc2_bbs'] = True
             self.data.update_node(node['id'], node)
 
-        await self.data.save()
-
     async def handle_traceroute(self, msg):
         msg['from'] = utils.convert_node_id_from_int_to_hex(msg["from"])
         if 'to' in msg:
@@ -503,12 +472,7 @@ class MQTT:
             else:
                 msg['route_ids'].append(r)
 
-        if id in self.data.traceroutes_by_node:
-            self.data.traceroutes_by_node[id].insert(0, msg)
-        else:
-            self.data.traceroutes_by_node[id] = [msg]
-        self.data.traceroutes.insert(0, msg)
-        await self.data.save()
+        self.data.add_traceroute(msg['from'], msg)
 
     ### helpers
 
@@ -517,8 +481,10 @@ class MQTT:
         now = datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
         ids_to_delete: list[str] = []
         for id, node in self.data.nodes.items():
+            # runs on every packet: only nodes that actually change are marked dirty
             if node['last_seen'] is None:
-                ids_to_delete.append(node['id'])
+                if node['active']:
+                    ids_to_delete.append(node['id'])
                 continue
             last_seen = datetime.datetime.fromisoformat(node['last_seen']).astimezone() if isinstance(node['last_seen'], str) else node['last_seen']
             try:
@@ -527,12 +493,15 @@ class MQTT:
                 print(f"Node {id} has invalid last_seen: {node['last_seen']}")
                 self.data.nodes[id]['last_seen'] = None
                 self.data.nodes[id]['active'] = False
+                self.data.mark_node_dirty(id)
+                continue
             if node['active'] and since >= self.config['server']['node_activity_prune_threshold']:
                 ids_to_delete.append(node['id'])
                 print(f"Node {id} pruned (last heard {since} seconds ago)")
 
         for id in ids_to_delete:
             self.data.nodes[id]['active'] = False
+            self.data.mark_node_dirty(id)
 
     # TODO: where should this really live?
     def sort_nodes_by_shortname(self):
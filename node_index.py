@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left, insort
+from datetime import datetime
+import itertools
+import math
+
+import geo
+
+# cell sides of the position grids in degrees, finest first (0.1 is about 11 km of latitude)
+GRID_DEGREES = (0.1, 1.0, 10.0)
+
+# a box is looked up in the finest grid it spans at most this many cells of
+GRID_MAX_CELLS = 1024
+
+class NodeIndex:
+  """
+  Indexes answering node list queries (/v1/nodes) without scanning the node table, kept in
+  sync with every node mutation by MemoryDataStore.index_node().
+
+  by_last_seen holds (last seen epoch, id) in ascending order; queries walk it newest first
+  and stop at the time cutoff. Lowercased long and short names are indexed by trigram for
+  substring filters, and active holds the ids of nodes currently marked active. Positions are
+  bucketed into grids of GRID_DEGREES cells for bounding box and radius filters.
+  """
+  def __init__(self):
+    self.by_last_seen: list[tuple[float, str]] = []
+    self.active: set[str] = set()
+    self.trigrams: dict[str, dict[str, set[str]]] = { 'longname': {}, 'shortname': {} }
+    # per grid, (latitude cell, longitude cell) -> ids of the nodes positioned in it
+    self.grids: list[dict[tuple[int, int], set[str]]] = [{} for _ in GRID_DEGREES]
+    # id -> (last seen epoch or None, lowercased longname, lowercased shortname, (latitude, longitude) or None)
+    self.entries: dict[str, tuple] = {}
+
+  def __len__(self):
+    return len(self.entries)
+
+  def clear(self):
+    self.by_last_seen = []
+    self.active = set()
+    self.trigrams = { 'longname': {}, 'shortname': {} }
+    self.grids = [{} for _ in GRID_DEGREES]
+    self.entries = {}
+
+  def update(self, id: str, node: dict):
+    entry = (self._epoch(node.get('last_seen')), str(node.get('longname') or '').lower(), str(node.get('shortname') or '').lower(), self._position(node))
+    if node.get('active'):
+      self.active.add(id)
+    else:
+      self.active.discard(id)
+    previous = self.entries.get(id)
+    if entry == previous:
+      return
+    self._unindex(id, previous)
+    self.entries[id] = entry
+    if entry[0] is not None:
+      insort(self.by_last_seen, (entry[0], id))
+    self._index_name('longname', entry[1], id)
+    self._index_name('shortname', entry[2], id)
+    if entry[3] is not None:
+      for grid, size in zip(self.grids, GRID_DEGREES):
+        grid.setdefault(self._cell(*entry[3], size), set()).add(id)
+
+  def remove(self, id: str):
+    self.active.discard(id)
+    self._unindex(id, self.entries.pop(id, None))
+
+  def _unindex(self, id: str, entry: tuple|None):
+    if entry is None:
+      return
+    if entry[0] is not None:
+      i = bisect_left(self.by_last_seen, (entry[0], id))
+      if i < len(self.by_last_seen) and self.by_last_seen[i] == (entry[0], id):
+        del self.by_last_seen[i]
+    for field, name in (('longname', entry[1]), ('shortname', entry[2])):
+      index = self.trigrams[field]
+      for gram in self._grams(name):
+        ids = index.get(gram)
+        if ids is not None:
+          ids.discard(id)
+          if len(ids) == 0:
+            del index[gram]
+    if entry[3] is not None:
+      for grid, size in zip(self.grids, GRID_DEGREES):
+        cell = self._cell(*entry[3], size)
+        ids = grid.get(cell)
+        if ids is not None:
+          ids.discard(id)
+          if len(ids) == 0:
+            del grid[cell]
+
+  def _index_name(self, field: str, name: str, id: str):
+    index = self.trigrams[field]
+    for gram in self._grams(name):
+      index.setdefault(gram, set()).add(id)
+
+  @staticmethod
+  def _grams(text: str) -> set[str]:
+    return { text[i:i + 3] for i in range(len(text) - 2) }
+
+  @staticmethod
+  def _epoch(last_seen) -> float|None:
+    if isinstance(last_seen, datetime):
+      return last_seen.timestamp()
+    if isinstance(last_seen, str):
+      try:
+        return datetime.fromisoformat(last_seen).timestamp()
+      except ValueError:
+        return None
+    return None
+
+  @staticmethod
+  def _position(node: dict) -> tuple[float, float]|None:
+    # where the maps place a node: both coordinates set and not 0
+    position = node.get('position')
+    if not isinstance(position, dict) or not position.get('latitude_i') or not position.get('longitude_i'):
+      return None
+    return position['latitude_i'] / 10000000, position['longitude_i'] / 10000000
+
+  @staticmethod
+  def _cell(lat: float, lon: float, size: float) -> tuple[int, int]:
+    return math.floor(lat / size), math.floor(lon / size)
+
+  def within_bbox(self, south: float, west: float, north: float, east: float) -> set[str]:
+    """
+    Ids of the nodes positioned within a bounding box (degrees, edges included); west > east
+    is a box across the antimeridian.
+    """
+    if west > east:
+      return self.within_bbox(south, west, north, 180.0) | self.within_bbox(south, -180.0, north, east)
+    for grid, size in zip(self.grids, GRID_DEGREES):
+      lat0, lon0 = self._cell(south, west, size)
+      lat1, lon1 = self._cell(north, east, size)
+      count = (lat1 - lat0 + 1) * (lon1 - lon0 + 1)
+      if count <= GRID_MAX_CELLS:
+        break
+    if count <= len(grid):
+      cells = ((cell, grid.get(cell)) for cell in itertools.product(range(lat0, lat1 + 1), range(lon0, lon1 + 1)))
+    else:
+      # a box spanning more cells than are populated: walk the populated ones instead
+      cells = ((cell, ids) for cell, ids in grid.items() if lat0 <= cell[0] <= lat1 and lon0 <= cell[1] <= lon1)
+
+    matches = set()
+    for (lat, lon), ids in cells:
+      if ids is None:
+        continue
+      if lat0 < lat < lat1 and lon0 < lon < lon1:
+        # an inner cell lies wholly within the box
+        matches |= ids
+        continue
+      for id in ids:
+        node_lat, node_lon = self.entries[id][3]
+        if south <= node_lat <= north and west <= node_lon <= east:
+          matches.add(id)
+    return matches
+
+  def within_radius(self, lat: float, lon: float, radius_km: float) -> set[str]:
+    """
+    Ids of the nodes positioned within radius_km (great-circle distance) of a point.
+    """
+    candidates = list(self.within_bbox(*geo.bounding_box(lat, lon, radius_km)))
+    positions = [self.entries[id][3] for id in candidates]
+    distances = geo.distances_between_points(lat, lon, [position[0] for position in positions], [position[1] for position in positions])
+    return { id for id, distance in zip(candidates, distances.tolist()) if distance <= radius_km }
+
+  def matching_names(self, field: str, text: str) -> set[str]|None:
+    """
+    Candidate ids for a substring filter on a name: every id whose name contains all trigrams
+    of text, or None (no restriction) for text shorter than a trigram.
+    """
+    grams = self._grams(text)
+    if len(grams) == 0:
+      return None
+    index = self.trigrams[field]
+    sets = sorted((index.get(gram, set()) for gram in grams), key=len)
+    return sets[0].intersection(*sets[1:])
+
+  def query(self, after: float|None = None, ids: list[str]|None = None, longname: str|None = None, shortname: str|None = None,
+            status: str|None = None, bbox: tuple[float, float, float, float]|None = None, near: tuple[float, float, float]|None = None,
+            limit: int|None = None, cursor: tuple[float, str]|None = None) -> tuple[list[str], tuple|None]:
+    """
+    Ids of matching nodes, most recently seen first, and the cursor of the next page (None
+    on the last page).
+
+    after: only nodes last seen after this epoch. longname / shortname: case-insensitive
+    substrings. status: 'online' or 'offline'. bbox: (south, west, north, east), see
+    within_bbox(). near: (latitude, longitude, radius km). cursor: (last seen, id) of the last
+    node of the previous page, as returned by the previous query.
+    """
+    longname = longname.lower() if longname else None
+    shortname = shortname.lower() if shortname else None
+    candidates: set[str]|None = set(ids) if ids is not None else None
+    for field, text in (('longname', longname), ('shortname', shortname)):
+      if text is not None:
+        matched = self.matching_names(field, text)
+        if matched is not None:
+          candidates = matched if candidates is None else candidates & matched
+    if status == 'online':
+      candidates = self.active if candidates is None else candidates & self.active
+    if bbox is not None:
+      matched = self.within_bbox(*bbox)
+      candidates = matched if candidates is None else candidates & matched
+    if near is not None:
+      matched = self.within_radius(*near)
+      candidates = matched if candidates is None else candidates & matched
+
+    if candidates is not None and len(candidates) < len(self.by_last_seen) // 8:
+      # few candidates: sorting them beats walking the whole index
+      keys = sorted(((self.entries[id][0], id) for id in candidates if id in self.entries and self.entries[id][0] is not None), reverse=True)
+      if cursor is not None:
+        keys = keys[bisect_left(keys, True, key=lambda key: key < cursor):]
+    else:
+      end = bisect_left(self.by_last_seen, cursor) if cursor is not None else len(self.by_last_seen)
+      keys = (self.by_last_seen[i] for i in range(end - 1, -1, -1))
+
+    matches = []
+    for key in keys:
+      last_seen, id = key
+      if after is not None and last_seen <= after:
+        break
+      if candidates is not None and id not in candidates:
+        continue
+      entry = self.entries[id]
+      if longname is not None and longname not in entry[1]:
+        continue
+      if shortname is not None and shortname not in entry[2]:
+        continue
+      if status == 'offline' and id in self.active:
+        continue
+      if limit is not None and len(matches) == limit:
+        return matches, (self.entries[matches[-1]][0], matches[-1])
+      matches.append(id)
+    return matches, None
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy
+
+import geo
+
+def _same(a: float, b: float) -> bool:
+  return a == b or (math.isnan(a) and math.isnan(b))
+
+def _km(distance: float) -> float|None:
+  # as utils.calculate_distance_between_nodes() gives it
+  return None if math.isnan(distance) else round(distance, 2)
+
+class NodePositions:
+  """
+  Node coordinates in arrays (degrees, NaN for nodes without a position), so the distances
+  between many nodes are computed in one vectorized pass rather than one haversine per pair.
+
+  Kept by the renderer between passes: update() only re-reads the nodes whose change number
+  moved, and version is bumped when a node's coordinates change or a node comes or goes, so
+  results computed from the arrays stay valid until it is; moved_since() tells which nodes
+  such results need recomputing for.
+  """
+  def __init__(self):
+    self.rows: dict[str, int] = {}
+    self.node_versions: dict[str, int] = {}
+    # one row past the last used one is always NaN, it stands in for unknown nodes
+    self.size = 0
+    self.lat = numpy.full(64, numpy.nan)
+    self.lon = numpy.full(64, numpy.nan)
+    self.version = 0
+    # id -> version at which the node last moved, came or went
+    self.moved: dict[str, int] = {}
+    self._from: tuple|None = None
+
+  @staticmethod
+  def coordinates(node) -> tuple[float, float]:
+    position = node.get('position') if node is not None else None
+    if position is None or position.get('latitude_i') is None or position.get('longitude_i') is None:
+      return math.nan, math.nan
+    return position['latitude_i'] / 10000000, position['longitude_i'] / 10000000
+
+  def update(self, nodes: dict, node_versions: dict[str, int]):
+    moved = []
+    for id in [id for id in self.rows.keys() if id not in nodes]:
+      row = self.rows.pop(id)
+      del self.node_versions[id]
+      # the row is not reused, nodes are only removed when a journal is replayed
+      self.lat[row] = math.nan
+      self.lon[row] = math.nan
+      moved.append(id)
+    for id, node in nodes.items():
+      version = node_versions.get(id, 0)
+      if id in self.rows and self.node_versions[id] == version:
+        continue
+      self.node_versions[id] = version
+      added = id not in self.rows
+      if added:
+        self.rows[id] = self._add_row()
+      row = self.rows[id]
+      lat, lon = self.coordinates(node)
+      if added or not _same(self.lat[row], lat) or not _same(self.lon[row], lon):
+        self.lat[row] = lat
+        self.lon[row] = lon
+        moved.append(id)
+    if len(moved) > 0:
+      self.version += 1
+      for id in moved:
+        self.moved[id] = self.version
+
+  def moved_since(self, version: int) -> set[str]:
+    """
+    Ids of the nodes that moved, came or went after version.
+    """
+    return { id for id, moved in self.moved.items() if moved > version }
+
+  def _add_row(self) -> int:
+    if self.size + 1 >= len(self.lat):
+      self.lat = numpy.concatenate([self.lat, numpy.full(len(self.lat), numpy.nan)])
+      self.lon = numpy.concatenate([self.lon, numpy.full(len(self.lon), numpy.nan)])
+    self.size += 1
+    return self.size - 1
+
+  def distances_from(self, id: str) -> dict[str, float|None]:
+    """
+    Distance in km from one node to every node, None where either has no position.
+    """
+    if self._from is not None and self._from[0] == (self.version, id):
+      return self._from[1]
+    row = self.rows.get(id, self.size)
+    distances = geo.distances_between_points(self.lat[row], self.lon[row], self.lat[:self.size], self.lon[:self.size]).tolist()
+    result = { other: _km(distances[other_row]) for other, other_row in self.rows.items() }
+    self._from = ((self.version, id), result)
+    return result
+
+  def pair_distances(self, ids1: list[str], ids2: list[str]) -> list[float|None]:
+    """
+    Distance in km between each ids1[i] and ids2[i], None where either has no position or is not a node.
+    """
+    rows, unknown = self.rows, self.size
+    rows1 = numpy.array([rows.get(id, unknown) for id in ids1], dtype=numpy.intp)
+    rows2 = numpy.array([rows.get(id, unknown) for id in ids2], dtype=numpy.intp)
+    distances = geo.distances_between_points(self.lat[rows1], self.lon[rows1], self.lat[rows2], self.lon[rows2])
+    # inline _km(), this runs once per mesh edge
+    return [None if distance != distance else round(distance, 2) for distance in distances.tolist()]
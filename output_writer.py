@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import zlib
+
+# chunks of streamed content are collected up to this size before hashing and writing
+CHUNK_SIZE = 64 * 1024
+
+class OutputWriter:
+  """
+  Writes files the web server (or a mirror) may be reading at the same time.
+
+  Content goes to <path>.tmp and is renamed over the target, so readers see either the old or
+  the new file, never a partial one. With a hashes dict ({ key: sha1 digest }, kept by the
+  caller between passes) a file whose content did not change is left alone: the target keeps
+  its mtime and the page cache and mirrors see no change.
+
+  precompress ({ 'gzip': level, 'br': quality }) also writes .gz / .br siblings of every file
+  of at least precompress_min_size bytes, for a server that serves them as they are (Caddy's
+  file_server precompressed). Brotli needs the brotli package.
+  """
+  def __init__(self, hashes: dict[str, bytes]|None = None, precompress: dict[str, int]|None = None, precompress_min_size: int = 0):
+    self.hashes = hashes
+    self.precompress = precompress or {}
+    self.precompress_min_size = precompress_min_size
+    self.brotli = None
+    if 'br' in self.precompress:
+      import brotli
+      self.brotli = brotli
+
+  @classmethod
+  def from_config(cls, config, hashes: dict[str, bytes]|None = None):
+    output = config['server']['output'] if 'output' in config['server'] else {}
+    return cls(hashes, output.get('precompress'), output.get('precompress_min_size', 0))
+
+  def write(self, path: str, content: str|bytes, key: str|None = None) -> bool:
+    """
+    Write content to path. Returns False if the write was skipped because the content hash
+    under key (default: path) is unchanged.
+    """
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    key = key if key is not None else path
+    digest = hashlib.sha1(data).digest()
+    if self.unchanged(path, key, digest):
+      return False
+
+    with open(f"{path}.tmp", "wb") as f:
+      f.write(data)
+    self.write_siblings(path, [data], len(data))
+    os.replace(f"{path}.tmp", path)
+    if self.hashes is not None:
+      self.hashes[key] = digest
+    return True
+
+  def write_chunks(self, path: str, chunks, key: str|None = None) -> bool:
+    """
+    Like write() for content produced in pieces (e.g. JSONEncoder.iterencode), without holding
+    all of it in memory. The unchanged check can only happen at the end, so the temporary file
+    is written either way and discarded if the content turns out the same.
+    """
+    key = key if key is not None else path
+    sha1 = hashlib.sha1()
+    size = 0
+    blocks = []
+    with open(f"{path}.tmp", "wb") as f:
+      for block in self.blocks(chunks):
+        sha1.update(block)
+        f.write(block)
+        size += len(block)
+        if len(self.precompress) > 0:
+          blocks.append(block)
+    digest = sha1.digest()
+    if self.unchanged(path, key, digest):
+      os.remove(f"{path}.tmp")
+      return False
+
+    self.write_siblings(path, blocks, size)
+    os.replace(f"{path}.tmp", path)
+    if self.hashes is not None:
+      self.hashes[key] = digest
+    return True
+
+  def unchanged(self, path: str, key: str, digest: bytes) -> bool:
+    return self.hashes is not None and self.hashes.get(key) == digest and os.path.exists(path)
+
+  @staticmethod
+  def blocks(chunks):
+    pending = []
+    size = 0
+    for chunk in chunks:
+      pending.append(chunk)
+      size += len(chunk)
+      if size >= CHUNK_SIZE:
+        yield "".join(pending).encode('utf-8')
+        pending = []
+        size = 0
+    if len(pending) > 0:
+      yield "".join(pending).encode('utf-8')
+
+  def write_siblings(self, path: str, blocks: list[bytes], size: int):
+    for encoding, level in self.precompress.items():
+      sibling = f"{path}.{'gz' if encoding == 'gzip' else encoding}"
+      if size < self.precompress_min_size:
+        # a stale sibling would be served instead of the new content
+        if os.path.exists(sibling):
+          os.remove(sibling)
+        continue
+      if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: gzip header, no name or mtime
+        compress, finish = compressor.compress, compressor.flush
+      elif encoding == 'br':
+        compressor = self.brotli.Compressor(quality=level)
+        compress, finish = compressor.process, compressor.finish
+      else:
+        raise ValueError(f"Unknown precompress encoding: {encoding}")
+      with open(f"{sibling}.tmp", "wb") as f:
+        for block in blocks:
+          f.write(compress(block))
+        f.write(finish())
+      os.replace(f"{sibling}.tmp", sibling)
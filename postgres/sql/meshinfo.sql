@@ -1,3 +1,5 @@
+CREATE EXTENSION IF NOT EXISTS postgis;
+
 CREATE TABLE nodes (
   id bigint NOT NULL PRIMARY KEY,
   first_heard_at timestamp with time zone DEFAULT now() NOT NULL,
@@ -5,7 +7,7 @@ CREATE TABLE nodes (
 );
 
 CREATE TABLE node_infos (
-  id bigint NOT NULL PRIMARY KEY,
+  id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   node_id bigint NOT NULL,
   long_name character varying(100),
   short_name character varying(10),
@@ -15,8 +17,10 @@ CREATE TABLE node_infos (
   created_at timestamp with time zone DEFAULT now() NOT NULL
 );
 
+CREATE INDEX node_infos_node_id_created_at ON node_infos (node_id, created_at);
+
 CREATE TABLE node_positions (
-  id bigint NOT NULL PRIMARY KEY,
+  id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
   node_id bigint NOT NULL,
   latitude double precision NOT NULL,
   longitude double precision NOT NULL,
@@ -25,6 +29,9 @@ CREATE TABLE node_positions (
   created_at timestamp with time zone DEFAULT now() NOT NULL
 );
 
+CREATE INDEX node_positions_node_id_created_at ON node_positions (node_id, created_at);
+CREATE INDEX node_positions_geom ON node_positions USING GIST (geom);
+
 CREATE VIEW current_nodes AS
   SELECT DISTINCT ON (node_id) node_id, long_name, short_name, mac_addr, hw_model, role, latitude, longitude, altitude, geom
   FROM (
@@ -46,12 +53,18 @@ CREATE VIEW current_nodes AS
     ORDER BY n.id, np.created_at DESC
   ) AS current_nodes;
 
+CREATE TABLE channels (
+  id BIGINT PRIMARY KEY,
+  name TEXT,
+  created_at TIMESTAMP DEFAULT now()
+);
+
 CREATE TABLE text_messages (
   id BIGINT PRIMARY KEY,
-  channel_id TEXT REFERENCES channels(id),
+  channel_id BIGINT REFERENCES channels(id),
   from_node_id BIGINT REFERENCES nodes(id),
   sender_node_id BIGINT REFERENCES nodes(id),
-  to_node_id TEXT REFERENCES nodes(node_id),
+  to_node_id BIGINT REFERENCES nodes(id),
   hops_away INT,
   rssi INT,
   snr FLOAT,
@@ -60,9 +73,13 @@ CREATE TABLE text_messages (
   created_at TIMESTAMP DEFAULT now()
 );
 
-CREATE TABLE channels (
+CREATE TABLE mqtt_messages (
   id BIGINT PRIMARY KEY,
-  name TEXT,
+  topic TEXT,
+  payload TEXT,
+  qos INT,
+  retain BOOLEAN,
+  timestamp BIGINT,
   created_at TIMESTAMP DEFAULT now()
 );
 
@@ -73,7 +90,7 @@ CREATE TABLE messages (
   from_node_id BIGINT REFERENCES nodes(id),
   sender_node_id BIGINT REFERENCES nodes(id),
   to_node_id BIGINT REFERENCES nodes(id),
-  type varying character(20),
+  type character varying(20),
   hops_away INT,
   rssi INT,
   snr FLOAT,
@@ -81,13 +98,3 @@ CREATE TABLE messages (
   timestamp BIGINT,
   created_at TIMESTAMP DEFAULT now()
 );
-
-CREATE TABLE mqtt_messages (
-  id BIGINT PRIMARY KEY,
-  topic TEXT,
-  payload TEXT,
-  qos INT,
-  retain BOOLEAN,
-  timestamp BIGINT,
-  created_at TIMESTAMP DEFAULT now()
-);
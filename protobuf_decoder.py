@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# direct protobuf -> dict conversion, producing the same shapes as
+# json.loads(MessageToJson(msg, preserving_proto_field_name=True, use_integers_for_enums=True))
+# without serializing to (pretty printed) JSON text and parsing it back
+
+import base64
+import math
+import struct
+
+from google.protobuf.descriptor import FieldDescriptor
+
+_INT64_CPP_TYPES = {
+  FieldDescriptor.CPPTYPE_INT64,
+  FieldDescriptor.CPPTYPE_UINT64,
+}
+
+# converters are built once per field descriptor and reused for every message
+_converters: dict = {}
+
+def message_to_dict(message, always_print_fields_with_no_presence: bool = False) -> dict:
+  """
+  Convert a protobuf message to a dict.
+
+  :param message: The protobuf message to convert.
+  :param always_print_fields_with_no_presence: Also emit fields without presence that are set to their default value
+                                               (matches the MessageToJson option of the same name).
+  :return: A dict keyed by proto field name, with enums as ints, bytes as base64 and 64-bit ints as strings.
+  """
+  out = {}
+  for field, value in message.ListFields():
+    if field.is_extension:
+      continue
+    out[field.name] = _converter(field, always_print_fields_with_no_presence)(value)
+
+  if always_print_fields_with_no_presence:
+    for field in message.DESCRIPTOR.fields:
+      if field.name in out:
+        continue
+      if _is_repeated(field):
+        out[field.name] = {} if _is_map(field) else []
+      elif not field.has_presence:
+        out[field.name] = _converter(field, always_print_fields_with_no_presence)(getattr(message, field.name))
+  return out
+
+def _converter(field, always_print_fields_with_no_presence: bool):
+  key = (field, always_print_fields_with_no_presence)
+  converter = _converters.get(key)
+  if converter is None:
+    converter = _build_converter(field, always_print_fields_with_no_presence)
+    _converters[key] = converter
+  return converter
+
+def _build_converter(field, always_print_fields_with_no_presence: bool):
+  if _is_map(field):
+    value_field = field.message_type.fields_by_name['value']
+    convert_value = _scalar_converter(value_field, always_print_fields_with_no_presence)
+    return lambda value: { str(k): convert_value(v) for k, v in value.items() }
+
+  convert = _scalar_converter(field, always_print_fields_with_no_presence)
+  if _is_repeated(field):
+    return lambda value: [convert(v) for v in value]
+  return convert
+
+def _scalar_converter(field, always_print_fields_with_no_presence: bool):
+  cpp_type = field.cpp_type
+  if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+    return lambda value: message_to_dict(value, always_print_fields_with_no_presence)
+  if cpp_type == FieldDescriptor.CPPTYPE_STRING:
+    if field.type == FieldDescriptor.TYPE_BYTES:
+      return lambda value: base64.b64encode(value).decode('utf-8')
+    return str
+  if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+    return bool
+  if cpp_type in _INT64_CPP_TYPES:
+    return str
+  if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+    return _float_value
+  if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+    return _double_value
+  # int32/uint32/enum values are already plain ints
+  return _identity
+
+def _identity(value):
+  return value
+
+def _double_value(value):
+  if math.isnan(value):
+    return 'NaN'
+  if math.isinf(value):
+    return '-Infinity' if value < 0 else 'Infinity'
+  return value
+
+def _float_value(value):
+  """
+  Shortest decimal that round-trips to the same 4 byte float (e.g. 0.9 rather than 0.8999999761581421).
+  """
+  if math.isnan(value) or math.isinf(value):
+    return _double_value(value)
+  precision = 6
+  rounded = float(f'{value:.{precision}g}')
+  while struct.unpack('<f', struct.pack('<f', rounded))[0] != value:
+    precision += 1
+    rounded = float(f'{value:.{precision}g}')
+  return rounded
+
+def _is_repeated(field):
+  if hasattr(field, 'is_repeated'):
+    return field.is_repeated
+  return field.label == FieldDescriptor.LABEL_REPEATED
+
+def _is_map(field):
+  return field.message_type is not None and field.message_type.GetOptions().map_entry
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+from collections import deque
+import itertools
+import time
+
+class RingBuffer(deque):
+  """
+  Newest-first bounded history.
+
+  Holds at most maxlen items (the oldest fall off the end) and, when max_age is set,
+  prune() drops items added more than max_age seconds ago. Iteration, indexing and
+  slicing are newest first, so it can stand in for the lists the store used to keep
+  with insert(0, ...).
+  """
+  def __init__(self, iterable=(), maxlen: int|None = None, max_age: float|None = None):
+    super().__init__((), maxlen)
+    self.max_age = max_age
+    self.times: deque = deque(maxlen=maxlen)
+    # bumped on every change, so readers can tell whether a copy they hold is stale
+    self.version = 0
+    # total number of items ever added, so writers can tell which items are new
+    self.added = 0
+    for item in iterable:
+      self.append(item)
+      self.times.append(time.time())
+
+  @classmethod
+  def from_config(cls, config: dict|None, items=(), item_time=None):
+    """
+    Build a buffer from a retention config ({max_items, max_age}) and newest-first items.
+    item_time(item) gives the time an existing item was recorded, when it is known.
+    """
+    config = config if config is not None else {}
+    buffer = cls(maxlen=config.get('max_items'), max_age=config.get('max_age'))
+    now = time.time()
+    for item in reversed(list(items)):
+      at = item_time(item) if item_time is not None else None
+      buffer.add(item, at=at if at is not None else now)
+    return buffer
+
+  def add(self, item, at: float|None = None):
+    """
+    Add an item as the newest entry. Returns the oldest item if it fell off the end, else None.
+    """
+    evicted = self[-1] if self.maxlen is not None and len(self) == self.maxlen else None
+    self.appendleft(item)
+    self.times.appendleft(at if at is not None else time.time())
+    self.version += 1
+    self.added += 1
+    return evicted
+
+  def prune(self, now: float|None = None) -> int:
+    """
+    Drop items older than max_age. Returns the number of items dropped.
+    """
+    if self.max_age is None:
+      return 0
+    cutoff = (now if now is not None else time.time()) - self.max_age
+    dropped = 0
+    while len(self.times) > 0 and self.times[-1] < cutoff:
+      self.drop_oldest()
+      dropped += 1
+    return dropped
+
+  def drop_oldest(self):
+    self.times.pop()
+    self.version += 1
+    return self.pop()
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      if (key.step is None or key.step == 1) and (key.start is None or key.start >= 0) and (key.stop is None or key.stop >= 0):
+        return list(itertools.islice(self, key.start, key.stop))
+      return list(self)[key]
+    return super().__getitem__(key)
+
+  def __reduce__(self):
+    # items go through deque.extend (listitems) rather than __init__, which appends one by one
+    return (self.__class__, ((), self.maxlen, self.max_age), { 'times': self.times }, iter(self))
+
+  def __copy__(self):
+    copied = self.__class__(maxlen=self.maxlen, max_age=self.max_age)
+    copied.extend(self)
+    copied.times = self.times.copy()
+    return copied
+
+  copy = __copy__
@@ -1,134 +1,425 @@
 #!/usr/bin/env python3
 
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import copy
 import datetime
+import itertools
 import json
+import math
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
 from zoneinfo import ZoneInfo
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 import encoders
 import geo
 import meshtastic_support
+from node_positions import NodePositions
+from output_writer import OutputWriter
 import utils
 
+# store versions (DataSnapshot.versions) each aggregate page is rendered from, in render order
+PAGE_INPUTS = {
+  'index.html': ('nodes',),
+  'chat.html': ('nodes', 'chat'),
+  'graph.html': ('nodes', 'mesh'),
+  'map.html': ('nodes',),
+  'mesh_log.html': ('messages',),
+  'mqtt_log.html': ('mqtt_messages', 'mqtt_connect_time'),
+  'neighbors.html': ('nodes', 'mesh'),
+  'nodes.html': ('nodes',),
+  'routes.html': ('nodes',),
+  'stats.html': ('nodes', 'chat', 'messages', 'mqtt_messages', 'telemetry', 'traceroutes'),
+  'telemetry.html': ('nodes', 'telemetry'),
+  'traceroutes.html': ('nodes', 'traceroutes'),
+}
+
+# one environment per process and template directory, see template_environment()
+_environments: dict[tuple, Environment] = {}
+
+def template_environment(config) -> Environment:
+  """
+  Shared Jinja environment for the static templates. Templates are compiled once per process
+  (the bytecode cache on disk also spares a restarted process the compile) and loaded up
+  front; helpers every page uses are globals rather than per-page arguments. With debug on,
+  edited templates are picked up without a restart.
+  """
+  paths = config['paths']
+  template_path = f"{paths['templates']}/static"
+  # by default Jinja's per-user directory under the system temp dir: kept out of paths.data,
+  # which is backed up
+  cache_path = paths['template_cache'] if 'template_cache' in paths else None
+  key = (template_path, cache_path, config['server']['timezone'], config['debug'])
+  if key in _environments:
+    return _environments[key]
+
+  if cache_path is not None:
+    os.makedirs(cache_path, exist_ok=True)
+  env = Environment(
+    loader=FileSystemLoader('.'),
+    autoescape=True,
+    bytecode_cache=FileSystemBytecodeCache(cache_path),
+    auto_reload=config['debug'],
+    cache_size=-1,
+  )
+  env.globals.update(
+    datetime=datetime.datetime,
+    timedelta=datetime.timedelta,
+    zoneinfo=ZoneInfo(config['server']['timezone']),
+    json=json,
+    JSONEncoder=encoders._JSONEncoder,
+    geo=geo,
+    utils=utils,
+    meshtastic_support=meshtastic_support,
+    hardware=meshtastic_support.HardwareModel,
+  )
+  for name in sorted(os.listdir(template_path)):
+    if name.endswith('.j2'):
+      env.get_template(f"{template_path}/{name}")
+  _environments[key] = env
+  return env
+
+# render worker processes, created on first use and kept for the life of the process
+_pools: dict[int, ProcessPoolExecutor] = {}
+
+def render_pool(workers: int) -> ProcessPoolExecutor:
+  if workers not in _pools:
+    _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+  return _pools[workers]
+
+# in a worker: the snapshot of the current pass and the renderer built on it
+_worker_pass: tuple|None = None
+
+def _render_shard(config, snapshot_path: str, pass_id: str, timestamp, filenames: list[str], node_ids: list[str], hashes: dict|None):
+  """
+  Worker side of StaticHTMLRenderer.render_parallel(): the snapshot is loaded once per pass and
+  reused for every shard this worker gets. Returns the page counters and, when the parent keeps
+  content hashes, the hashes of this shard's files.
+  """
+  global _worker_pass
+  if _worker_pass is None or _worker_pass[0] != pass_id:
+    with open(snapshot_path, 'rb') as f:
+      data, neighbors, host_distances = pickle.load(f)
+    renderer = StaticHTMLRenderer(config, data)
+    renderer.neighbors = neighbors
+    renderer.host_distances = host_distances
+    _worker_pass = (pass_id, renderer)
+  renderer = _worker_pass[1]
+  renderer.timestamp = timestamp
+  renderer.pages = { 'rendered': 0, 'skipped': 0, 'written': 0 }
+  renderer.state = None
+  if hashes is not None:
+    renderer.state = RenderState()
+    renderer.state.hashes = hashes
+  renderer.writer = OutputWriter.from_config(config, hashes)
+  renderer.render_pages(filenames, node_ids)
+  return renderer.pages, renderer.state.hashes if renderer.state is not None else None
+
+class RenderState:
+  """
+  What previous render passes produced, kept by the store between passes so the next pass can
+  skip pages whose inputs did not change and files whose content did not change.
+  """
+  def __init__(self):
+    self.inputs: dict[str, tuple] = {}
+    self.node_versions: dict[str, int] = {}
+    self.node_rows: dict[str, dict] = {}
+    # node coordinates, and the (positions, mesh) versions node_rows were built from
+    self.positions: NodePositions = NodePositions()
+    self.node_rows_key: tuple|None = None
+    self.hashes: dict[str, bytes] = {}
+    self.last_full: float = 0.0
+
 class StaticHTMLRenderer:
-  def __init__(self, config, data):
+  def __init__(self, config, data, state: RenderState|None = None):
     self.config = config
     self.data = data
+    # without a state every pass renders and writes every page
+    self.state = state
+    self.pages = { 'rendered': 0, 'skipped': 0, 'written': 0 }
     self.output_path = self.config['paths']['output']
     self.template_path = f"{self.config['paths']['templates']}/static"
+    self.env = template_environment(config)
+    self.timestamp = datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+    # per render pass: km from the server node to every node, the heard / heard by rows of every
+    # node, and node pair -> km for any other pair
+    self.host_distances: dict[str, float|None] = {}
+    self.neighbors: dict[str, dict] = {}
+    self.distances: dict[tuple[str, str], float|None] = {}
+    render_config = self.config['server']['render'] if 'render' in self.config['server'] else {}
+    self.workers = render_config.get('workers', 1)
+    self.writer = OutputWriter.from_config(config, self.state.hashes if self.state is not None else None)
 
   async def render(self):
       await asyncio.to_thread(self._render)
 
   def _render(self):
-    self.render_index()
-    self.render_chat()
-    self.render_graph()
-    self.render_map()
-    self.render_mesh_log()
-    self.render_mqtt_log()
-    self.render_neighbors()
-    self.render_nodes_each()
-    self.render_nodes()
-    self.render_routes()
-    self.render_stats()
-    self.render_telemetry()
-    self.render_traceroutes()
-    print("Done rendering static HTML files")
+    self.timestamp = datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+    self.prepare_distances()
+    full = self.state is None or time.time() - self.state.last_full >= self.full_render_interval()
+    inputs = { filename: tuple(self.data.versions.get(key) for key in keys) for filename, keys in PAGE_INPUTS.items() }
+    filenames = [filename for filename in PAGE_INPUTS.keys() if full or self.state.inputs.get(filename) != inputs[filename]]
+    self.pages['skipped'] += len(PAGE_INPUTS) - len(filenames)
+
+    if full:
+      node_ids = list(self.data.nodes.keys())
+    else:
+      changed = self.changed_node_ids()
+      node_ids = [id for id in self.data.nodes.keys() if id in changed]
+      self.pages['skipped'] += len(self.data.nodes) - len(node_ids)
+
+    if self.workers > 1 and len(filenames) + len(node_ids) > 1:
+      self.render_parallel(filenames, node_ids)
+    else:
+      self.render_pages(filenames, node_ids)
+
+    if self.state is not None:
+      self.state.inputs.update((filename, inputs[filename]) for filename in filenames)
+      self.state.node_versions = self.data.node_versions
+      self.state.node_rows = self.neighbors
+      self.state.node_rows_key = (self.state.positions.version, self.data.mesh.version)
+      if full:
+        self.state.last_full = time.time()
+    print(f"Done rendering static HTML files ({'full' if full else 'incremental'}: {self.pages['rendered']} rendered, {self.pages['skipped']} skipped, {self.pages['written']} written)")
+
+  def render_pages(self, filenames: list[str], node_ids: list[str]):
+    pages = {
+      'index.html': self.render_index,
+      'chat.html': self.render_chat,
+      'graph.html': self.render_graph,
+      'map.html': self.render_map,
+      'mesh_log.html': self.render_mesh_log,
+      'mqtt_log.html': self.render_mqtt_log,
+      'neighbors.html': self.render_neighbors,
+      'nodes.html': self.render_nodes,
+      'routes.html': self.render_routes,
+      'stats.html': self.render_stats,
+      'telemetry.html': self.render_telemetry,
+      'traceroutes.html': self.render_traceroutes,
+    }
+    for filename in filenames:
+      pages[filename]()
+    if len(node_ids) > 0:
+      self.render_nodes_each(ids=node_ids)
+
+  def render_parallel(self, filenames: list[str], node_ids: list[str]):
+    """
+    Render across server.render.workers processes. The snapshot is pickled to a file once per
+    pass; each task only names its pages, so a worker loads the snapshot once however many
+    shards it renders. Aggregate pages are one task each, node pages go in shards of about a
+    quarter of a worker's share, so the workers stay evenly loaded.
+    """
+    pass_id = f"{os.getpid()}-{time.monotonic_ns()}"
+    # outside paths.data, so it is never swept into a backup; removed when the pass ends
+    snapshot_dir = tempfile.mkdtemp(prefix="meshinfo-render-")
+    snapshot_path = f"{snapshot_dir}/snapshot.pickle"
+
+    tasks = [([filename], []) for filename in filenames]
+    shard_size = max(1, math.ceil(len(node_ids) / (self.workers * 4)))
+    for i in range(0, len(node_ids), shard_size):
+      tasks.append(([], node_ids[i:i + shard_size]))
+
+    pool = render_pool(self.workers)
+    try:
+      with open(snapshot_path, "wb") as f:
+        pickle.dump((self.data, self.neighbors, self.host_distances), f, protocol=pickle.HIGHEST_PROTOCOL)
+      futures = []
+      for task_filenames, task_ids in tasks:
+        hashes = None
+        if self.state is not None:
+          task_files = task_filenames + [f"node_{id.replace('!', '')}.html" for id in task_ids]
+          hashes = { filename: self.state.hashes[filename] for filename in task_files if filename in self.state.hashes }
+        futures.append(pool.submit(_render_shard, self.config, snapshot_path, pass_id, self.timestamp, task_filenames, task_ids, hashes))
+      for future in futures:
+        pages, hashes = future.result()
+        for key, count in pages.items():
+          self.pages[key] += count
+        if hashes is not None:
+          self.state.hashes.update(hashes)
+    finally:
+      shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+  def full_render_interval(self):
+    # pages also show times relative to now, so every page is refreshed at least this often
+    intervals = self.config['server']['intervals']
+    return intervals['render_full'] if 'render_full' in intervals else 300
+
+  def changed_node_ids(self) -> set[str]:
+    """
+    Nodes whose page is stale: the node changed, its neighbor rows changed, or a node shown
+    in those rows (or the server node) changed since the previous pass.
+    """
+    previous = self.state.node_versions
+    changed = { id for id, version in self.data.node_versions.items() if previous.get(id) != version }
+    if self.config['server']['node_id'] in changed:
+      return set(self.data.nodes.keys())
+    ids = set()
+    for id, rows in self.neighbors.items():
+      if id in changed or self.state.node_rows.get(id) != rows:
+        ids.add(id)
+      elif any(row['id'] in changed for row in rows['heard']) or any(row['id'] in changed for row in rows['heard_by']):
+        ids.add(id)
+    return ids
 
   def save_file(self, filename, content):
-    with open(f"{self.output_path}/{filename}", "w", encoding='utf-8') as f:
-      f.write(content)
+    if self.writer.write(f"{self.output_path}/{filename}", content, key=filename):
+      self.pages['written'] += 1
 
   def render_html(self, template_file, **kwargs):
-    env = Environment(loader=FileSystemLoader('.'), autoescape=True)
     template_file = 'node.html' if template_file.startswith('node_') else f'{template_file}'
-    template = env.get_template(f'{self.template_path}/{template_file}.j2')
-    html = template.render(**kwargs)
+    template = self.env.get_template(f'{self.template_path}/{template_file}.j2')
+    html = template.render(config=self.config, timestamp=self.timestamp, **kwargs)
     return html
 
   def render_html_and_save(self, filename, **kwargs):
     if self.config['debug']:
       print(f"Rendering {filename}")
     html = self.render_html(filename, **kwargs)
+    self.pages['rendered'] += 1
     self.save_file(filename, html)
 
 
+  def prepare_distances(self):
+    """
+    The distances every page needs, in one vectorized pass each: from the server node to every
+    node, and along every mesh edge (the neighbor rows). With a render state both are reused
+    until positions or the mesh change; when only some nodes moved, only their edges are
+    recomputed.
+    """
+    positions = self.state.positions if self.state is not None else NodePositions()
+    positions.update(self.data.nodes, self.data.node_versions)
+    self.host_distances = positions.distances_from(self.config['server']['node_id'])
+    key = self.state.node_rows_key if self.state is not None else None
+    if key is None or key[1] != self.data.mesh.version:
+      self.neighbors = self.neighbor_tables(positions)
+    elif key[0] == positions.version:
+      self.neighbors = self.state.node_rows
+    else:
+      moved = positions.moved_since(key[0])
+      if len(moved) > len(positions.rows) // 4:
+        self.neighbors = self.neighbor_tables(positions)
+      else:
+        self.neighbors = self.patch_neighbor_tables(self.state.node_rows, positions, moved)
+
+  def distance(self, id1: str, id2: str) -> float|None:
+    """
+    Distance in km between two nodes: from prepare_distances() for the server node and mesh
+    neighbors, else computed at most once per render pass.
+    """
+    host = self.config['server']['node_id']
+    if id1 == host or id2 == host:
+      return self.host_distances.get(id2 if id1 == host else id1)
+    if id1 in self.neighbors:
+      for row in itertools.chain(self.neighbors[id1]['heard'], self.neighbors[id1]['heard_by']):
+        if row['id'] == id2:
+          return row['distance']
+    key = (id1, id2) if id1 < id2 else (id2, id1)
+    if key not in self.distances:
+      self.distances[key] = utils.calculate_distance_between_nodes(self.data.nodes.get(id1), self.data.nodes.get(id2))
+    return self.distances[key]
+
+  def neighbor_tables(self, positions: NodePositions) -> dict[str, dict]:
+    """
+    Heard and heard by rows ({id, snr, distance}) for every node, built once from the mesh graph
+    so each node page only renders its own slice.
+    """
+    forward = self.data.mesh.forward
+    distances = iter(positions.pair_distances(
+      [id for id, neighbor_edges in forward.items() for _ in neighbor_edges],
+      [neighbor_id for neighbor_edges in forward.values() for neighbor_id in neighbor_edges],
+    ))
+    tables = { id: { 'heard': [], 'heard_by': [] } for id in self.data.nodes.keys() }
+    for id, neighbor_edges in forward.items():
+      heard = tables.setdefault(id, { 'heard': [], 'heard_by': [] })['heard']
+      for neighbor_id, edge in neighbor_edges.items():
+        distance = next(distances)
+        heard.append({ 'id': neighbor_id, 'snr': edge.snr, 'distance': distance })
+        tables.setdefault(neighbor_id, { 'heard': [], 'heard_by': [] })['heard_by'].append({ 'id': id, 'snr': edge.snr, 'distance': distance })
+    return tables
+
+  def patch_neighbor_tables(self, tables: dict[str, dict], positions: NodePositions, moved: set[str]) -> dict[str, dict]:
+    """
+    neighbor_tables() from the tables of the previous pass, when the mesh is the same and only
+    the nodes in moved changed position (or came or went): only the rows along their edges get
+    new distances. Rows are replaced, never changed in place, so changed_node_ids() still sees
+    which node pages changed.
+    """
+    mesh = self.data.mesh
+    affected = set(moved)
+    for id in moved:
+      affected.update(mesh.forward.get(id, {}).keys())
+      affected.update(mesh.reverse.get(id, {}).keys())
+    tables = dict(tables)
+    affected = [id for id in affected if id in tables]
+
+    ids1, ids2 = [], []
+    for id in affected:
+      for row in itertools.chain(tables[id]['heard'], tables[id]['heard_by']):
+        if id in moved or row['id'] in moved:
+          ids1.append(id)
+          ids2.append(row['id'])
+    distances = iter(positions.pair_distances(ids1, ids2))
+    for id in affected:
+      tables[id] = {
+        kind: [dict(row, distance=next(distances)) if id in moved or row['id'] in moved else row for row in tables[id][kind]]
+        for kind in ('heard', 'heard_by')
+      }
+
+    # as neighbor_tables() lists them: every node, and whatever else has edges
+    for id in moved:
+      if id in self.data.nodes:
+        tables.setdefault(id, { 'heard': [], 'heard_by': [] })
+      elif id in tables and len(tables[id]['heard']) == 0 and len(tables[id]['heard_by']) == 0:
+        del tables[id]
+    return tables
+
   ### Page Renderers
 
   def render_chat(self):
     self.render_html_and_save(
       'chat.html',
-      config=self.config,
       nodes=self.data.nodes,
-      chat=self.data.chat,
-      utils=utils,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      chat=self.data.chat
     )
 
   def render_graph(self):
     self.render_html_and_save(
       'graph.html',
-      config=self.config,
       nodes=self.data.nodes,
-      graph=self.data.graph,
-      utils=utils,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      graph=self.data.graph
     )
 
   def render_index(self):
     self.render_html_and_save(
       'index.html',
-      config=self.config,
       nodes=self.data.nodes,
-      active_nodes=self.data.nodes,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      active_nodes=self.data.nodes
     )
 
   def render_map(self):
     server_node = self.data.nodes[self.config['server']['node_id']]
     self.render_html_and_save(
       'map.html',
-      config=self.config,
       server_node=server_node,
-      nodes=self.data.nodes,
-      utils=utils,
-      datetime=datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      nodes=self.data.nodes
     )
 
   def render_mesh_log(self):
     self.render_html_and_save(
       'mesh_log.html',
-      config=self.config,
-      messages=self.data.messages,
-      json=json,
-      datetime=datetime.datetime,
-      JSONEncoder=encoders._JSONEncoder,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      messages=self.data.messages
     )
 
   def render_mqtt_log(self):
     self.render_html_and_save(
       'mqtt_log.html',
-      config=self.config,
       messages=self.data.mqtt_messages,
-      mqtt_connect_time=self.data.mqtt_connect_time,
-      json=json,
-      datetime=datetime.datetime,
-      JSONEncoder=encoders._JSONEncoder,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      mqtt_connect_time=self.data.mqtt_connect_time
     )
 
   def render_neighbors(self):
@@ -139,14 +430,9 @@ class StaticHTMLRenderer:
 
     self.render_html_and_save(
       'neighbors.html',
-      config=self.config,
       nodes=self.data.nodes,
       active_nodes_with_neighbors=active_nodes_with_neighbors,
-      geo=geo,
-      utils=utils,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      neighbors=self.neighbors
     )
 
   def render_nodes(self):
@@ -157,41 +443,29 @@ class StaticHTMLRenderer:
 
     self.render_html_and_save(
       'nodes.html',
-      config=self.config,
       nodes=self.data.nodes,
-      active_nodes=active_nodes,
-      hardware=meshtastic_support.HardwareModel,
-      meshtastic_support=meshtastic_support,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      active_nodes=active_nodes
     )
 
-  def render_nodes_each(self):
-    for id, node in self.data.nodes.items():
+  def render_nodes_each(self, ids=None):
+    for id in ids if ids is not None else list(self.data.nodes.keys()):
+      if id not in self.data.nodes:
+        continue
+      node = self.data.nodes[id]
       id = id.replace('!', '') # todo: remove this line
       self.render_html_and_save(
         f"node_{id}.html",
-        config=self.config,
         node=node,
         nodes=self.data.nodes,
-        hardware=meshtastic_support.HardwareModel,
-        meshtastic_support=meshtastic_support,
-        utils=utils,
-        datetime=datetime.datetime,
-        zoneinfo=ZoneInfo(self.config['server']['timezone']),
-        timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+        neighbors=self.neighbors.get(id, { 'heard': [], 'heard_by': [] }),
+        distance_from_server_node=self.distance(self.config['server']['node_id'], id)
       )
 
   def render_routes(self):
     self.render_html_and_save(
       'routes.html',
-      config=self.config,
       nodes=self.data.nodes,
-      active_nodes=self.data.nodes,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      active_nodes=self.data.nodes
     )
 
   def render_stats(self):
@@ -210,34 +484,22 @@ class StaticHTMLRenderer:
 
     self.render_html_and_save(
       'stats.html',
-      config=self.config,
       stats=stats,
-      nodes=self.data.nodes,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      nodes=self.data.nodes
     )
 
   def render_telemetry(self):
     self.render_html_and_save(
       'telemetry.html',
-      config=self.config,
       nodes=self.data.nodes,
-      telemetry=self.data.telemetry,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      telemetry=self.data.telemetry
     )
 
   def render_traceroutes(self):
     self.render_html_and_save(
       'traceroutes.html',
-      config=self.config,
       nodes=self.data.nodes,
-      traceroutes=self.data.traceroutes,
-      datetime=datetime.datetime,
-      zoneinfo=ZoneInfo(self.config['server']['timezone']),
-      timestamp=datetime.datetime.now(ZoneInfo(self.config['server']['timezone']))
+      traceroutes=self.data.traceroutes
     )
 
   # TODO: move to models
@@ -261,16 +523,11 @@ class StaticHTMLRenderer:
         "last_seen": last_seen,
         "since": datetime.datetime.now(ZoneInfo(self.config['server']['timezone'])) - last_seen,
     }
-    server_node = self.data.nodes[f'{self.config["server"]["node_id"]}']
-    if server_node and 'position' in server_node and node and 'position' in node:
-      if server_node["position"] and 'latitude_i' in server_node["position"] and 'longitude_i' in server_node["position"] and node["position"] and 'latitude_i' in node["position"] and 'longitude_i' in node["position"]:
-        if server_node["position"]["latitude_i"] != 0 and server_node["position"]["longitude_i"] != 0 and node["position"] and node["position"]["latitude_i"] != 0 and node["position"]["longitude_i"] != 0:
-          serialized["distance_from_host_node"] = round(geo.distance_between_two_points(
-              node["position"]["latitude_i"] / 10000000,
-              node["position"]["longitude_i"] / 10000000,
-              server_node["position"]["latitude_i"] / 10000000,
-              server_node["position"]["longitude_i"] / 10000000
-            ), 2)
+    if self.config['server']['node_id'] in self.data.nodes and id in self.data.nodes:
+      position = node["position"]
+      server_position = self.data.nodes[self.config['server']['node_id']]["position"]
+      if position and server_position and position.get("latitude_i") and position.get("longitude_i") and server_position.get("latitude_i") and server_position.get("longitude_i"):
+        serialized["distance_from_host_node"] = self.distance(self.config['server']['node_id'], id)
     return serialized
 
   def _serialize_neighborinfo(self, node):
@@ -285,9 +542,6 @@ class StaticHTMLRenderer:
     """
     Serialize a neighborinfo object to a format suitable for saving to an HTML file.
     """
-    global nodes
-
-    from_node = self.data.nodes[node['id']]
     ns = []
     for n in node['neighborinfo']['neighbors']:
       id = utils.convert_node_id_from_int_to_hex(n["node_id"])
@@ -296,14 +550,7 @@ class StaticHTMLRenderer:
         "snr": n["snr"],
       }
       if id in self.data.nodes:
-        ni = self.data.nodes[id]
-        if from_node['position'] and ni['position'] and 'latitude_i' in from_node['position'] and 'longitude_i' in from_node['position'] and 'latitude_i' in ni['position'] and 'longitude_i' in ni['position']:
-          neighbor["distance"] = round(geo.distance_between_two_points(
-            from_node["position"]["latitude_i"] / 10000000,
-            from_node["position"]["longitude_i"] / 10000000,
-            ni["position"]["latitude_i"] / 10000000,
-            ni["position"]["longitude_i"] / 10000000
-          ), 2)
+        neighbor["distance"] = self.distance(node['id'], id)
       ns.append(neighbor)
     return ns
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# storage interface used by MemoryDataStore to load and persist its state
+
+from abc import ABC, abstractmethod
+
+class Storage(ABC):
+  """
+  Persistence backend for the store.
+
+  load_* return what was persisted (histories newest first, as the store keeps them), or
+  None when there is nothing yet. save() receives the changes DataRenderer collected since
+  the previous save and runs in a worker thread.
+  """
+  @abstractmethod
+  def load_nodes(self) -> dict|None:
+    ...
+
+  @abstractmethod
+  def load_chat(self, limit: int|None = None) -> dict|None:
+    ...
+
+  @abstractmethod
+  def load_telemetry(self, limit: int|None = None) -> list|None:
+    ...
+
+  @abstractmethod
+  def load_traceroutes(self, limit: int|None = None) -> list|None:
+    ...
+
+  def load_snapshot(self) -> dict|None:
+    """
+    The store as of the last full save with its per-node indexes, plus what was saved since
+    under 'journal', for backends that keep a binary snapshot. None to load with load_* instead.
+    """
+    return None
+
+  def wants_full_save(self) -> bool:
+    """
+    Whether the next save() should include a full copy of the store.
+    """
+    return False
+
+  @abstractmethod
+  def save(self, changes: dict):
+    ...
+
+  def close(self):
+    pass
+
+class QueryableStorage(Storage):
+  """
+  A backend that answers time range queries without the in-memory histories, which the store
+  then serves the API's from. The query_* methods return newest first.
+  """
+  @abstractmethod
+  def query_telemetry(self, node_id: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    ...
+
+  @abstractmethod
+  def query_traceroutes(self, node_id: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    ...
+
+  @abstractmethod
+  def query_chat(self, node_id: str|None = None, channel: str|None = None, since: float|None = None, until: float|None = None, limit: int|None = None) -> list:
+    ...
+
+def create_storage(config) -> Storage:
+  """
+  Storage backend selected by server.storage.backend: "json" (default) or "sqlite".
+  """
+  storage_config = config['server']['storage'] if 'storage' in config['server'] else {}
+  backend = storage_config.get('backend', 'json')
+  if backend == 'json':
+    from storage.file import JSONFileStorage
+    return JSONFileStorage(config)
+  if backend == 'sqlite':
+    from storage.db.sqlite import SQLiteStorage
+    return SQLiteStorage(config)
+  raise ValueError(f"Unknown storage backend: {backend}")
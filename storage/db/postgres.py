@@ -1 +1,284 @@
- we
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import time
+import traceback
+
+from ingest import LatencyStats
+import utils
+
+class PostgresStats:
+  def __init__(self):
+    self.connected = False
+    self.pending = 0
+    self.dropped = 0
+    self.failed_batches = 0
+    self.rows = { 'nodes': 0, 'node_infos': 0, 'node_positions': 0 }
+    self.batch = LatencyStats()
+    self.rows_per_sec = 0.0
+
+  def to_dict(self):
+    return {
+      'connected': self.connected,
+      'pending': self.pending,
+      'dropped': self.dropped,
+      'failed_batches': self.failed_batches,
+      'rows': self.rows,
+      'rows_per_sec': round(self.rows_per_sec, 1),
+      'batch': self.batch.to_dict(),
+    }
+
+class PostgresWriter:
+  """
+  Writes node infos and positions to the PostgreSQL/PostGIS schema in postgres/sql/meshinfo.sql
+  (integrations.postgres).
+
+  The MQTT handlers only append rows to in-memory batches; run() flushes them through an
+  asyncpg pool every flush_interval seconds or once batch_size rows are pending, one transaction
+  per batch: nodes are upserted with a single multi-row statement, node_infos are written with
+  COPY and node_positions with a multi-row insert that builds the PostGIS point.
+  """
+  def __init__(self, config):
+    pg_config = config['integrations']['postgres'] if 'postgres' in config['integrations'] else {}
+    self.enabled = pg_config.get('enabled', False)
+    self.dsn = pg_config.get('dsn')
+    self.pool_min_size = pg_config.get('pool_min_size', 1)
+    self.pool_max_size = pg_config.get('pool_max_size', 4)
+    self.batch_size = pg_config.get('batch_size', 1000)
+    self.flush_interval = pg_config.get('flush_interval', 1)
+    self.max_pending = pg_config.get('max_pending', 100000)
+
+    self.pool = None
+    self.stats = PostgresStats()
+    self.heard: dict[int, datetime.datetime] = {}
+    self.pending_node_infos: list[tuple] = []
+    self.pending_positions: list[tuple] = []
+    self.flush_needed = asyncio.Event()
+
+  ### producers (called from the MQTT handlers)
+
+  def add_node_info(self, node_id: str, info: dict, msg: dict):
+    id = self._node_id(node_id)
+    if not self.enabled or id is None or not self._reserve():
+      return
+    heard_at = self._heard_at(msg)
+    self._heard(id, heard_at)
+    hardware = info['hardware'] if 'hardware' in info else info.get('hw_model')
+    # clipped to the column sizes, so one odd node info cannot fail a whole COPY
+    self.pending_node_infos.append((
+      id,
+      self._clip(info.get('longname', info.get('long_name')), 100),
+      self._clip(info.get('shortname', info.get('short_name')), 10),
+      self._clip(info.get('macaddr'), 20),
+      self._clip(hardware, 20),
+      self._clip(info['role'] if 'role' in info else None, None),
+      heard_at,
+    ))
+    self._pending_changed()
+
+  def add_position(self, node_id: str, position: dict|None, msg: dict):
+    if not self.enabled or position is None:
+      return
+    if 'latitude_i' not in position or 'longitude_i' not in position or not position['latitude_i'] or not position['longitude_i']:
+      return
+    id = self._node_id(node_id)
+    if id is None or not self._reserve():
+      return
+    heard_at = self._heard_at(msg)
+    self._heard(id, heard_at)
+    self.pending_positions.append((
+      id,
+      position['latitude_i'] / 10000000,
+      position['longitude_i'] / 10000000,
+      float(position['altitude']) if 'altitude' in position and position['altitude'] is not None else None,
+      heard_at,
+    ))
+    self._pending_changed()
+
+  @staticmethod
+  def _clip(value, length: int|None) -> str|None:
+    if value is None:
+      return None
+    value = str(value)
+    return value[:length] if length is not None else value
+
+  @staticmethod
+  def _node_id(node_id: str) -> int|None:
+    try:
+      return utils.convert_node_id_from_hex_to_int(node_id)
+    except (AttributeError, ValueError):
+      return None
+
+  def _reserve(self):
+    if len(self.pending_node_infos) + len(self.pending_positions) >= self.max_pending:
+      self.stats.dropped += 1
+      return False
+    return True
+
+  def _pending_changed(self):
+    self.stats.pending = len(self.pending_node_infos) + len(self.pending_positions)
+    if self.stats.pending >= self.batch_size:
+      self.flush_needed.set()
+
+  @staticmethod
+  def _heard_at(msg: dict):
+    at = utils.message_timestamp(msg)
+    return datetime.datetime.fromtimestamp(at if at is not None else time.time(), tz=datetime.timezone.utc)
+
+  def _heard(self, id: int, heard_at: datetime.datetime):
+    if id not in self.heard or self.heard[id] < heard_at:
+      self.heard[id] = heard_at
+
+  ### writer
+
+  async def connect(self):
+    """
+    Open the pool, retrying with backoff until the database is reachable. Rows keep queuing
+    (up to max_pending) meanwhile, and the read paths answer 503.
+    """
+    import asyncpg # only needed when the integration is enabled
+    delay = 1
+    while True:
+      try:
+        self.pool = await asyncpg.create_pool(dsn=self.dsn, min_size=self.pool_min_size, max_size=self.pool_max_size)
+        break
+      except Exception as e:
+        print(f"Postgres connection failed, retrying in {delay} seconds: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+    self.stats.connected = True
+    print(f"Connected to Postgres (pool {self.pool_min_size}-{self.pool_max_size})")
+
+  async def run(self):
+    if not self.enabled:
+      return
+    # runs in the app's task group: never raise, that would take ingest and the API down with it
+    try:
+      await self.connect()
+    except ImportError as e:
+      print(f"Postgres integration disabled: {e}")
+      return
+    try:
+      while True:
+        try:
+          await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+          pass
+        await self.flush()
+    finally:
+      try:
+        await asyncio.shield(self.flush())
+      finally:
+        self.stats.connected = False
+        await self.pool.close()
+
+  def _take_batch(self):
+    self.flush_needed.clear()
+    heard = [(id, at) for id, at in self.heard.items()]
+    node_infos = self.pending_node_infos
+    node_positions = self.pending_positions
+    self.heard = {}
+    self.pending_node_infos = []
+    self.pending_positions = []
+    self.stats.pending = 0
+    return heard, node_infos, node_positions
+
+  def _return_batch(self, heard, node_infos, node_positions):
+    # a failed batch goes back in front of what was added meanwhile, for the next flush; past
+    # max_pending the oldest rows are dropped
+    for id, at in heard:
+      self._heard(id, at)
+    self.pending_node_infos = node_infos + self.pending_node_infos
+    self.pending_positions = node_positions + self.pending_positions
+    excess = len(self.pending_node_infos) + len(self.pending_positions) - self.max_pending
+    if excess > 0:
+      dropped = min(excess, len(self.pending_node_infos))
+      del self.pending_node_infos[:dropped]
+      del self.pending_positions[:excess - dropped]
+      self.stats.dropped += excess
+    self.stats.pending = len(self.pending_node_infos) + len(self.pending_positions)
+
+  async def flush(self):
+    heard, node_infos, node_positions = self._take_batch()
+    if len(heard) == 0:
+      return
+    start = time.monotonic()
+    try:
+      async with self.pool.acquire() as connection:
+        async with connection.transaction():
+          await self.write_batch(connection, heard, node_infos, node_positions)
+    except Exception as e:
+      self.stats.failed_batches += 1
+      print(f"Postgres batch failed ({len(node_infos)} node infos, {len(node_positions)} positions), retrying: {e}")
+      traceback.print_exc()
+      self._return_batch(heard, node_infos, node_positions)
+      return
+    elapsed = time.monotonic() - start
+    rows = len(heard) + len(node_infos) + len(node_positions)
+    self.stats.batch.observe(elapsed)
+    self.stats.rows['nodes'] += len(heard)
+    self.stats.rows['node_infos'] += len(node_infos)
+    self.stats.rows['node_positions'] += len(node_positions)
+    self.stats.rows_per_sec = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Postgres: wrote {rows} rows in {round(elapsed * 1000, 1)} ms ({round(self.stats.rows_per_sec)} rows/s)")
+
+  @staticmethod
+  async def write_batch(connection, heard, node_infos, node_positions):
+    await connection.execute(
+      """
+      INSERT INTO nodes (id, first_heard_at, last_heard_at)
+      SELECT id, heard_at, heard_at FROM unnest($1::bigint[], $2::timestamptz[]) AS t (id, heard_at)
+      ON CONFLICT (id) DO UPDATE SET last_heard_at = GREATEST(nodes.last_heard_at, excluded.last_heard_at)
+      """,
+      [id for id, _ in heard],
+      [at for _, at in heard],
+    )
+    if len(node_infos) > 0:
+      await connection.copy_records_to_table(
+        'node_infos',
+        records=node_infos,
+        columns=['node_id', 'long_name', 'short_name', 'mac_addr', 'hw_model', 'role', 'created_at'],
+      )
+    if len(node_positions) > 0:
+      await connection.execute(
+        """
+        INSERT INTO node_positions (node_id, latitude, longitude, altitude, geom, created_at)
+        SELECT node_id, latitude, longitude, altitude, ST_SetSRID(ST_MakePoint(longitude, latitude, COALESCE(altitude, 0)), 4326), created_at
+        FROM unnest($1::bigint[], $2::float8[], $3::float8[], $4::float8[], $5::timestamptz[]) AS t (node_id, latitude, longitude, altitude, created_at)
+        """,
+        [row[0] for row in node_positions],
+        [row[1] for row in node_positions],
+        [row[2] for row in node_positions],
+        [row[3] for row in node_positions],
+        [row[4] for row in node_positions],
+      )
+
+  ### read paths
+
+  async def node_infos(self, node_id: str, limit: int = 100) -> list[dict]:
+    rows = await self.pool.fetch(
+      "SELECT long_name, short_name, mac_addr, hw_model, role, created_at FROM node_infos WHERE node_id = $1 ORDER BY created_at DESC LIMIT $2",
+      self._node_id(node_id),
+      limit,
+    )
+    return [dict(row) for row in rows]
+
+  async def node_positions(self, node_id: str, since: float|None = None, until: float|None = None, limit: int = 1000) -> list[dict]:
+    rows = await self.pool.fetch(
+      """
+      SELECT latitude, longitude, altitude, created_at FROM node_positions
+      WHERE node_id = $1 AND ($2::timestamptz IS NULL OR created_at >= $2) AND ($3::timestamptz IS NULL OR created_at <= $3)
+      ORDER BY created_at DESC LIMIT $4
+      """,
+      self._node_id(node_id),
+      self._datetime(since),
+      self._datetime(until),
+      limit,
+    )
+    return [dict(row) for row in rows]
+
+  @staticmethod
+  def _datetime(at: float|None):
+    return datetime.datetime.fromtimestamp(at, tz=datetime.timezone.utc) if at is not None else None
+
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import threading
+
+from encoders import _JSONDecoder, _JSONEncoder
+from storage.base import QueryableStorage
+import utils
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+  id TEXT NOT NULL PRIMARY KEY,
+  last_seen TEXT,
+  data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channels (
+  id TEXT NOT NULL PRIMARY KEY,
+  name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  channel_id TEXT NOT NULL,
+  from_node_id TEXT,
+  to_node_id TEXT,
+  timestamp REAL,
+  data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_messages_channel_timestamp ON chat_messages (channel_id, timestamp);
+CREATE INDEX IF NOT EXISTS chat_messages_from_timestamp ON chat_messages (from_node_id, timestamp);
+CREATE INDEX IF NOT EXISTS chat_messages_to_timestamp ON chat_messages (to_node_id, timestamp);
+CREATE INDEX IF NOT EXISTS chat_messages_timestamp ON chat_messages (timestamp);
+
+CREATE TABLE IF NOT EXISTS telemetry (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  node_id TEXT,
+  timestamp REAL,
+  data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS telemetry_node_timestamp ON telemetry (node_id, timestamp);
+CREATE INDEX IF NOT EXISTS telemetry_timestamp ON telemetry (timestamp);
+
+CREATE TABLE IF NOT EXISTS traceroutes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  from_node_id TEXT,
+  to_node_id TEXT,
+  timestamp REAL,
+  data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traceroutes_from_timestamp ON traceroutes (from_node_id, timestamp);
+CREATE INDEX IF NOT EXISTS traceroutes_to_timestamp ON traceroutes (to_node_id, timestamp);
+CREATE INDEX IF NOT EXISTS traceroutes_timestamp ON traceroutes (timestamp);
+"""
+
+class SQLiteStorage(QueryableStorage):
+  """
+  Embedded SQLite storage (server.storage.sqlite).
+
+  Nodes are upserted, history items are appended, each save() is a single transaction.
+  The database runs in WAL mode so API queries can read while a save is writing; history is
+  kept beyond the in-memory retention limits and served through the query_* methods.
+  """
+  def __init__(self, config):
+    self.config = config
+    storage_config = config['server']['storage'] if 'storage' in config['server'] else {}
+    sqlite_config = storage_config['sqlite'] if 'sqlite' in storage_config else {}
+    self.path = sqlite_config.get('path', f"{config['paths']['data']}/meshinfo.db")
+    self.batch_size = sqlite_config.get('batch_size', 5000)
+    self.writer: sqlite3.Connection|None = None
+    self.reader: sqlite3.Connection|None = None
+    self.write_lock = threading.Lock()
+    self.read_lock = threading.Lock()
+
+  def connect(self):
+    connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    return connection
+
+  def get_writer(self):
+    if self.writer is None:
+      directory = os.path.dirname(self.path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      self.writer = self.connect()
+      self.writer.executescript(SCHEMA)
+    return self.writer
+
+  def get_reader(self):
+    if self.reader is None:
+      self.get_writer() # make sure the schema exists
+      self.reader = self.connect()
+    return self.reader
+
+  def close(self):
+    for connection in (self.reader, self.writer):
+      if connection is not None:
+        connection.close()
+    self.reader = None
+    self.writer = None
+
+  @staticmethod
+  def encode(obj):
+    return json.dumps(obj, sort_keys=True, cls=_JSONEncoder)
+
+  @staticmethod
+  def decode(data):
+    return json.loads(data, cls=_JSONDecoder)
+
+  def select(self, sql, params=()):
+    with self.read_lock:
+      return self.get_reader().execute(sql, params).fetchall()
+
+  ### load
+
+  def load_nodes(self):
+    rows = self.select("SELECT id, data FROM nodes")
+    if len(rows) == 0:
+      return None
+    return { id: self.decode(data) for id, data in rows }
+
+  def load_chat(self, limit=None):
+    channels = self.select("SELECT id, name FROM channels")
+    if len(channels) == 0:
+      return None
+    chat = { 'channels': {} }
+    for id, name in channels:
+      chat['channels'][id] = { 'name': name, 'messages': self.query_chat(channel=id, limit=limit) }
+    return chat
+
+  def load_telemetry(self, limit=None):
+    rows = self.query_telemetry(limit=limit)
+    return rows if len(rows) > 0 else None
+
+  def load_traceroutes(self, limit=None):
+    rows = self.query_traceroutes(limit=limit)
+    return rows if len(rows) > 0 else None
+
+  ### queries (newest first)
+
+  def query(self, table, where, params, limit):
+    return [self.decode(data) for _, _, data in self.query_rows(table, where, params, limit)]
+
+  def query_rows(self, table, where, params, limit):
+    sql = f"SELECT seq, timestamp, data FROM {table}"
+    if len(where) > 0:
+      sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, seq DESC"
+    if limit is not None:
+      sql += " LIMIT ?"
+      params = params + [limit]
+    return self.select(sql, params)
+
+  def query_either_node(self, table, node_id, where, params, limit):
+    # one indexed lookup per column instead of an OR, which would scan the table
+    rows = {}
+    for column in ("from_node_id", "to_node_id"):
+      for row in self.query_rows(table, [f"{column} = ?"] + where, [node_id] + params, limit):
+        rows[row[0]] = row
+    ordered = sorted(rows.values(), key=lambda row: (row[1] if row[1] is not None else 0, row[0]), reverse=True)
+    if limit is not None:
+      ordered = ordered[:limit]
+    return [self.decode(data) for _, _, data in ordered]
+
+  @staticmethod
+  def time_range(since, until):
+    where, params = [], []
+    if since is not None:
+      where.append("timestamp >= ?")
+      params.append(since)
+    if until is not None:
+      where.append("timestamp <= ?")
+      params.append(until)
+    return where, params
+
+  def query_telemetry(self, node_id=None, since=None, until=None, limit=None):
+    where, params = self.time_range(since, until)
+    if node_id is not None:
+      where.append("node_id = ?")
+      params.append(node_id)
+    return self.query("telemetry", where, params, limit)
+
+  def query_traceroutes(self, node_id=None, since=None, until=None, limit=None):
+    where, params = self.time_range(since, until)
+    if node_id is not None:
+      return self.query_either_node("traceroutes", node_id, where, params, limit)
+    return self.query("traceroutes", where, params, limit)
+
+  def query_chat(self, node_id=None, channel=None, since=None, until=None, limit=None):
+    where, params = self.time_range(since, until)
+    if channel is not None:
+      where.append("channel_id = ?")
+      params.append(channel)
+    if node_id is not None:
+      return self.query_either_node("chat_messages", node_id, where, params, limit)
+    return self.query("chat_messages", where, params, limit)
+
+  ### save (runs in a worker thread)
+
+  def save(self, changes):
+    nodes = [(id, node['last_seen'].isoformat() if hasattr(node['last_seen'], 'isoformat') else node['last_seen'], self.encode(node)) for id, node in changes['nodes'].items() if node is not None]
+    removed = [(id,) for id, node in changes['nodes'].items() if node is None]
+    channels = { entry['channel']: entry['name'] for entry in changes['chat'] }
+    chat = [(entry['channel'], entry['message'].get('from'), entry['message'].get('to'), utils.message_timestamp(entry['message']), self.encode(entry['message'])) for entry in changes['chat']]
+    telemetry = [(msg.get('from'), utils.message_timestamp(msg), self.encode(msg)) for msg in changes['telemetry']]
+    traceroutes = [(msg.get('from'), msg.get('to'), utils.message_timestamp(msg), self.encode(msg)) for msg in changes['traceroutes']]
+
+    with self.write_lock:
+      connection = self.get_writer()
+      connection.execute("BEGIN")
+      try:
+        self.execute_batched(connection, "INSERT INTO nodes (id, last_seen, data) VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET last_seen = excluded.last_seen, data = excluded.data", nodes)
+        self.execute_batched(connection, "DELETE FROM nodes WHERE id = ?", removed)
+        self.execute_batched(connection, "INSERT INTO channels (id, name) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET name = excluded.name", list(channels.items()))
+        self.execute_batched(connection, "INSERT INTO chat_messages (channel_id, from_node_id, to_node_id, timestamp, data) VALUES (?, ?, ?, ?, ?)", chat)
+        self.execute_batched(connection, "INSERT INTO telemetry (node_id, timestamp, data) VALUES (?, ?, ?)", telemetry)
+        self.execute_batched(connection, "INSERT INTO traceroutes (from_node_id, to_node_id, timestamp, data) VALUES (?, ?, ?, ?)", traceroutes)
+        connection.execute("COMMIT")
+      except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    print(f"Saved {len(nodes)} nodes, {len(chat)} chat messages, {len(telemetry)} telemetry, {len(traceroutes)} traceroutes to {self.path}")
+
+  def execute_batched(self, connection, sql, rows):
+    for i in range(0, len(rows), self.batch_size):
+      connection.executemany(sql, rows[i:i + self.batch_size])
@@ -2,15 +2,193 @@
 #
 # functions to save and load data to files (json, html, etc)
 
-class JSONFileStorage():
-  def chat_load():
-    pass
+import gc
+import json
+import os
+import pickle
 
-  def chat_save():
-    pass
+from encoders import _JSONDecoder, _JSONEncoder
+from output_writer import OutputWriter
+from storage.base import Storage
 
-  def nodes_load():
-    pass
+HISTORIES = ['telemetry', 'traceroutes']
 
-  def nodes_save():
-    pass
+SNAPSHOT_VERSION = 1
+
+class JSONFileStorage(Storage):
+  """
+  Stores the nodes, chat, telemetry and traceroutes as JSON files in the data directory.
+
+  A full save writes the complete files. Saves in between only append what changed to
+  <name>.journal.jsonl files, which are replayed on top of the full files when loading.
+  Once the journals exceed compact_after lines the next save is a full one.
+
+  Every full save also writes snapshot.pickle: the same data plus the per-node indexes in
+  pickle form, which loads several times faster than the JSON and skips rebuilding the
+  indexes. It is only used while it is at least as new as the JSON files next to it.
+  """
+  def __init__(self, config):
+    self.config = config
+    persistence = config['server']['persistence'] if 'persistence' in config['server'] else {}
+    self.compact_after = persistence.get('compact_after', 10000)
+    self.snapshot = persistence.get('snapshot', True)
+    self.snapshot_stale = False
+    self.journal_lines = 0
+    # the data directory is not served, so no precompressed copies; hashes skip rewriting unchanged files
+    self.writer = OutputWriter(hashes={})
+
+  def path(self, filename):
+    return f"{self.config['paths']['data']}/{filename}"
+
+  ### load
+
+  def load_nodes(self):
+    nodes = self.load_json_file("nodes.json")
+    journal = self.load_journal("nodes")
+    if len(journal) > 0:
+      nodes = nodes if nodes is not None else {}
+      for entry in journal:
+        if entry['node'] is None:
+          nodes.pop(entry['id'], None)
+        else:
+          nodes[entry['id']] = entry['node']
+      print(f"Applied {len(journal)} node updates from journal")
+    return nodes
+
+  def load_chat(self, limit=None):
+    chat = self.load_json_file("chat.json")
+    journal = self.load_journal("chat")
+    if chat is None and len(journal) > 0:
+      chat = { 'channels': {} }
+    if chat is not None:
+      for entry in journal:
+        if entry['channel'] not in chat['channels']:
+          chat['channels'][entry['channel']] = { 'name': entry['name'], 'messages': [] }
+        chat['channels'][entry['channel']]['messages'].insert(0, entry['message'])
+    return chat
+
+  def load_telemetry(self, limit=None):
+    return self.load_history("telemetry")
+
+  def load_traceroutes(self, limit=None):
+    return self.load_history("traceroutes")
+
+  def load_history(self, name):
+    items = self.load_json_file(f"{name}.json")
+    journal = self.load_journal(name)
+    if items is None and len(journal) == 0:
+      return None
+    return list(reversed(journal)) + (items if items is not None else [])
+
+  def load_snapshot(self):
+    if not self.snapshot:
+      return None
+    path = self.path("snapshot.pickle")
+    if not os.path.exists(path):
+      self.snapshot_stale = True
+      return None
+    snapshot_time = os.path.getmtime(path)
+    for name in ['nodes', 'chat'] + HISTORIES:
+      if os.path.exists(self.path(f"{name}.json")) and os.path.getmtime(self.path(f"{name}.json")) > snapshot_time:
+        print(f"Snapshot is older than {name}.json, loading JSON instead")
+        self.snapshot_stale = True
+        return None
+
+    # the snapshot is millions of small objects, the cyclic GC only slows creating them down
+    gc.disable()
+    try:
+      with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    except Exception as e:
+      print(f"Failed to load snapshot ({e}), loading JSON instead")
+      self.snapshot_stale = True
+      return None
+    finally:
+      gc.enable()
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+      print(f"Snapshot version {snapshot.get('version')} is not supported, loading JSON instead")
+      self.snapshot_stale = True
+      return None
+
+    snapshot['journal'] = { name: self.load_journal(name) for name in ['nodes', 'chat'] + HISTORIES }
+    return snapshot
+
+  def load_json_file(self, filename):
+    if os.path.exists(self.path(filename)):
+        with open(self.path(filename), "r", encoding='utf-8') as f:
+            n = json.load(f, cls=_JSONDecoder)
+            return n
+    else:
+        return None
+
+  def load_journal(self, name):
+    """
+    Entries appended since the last full save, oldest first.
+    """
+    filename = self.path(f"{name}.journal.jsonl")
+    entries = []
+    if os.path.exists(filename):
+      with open(filename, "r", encoding='utf-8') as f:
+        for line in f:
+          try:
+            entries.append(json.loads(line, cls=_JSONDecoder))
+          except json.JSONDecodeError:
+            print(f"Skipping truncated line in {filename}")
+    self.journal_lines += len(entries)
+    return entries
+
+  ### save (runs in a worker thread)
+
+  def wants_full_save(self):
+    return self.journal_lines >= self.compact_after or self.snapshot_stale
+
+  def save(self, changes):
+    full = changes['full']
+    if full is not None:
+      self.save_file("chat.json", full['chat'])
+      print(f"Saved {len(full['chat']['channels']['0']['messages'])} chat messages to file ({self.path('chat.json')})")
+
+      self.save_file("nodes.json", full['nodes'])
+      print(f"Saved {len(full['nodes'])} nodes to file ({self.path('nodes.json')})")
+
+      for name in HISTORIES:
+        self.save_file(f"{name}.json", full[name])
+        print(f"Saved {len(full[name])} {name} to file ({self.path(f'{name}.json')})")
+
+      if self.snapshot:
+        self.save_snapshot(full)
+
+      for name in ['nodes', 'chat'] + HISTORIES:
+        if os.path.exists(self.path(f"{name}.journal.jsonl")):
+          os.remove(self.path(f"{name}.journal.jsonl"))
+      self.journal_lines = 0
+      return
+
+    self.append_journal("nodes", [{ 'id': id, 'node': node } for id, node in changes['nodes'].items()])
+    self.append_journal("chat", changes['chat'])
+    for name in HISTORIES:
+      self.append_journal(name, changes[name])
+    print(f"Journaled {len(changes['nodes'])} nodes, {len(changes['chat'])} chat messages, " + ", ".join(f"{len(changes[name])} {name}" for name in HISTORIES) + f" ({self.journal_lines} journal lines since last compaction)")
+
+  def save_snapshot(self, full):
+    snapshot = { 'version': SNAPSHOT_VERSION }
+    snapshot.update(full)
+    path = self.path("snapshot.pickle")
+    with open(f"{path}.tmp", "wb") as f:
+      pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+    self.snapshot_stale = False
+    print(f"Saved snapshot ({path})")
+
+  def save_file(self, filename, data):
+    print(f"Saving {filename}")
+    chunks = _JSONEncoder(indent=2, sort_keys=True).iterencode(data)
+    if not self.writer.write_chunks(self.path(filename), chunks, key=filename):
+      print(f"{filename} unchanged")
+
+  def append_journal(self, name, entries):
+    if len(entries) == 0:
+      return
+    with open(self.path(f"{name}.journal.jsonl"), "a", encoding='utf-8') as f:
+      f.write("".join(json.dumps(entry, sort_keys=True, cls=_JSONEncoder) + "\n" for entry in entries))
+    self.journal_lines += len(entries)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+from array import array
+import bisect
+import time
+
+import numpy
+
+import utils
+
+# resolution name -> bucket width in seconds
+RESOLUTIONS = { '1m': 60, '1h': 3600, '1d': 86400 }
+
+# rollups kept as they are added to; finer resolutions are bucketed from the raw samples when queried
+STORED_ROLLUPS = ('1h', '1d')
+
+# how long samples and rollups are kept (seconds, None: for as long as the store runs)
+RETENTION_DEFAULTS = { 'raw': 86400, '1h': 30 * 86400, '1d': 365 * 86400 }
+
+def _buckets(times: numpy.ndarray, values: numpy.ndarray, width: int) -> dict:
+  # raw samples (sorted by time) into fixed-width buckets, as Rollup.query() returns them
+  if len(times) == 0:
+    return { 't': times, 'min': values, 'max': values, 'avg': values, 'count': numpy.zeros(0, dtype=numpy.uint32) }
+  starts, first = numpy.unique(times - times % width, return_index=True)
+  counts = numpy.diff(numpy.append(first, len(times)))
+  return {
+    't': starts,
+    'min': numpy.minimum.reduceat(values, first),
+    'max': numpy.maximum.reduceat(values, first),
+    'avg': (numpy.add.reduceat(values.astype(numpy.float64), first) / counts).astype(numpy.float32),
+    'count': counts,
+  }
+
+class Rollup:
+  """
+  Fixed-width buckets of one metric: min, max, sum and count per bucket, oldest first.
+  """
+  __slots__ = ('width', 'starts', 'mins', 'maxs', 'sums', 'counts')
+
+  def __init__(self, width: int):
+    self.width = width
+    self.starts = array('I')
+    self.mins = array('f')
+    self.maxs = array('f')
+    self.sums = array('d')
+    self.counts = array('I')
+
+  def add(self, at: int, value: float):
+    start = at - at % self.width
+    if len(self.starts) == 0 or start > self.starts[-1]:
+      i = len(self.starts)
+    else:
+      # late sample, usually for the last bucket
+      i = bisect.bisect_left(self.starts, start)
+      if self.starts[i] == start:
+        self.mins[i] = min(self.mins[i], value)
+        self.maxs[i] = max(self.maxs[i], value)
+        self.sums[i] += value
+        self.counts[i] += 1
+        return
+    self.starts.insert(i, start)
+    self.mins.insert(i, value)
+    self.maxs.insert(i, value)
+    self.sums.insert(i, value)
+    self.counts.insert(i, 1)
+
+  def prune(self, cutoff: float) -> bool:
+    # drop buckets that end before cutoff; True when any were
+    i = bisect.bisect_right(self.starts, cutoff - self.width)
+    if i > 0:
+      for column in (self.starts, self.mins, self.maxs, self.sums, self.counts):
+        del column[:i]
+    return i > 0
+
+  def query(self, start: float|None, end: float|None) -> dict:
+    i = bisect.bisect_right(self.starts, start - self.width) if start is not None else 0
+    j = bisect.bisect_right(self.starts, end) if end is not None else len(self.starts)
+    # over copies (the slices), the arrays cannot grow while a view of them is alive; float32 is
+    # encoded with the digits it has (encoders.dumps), rather than e.g. 3.2999999523
+    counts = numpy.frombuffer(self.counts[i:j], dtype=numpy.uint32)
+    return {
+      't': numpy.frombuffer(self.starts[i:j], dtype=numpy.uint32),
+      'min': numpy.frombuffer(self.mins[i:j], dtype=numpy.float32),
+      'max': numpy.frombuffer(self.maxs[i:j], dtype=numpy.float32),
+      'avg': (numpy.frombuffer(self.sums[i:j], dtype=numpy.float64) / counts).astype(numpy.float32),
+      'count': counts,
+    }
+
+  def __len__(self):
+    return len(self.starts)
+
+  def copy(self):
+    copied = Rollup(self.width)
+    for name in ('starts', 'mins', 'maxs', 'sums', 'counts'):
+      setattr(copied, name, array(getattr(self, name).typecode, getattr(self, name)))
+    return copied
+
+class MetricSeries:
+  """
+  One metric of one node: the raw samples (times and values, oldest first) and the stored rollups.
+  """
+  __slots__ = ('times', 'values', 'rollups')
+
+  def __init__(self, rollups=STORED_ROLLUPS):
+    self.times = array('I')
+    self.values = array('f')
+    self.rollups: dict[str, Rollup] = { name: Rollup(RESOLUTIONS[name]) for name in rollups }
+
+  def add(self, at: int, value: float):
+    if len(self.times) == 0 or at >= self.times[-1]:
+      self.times.append(at)
+      self.values.append(value)
+    else:
+      i = bisect.bisect_right(self.times, at)
+      self.times.insert(i, at)
+      self.values.insert(i, value)
+    for rollup in self.rollups.values():
+      rollup.add(at, value)
+
+  def prune(self, cutoff: float) -> bool:
+    i = bisect.bisect_left(self.times, cutoff)
+    if i > 0:
+      del self.times[:i]
+      del self.values[:i]
+    return i > 0
+
+  def range(self, start: float|None, end: float|None) -> tuple[int, int]:
+    i = bisect.bisect_left(self.times, start) if start is not None else 0
+    j = bisect.bisect_right(self.times, end) if end is not None else len(self.times)
+    return i, j
+
+  def query(self, resolution: str, start: float|None, end: float|None) -> dict:
+    if resolution in self.rollups:
+      return self.rollups[resolution].query(start, end)
+    i, j = self.range(start, end)
+    times = numpy.frombuffer(self.times[i:j], dtype=numpy.uint32)
+    values = numpy.frombuffer(self.values[i:j], dtype=numpy.float32)
+    if resolution == 'raw':
+      return { 't': times, 'v': values }
+    return _buckets(times, values, RESOLUTIONS[resolution])
+
+  def empty(self) -> bool:
+    return len(self.times) == 0 and all(len(rollup) == 0 for rollup in self.rollups.values())
+
+  def copy(self):
+    copied = MetricSeries(())
+    copied.times = array('I', self.times)
+    copied.values = array('f', self.values)
+    copied.rollups = { name: rollup.copy() for name, rollup in self.rollups.items() }
+    return copied
+
+class TelemetrySeries:
+  """
+  Telemetry as numbers: per node, per metric (battery_level, voltage, channel_utilization,
+  air_util_tx, temperature, relative_humidity, ...) array-backed time series of the raw samples
+  and of 1h/1d min/max/avg rollups, each kept for its own retention (server.telemetry_series).
+  1m buckets are made from the raw samples when asked for.
+
+  A sample takes 8 bytes (uint32 seconds, float32 value) and a rollup bucket 24, where a
+  telemetry message in the histories takes about 500, so charts can reach back much further
+  than the message history does. Queries are bisections on the time column.
+  """
+  def __init__(self, enabled: bool = True, retention: dict|None = None, max_points: int = 1000):
+    self.enabled = enabled
+    self.retention = RETENTION_DEFAULTS.copy()
+    self.retention.update(retention if retention is not None else {})
+    self.resolutions = ['raw'] + list(RESOLUTIONS.keys())
+    self.max_points = max_points
+    self.nodes: dict[str, dict[str, MetricSeries]] = {}
+    # bumped on every change, like RingBuffer.version
+    self.version = 0
+
+  @classmethod
+  def from_config(cls, config):
+    series = config['server']['telemetry_series'] if 'telemetry_series' in config['server'] else {}
+    return cls(enabled=series.get('enabled', True), retention=series.get('retention'), max_points=series.get('max_points', 1000))
+
+  def add(self, id: str, msg: dict, at: float|None = None):
+    """
+    Record the numeric fields of a telemetry message's payload, at its timestamp when it has one.
+    """
+    payload = msg.get('payload')
+    if not self.enabled or not isinstance(payload, dict):
+      return
+    timestamp = utils.message_timestamp(msg)
+    if timestamp is None:
+      timestamp = at if at is not None else time.time()
+    # times are uint32 seconds; messages carry whatever timestamp their sender set
+    if not 0 <= timestamp < 2**32:
+      return
+    timestamp = int(timestamp)
+    # float32 holds up to about 3.4e38, NaN and infinities are left out as well
+    values = [
+      (metric, value) for metric, value in payload.items()
+      if not isinstance(value, bool) and isinstance(value, (int, float)) and -3.4e38 < value < 3.4e38
+    ]
+    if len(values) == 0:
+      return
+    metrics = self.nodes.setdefault(id, {})
+    for metric, value in values:
+      if metric not in metrics:
+        metrics[metric] = MetricSeries()
+      metrics[metric].add(timestamp, value)
+    self.version += 1
+
+  def add_history(self, history):
+    """
+    Record the messages of a newest-first telemetry history (a RingBuffer), e.g. when the
+    series were not restored with the rest of the store.
+    """
+    for msg, at in zip(reversed(history), reversed(history.times)):
+      if 'from' in msg:
+        self.add(msg['from'], msg, at=at)
+
+  def prune(self, now: float|None = None):
+    now = now if now is not None else time.time()
+    pruned = False
+    for id in list(self.nodes.keys()):
+      metrics = self.nodes[id]
+      for metric in list(metrics.keys()):
+        series = metrics[metric]
+        if self.retention['raw'] is not None:
+          pruned = series.prune(now - self.retention['raw']) or pruned
+        for name, rollup in series.rollups.items():
+          if self.retention[name] is not None:
+            pruned = rollup.prune(now - self.retention[name]) or pruned
+        if series.empty():
+          del metrics[metric]
+      if len(metrics) == 0:
+        del self.nodes[id]
+    # called on every scheduler tick: leave the version (and the responses cached on it) alone
+    # unless something was dropped
+    if pruned:
+      self.version += 1
+
+  def resolution_for(self, id: str, metrics: list[str], start: float|None, end: float|None) -> str:
+    """
+    The finest resolution that still covers start and gives at most max_points per metric.
+    """
+    now = time.time()
+    series = [self.nodes[id][metric] for metric in metrics if metric in self.nodes.get(id, {})]
+    if start is None:
+      start = min((s.times[0] for s in series if len(s.times) > 0), default=now)
+    span = (end if end is not None else now) - start
+    for name in self.resolutions:
+      retention = self.retention[name if name in STORED_ROLLUPS else 'raw']
+      if retention is not None and start < now - retention:
+        continue
+      if name == 'raw':
+        if max((j - i for i, j in (s.range(start, end) for s in series)), default=0) <= self.max_points:
+          return name
+      elif span / RESOLUTIONS[name] <= self.max_points:
+        return name
+    return self.resolutions[-1]
+
+  def query(self, id: str, metrics: list[str]|None = None, start: float|None = None, end: float|None = None, resolution: str = 'auto') -> tuple[str, dict]:
+    """
+    The series of one node between start and end (epoch seconds), oldest first, and the
+    resolution they are in: 'raw' samples ({ t, v }) or buckets ({ t, min, max, avg, count },
+    t the start of each bucket), as numpy arrays. 'auto' picks one with resolution_for().
+    """
+    available = self.nodes.get(id, {})
+    metrics = [metric for metric in metrics if metric in available] if metrics is not None else list(available.keys())
+    if resolution == 'auto':
+      resolution = self.resolution_for(id, metrics, start, end)
+    return resolution, { metric: available[metric].query(resolution, start, end) for metric in metrics }
+
+  def copy(self):
+    copied = TelemetrySeries(self.enabled, self.retention, self.max_points)
+    copied.nodes = { id: { metric: series.copy() for metric, series in metrics.items() } for id, metrics in self.nodes.items() }
+    copied.version = self.version
+    return copied
+
+  def stats(self) -> dict:
+    series = [s for metrics in self.nodes.values() for s in metrics.values()]
+    samples = sum(len(s.times) for s in series)
+    buckets = { name: sum(len(s.rollups[name]) for s in series) for name in STORED_ROLLUPS }
+    return {
+      'enabled': self.enabled,
+      'nodes': len(self.nodes),
+      'series': len(series),
+      'samples': samples,
+      'buckets': buckets,
+      'bytes': samples * 8 + sum(buckets.values()) * 24,
+    }
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import datetime
-import requests
 from geo import distance_between_two_points
 
 def calculate_distance_between_nodes(node1, node2):
@@ -35,16 +34,12 @@ def days_since_datetime(dt: datetime.datetime):
   diff = now - dt
   return diff.days
 
-def geocode_position(api_key: str, latitude: float, longitude: float):
-  if latitude is None or longitude is None:
-    return None
-  print(f"Geocoding {latitude}, {longitude}")
-  url = f"https://geocode.maps.co/reverse?lat={latitude}&lon={longitude}&api_key={api_key}"
-  response = requests.get(url)
-  if response.status_code != 200:
-    return None
-  print(f"Geocoded {latitude}, {longitude} to {response.json()}")
-  return response.json()
+def message_timestamp(msg):
+  # epoch seconds a message was received, from its 'timestamp' (seconds or milliseconds)
+  ts = msg.get('timestamp') if isinstance(msg, dict) else None
+  if isinstance(ts, (int, float)) and ts > 0:
+    return ts / 1000 if ts > 100000000000 else float(ts)
+  return None
 
 def filter_dict(d, whitelist):
     """